@@ -0,0 +1,97 @@
+"""
+Time the pieces of cottonwood, and the whole of the runes demo.
+
+To run all the benchmarks:
+
+    python3 -m cottonwood.benchmarks
+
+To run a shorter version, only some of the suites,
+and compare against an earlier run:
+
+    python3 -m cottonwood.benchmarks --quick --only dense optimizers \
+        --compare reports/benchmarks_2021-03-07-09-15-02.json
+
+The results are saved as JSON in the reports directory. When comparing,
+the program exits with an error status if anything got slower
+by more than the threshold, so that it can be used in scripts.
+Timings are only comparable between runs on the same machine,
+under similar load.
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+import cottonwood.benchmarks.macro as macro
+import cottonwood.benchmarks.micro as micro
+import cottonwood.benchmarks.results as results_io
+
+SUITES = {
+    "dense": micro.bench_dense,
+    "activations": micro.bench_activations,
+    "optimizers": micro.bench_optimizers,
+    "initializers": micro.bench_initializers,
+    "data": micro.bench_data_loaders,
+    "printer": micro.bench_printer,
+    "runes_demo": macro.bench_runes_demo,
+}
+
+
+def run(suite_names=None, quick=False):
+    if suite_names is None:
+        suite_names = list(SUITES.keys())
+    results = {}
+    for suite_name in suite_names:
+        print(f"{suite_name}:")
+        for name, result in SUITES[suite_name](quick=quick):
+            results[name] = result
+            print(f"    {name:<64}{1000 * result['median']:>11.3f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python3 -m cottonwood.benchmarks",
+        description="Time cottonwood's layers, activation functions,"
+        + " optimizers, initializers, data loaders, and visualization,"
+        + " and the runes autoencoder demo from end to end.")
+    parser.add_argument(
+        "--quick", action="store_true",
+        help="fewer and smaller cases, for a quick check")
+    parser.add_argument(
+        "--only", nargs="+", choices=list(SUITES.keys()),
+        help="run only these suites")
+    parser.add_argument(
+        "--output",
+        help="where to save the results, by default"
+        + " reports/benchmarks_<date and time>.json")
+    parser.add_argument(
+        "--compare", metavar="BASELINE",
+        help="the results of an earlier run to compare against")
+    parser.add_argument(
+        "--threshold", type=float, default=.1,
+        help="how much slower a case can get, as a fraction,"
+        + " before it counts as a regression (default .1)")
+    args = parser.parse_args()
+
+    results = run(args.only, quick=args.quick)
+
+    output_path = args.output
+    if output_path is None:
+        time_str = dt.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+        output_path = os.path.join("reports", f"benchmarks_{time_str}.json")
+    results_io.save(results, output_path)
+    print(f"Results saved in {output_path}")
+
+    if args.compare is not None:
+        baseline, _ = results_io.load(args.compare)
+        table, regressions = results_io.compare(
+            results, baseline, threshold=args.threshold)
+        print()
+        print(table)
+        if len(regressions) > 0:
+            print(f"\nNumber of cases that got slower: {len(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
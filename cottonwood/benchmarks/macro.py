@@ -0,0 +1,40 @@
+"""
+End-to-end benchmarks: whole training and evaluation runs.
+"""
+import numpy as np
+import cottonwood.data.data_loader_nordic_runes as dat
+from cottonwood.examples.autoencoder.runes_demo import build_autoencoder
+from cottonwood.benchmarks.timing import time_call
+
+SEED = 0
+
+
+def bench_runes_demo(quick=False):
+    """
+    Training and evaluation speed for the autoencoder in the runes demo,
+    without the reports and visualizations. The model's iterations
+    count examples, not batches, so with bigger batches there are
+    fewer forward and backward passes for the same number of iterations.
+    """
+    n_iter = 2000 if quick else 20000
+    n_repeats = 2 if quick else 3
+    for batch_size in (1, 16):
+        np.random.seed(SEED)
+        training_set, evaluation_set = dat.get_data_sets()
+        model = build_autoencoder(
+            training_set, batch_size=batch_size, verbose=False)
+        model.n_iter_train = n_iter
+        model.n_iter_evaluate = n_iter
+
+        name = f"runes demo, batch {batch_size}"
+        for step, data_set in (
+            ("train", training_set),
+            ("evaluate", evaluation_set),
+        ):
+            step_function = getattr(model, step)
+            result = time_call(
+                lambda: step_function(data_set),
+                min_seconds=0,
+                n_repeats=n_repeats)
+            result["examples_per_second"] = n_iter / result["median"]
+            yield f"{name}: {step} {n_iter} examples", result
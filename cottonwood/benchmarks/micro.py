@@ -0,0 +1,217 @@
+"""
+Benchmarks for the individual pieces: layers, activation functions,
+optimizers, initializers, data loaders, and the visualization.
+
+Each benchmark function takes a quick argument, for a shorter run
+with fewer and smaller cases, and yields (case name, timing) pairs.
+The activation functions, optimizers, and initializers are found
+by looking through their modules, so new ones are included
+automatically.
+"""
+import inspect
+import os
+import tempfile
+import types
+import numpy as np
+import cottonwood.core.activation as activation
+import cottonwood.core.initializers as initializers
+from cottonwood.core.layers.dense import Dense
+from cottonwood.core.layers.generic_layer import GenericLayer
+import cottonwood.core.optimizers as optimizers
+import cottonwood.data.data_loader_memmap as data_loader_memmap
+import cottonwood.data.data_loader_nordic_runes as data_loader_nordic_runes
+import cottonwood.data.data_loader_three_by_three as data_loader_three_by_three
+import cottonwood.data.data_loader_two_by_two as data_loader_two_by_two
+from cottonwood.examples.autoencoder.autoencoder_viz import Printer
+from cottonwood.examples.autoencoder.runes_demo import build_autoencoder
+import cottonwood.experimental.initializers as experimental_initializers
+import cottonwood.experimental.optimizers as experimental_optimizers
+from cottonwood.benchmarks.timing import time_call, time_once
+
+# Every case starts from the same random state.
+SEED = 0
+
+
+class Source(GenericLayer):
+    """
+    Stands in for whatever layer feeds the one being timed.
+    """
+    def __init__(self, size):
+        self.previous_layer = None
+        self.size = size
+        self.reset()
+
+
+def find_classes(module, base=object):
+    """
+    All the classes defined in a module that inherit from base,
+    sorted by name.
+    """
+    return [
+        member for _, member in inspect.getmembers(module, inspect.isclass)
+        if member.__module__ == module.__name__
+        and issubclass(member, base)
+        and member is not base
+    ]
+
+
+def bench_dense(quick=False):
+    """
+    A Dense layer's forward and backward passes, for several sizes
+    and batch sizes. The weight update is left out of the backward pass.
+    That's timed separately, in bench_optimizers().
+    """
+    sizes = [(49, 24), (256, 256)]
+    if not quick:
+        sizes.append((1024, 1024))
+    cases = [
+        (m_inputs, n_outputs, batch_size, None)
+        for m_inputs, n_outputs in sizes
+        for batch_size in (1, 16)
+    ]
+    # One case with sparse inputs, where only 2% of them are nonzero
+    cases.append((1024, 256, 16, .02))
+
+    for m_inputs, n_outputs, batch_size, density in cases:
+        np.random.seed(SEED)
+        source = Source(m_inputs)
+        layer = Dense(
+            n_outputs,
+            previous_layer=source,
+            sparse_inputs=density is not None)
+        source.reset(batch_size)
+        layer.reset(batch_size)
+        source.y[:] = np.random.normal(size=(batch_size, m_inputs))
+        if density is not None:
+            source.y[:, np.random.uniform(size=m_inputs) > density] = 0
+        de_dy = np.random.normal(size=(batch_size, n_outputs))
+
+        def forward():
+            layer.reset(batch_size, reuse_buffers=True)
+            layer.forward_pass()
+
+        def backward():
+            layer.de_dy[:] = de_dy
+            layer.backward_pass(update=False)
+
+        name = f"dense {m_inputs}x{n_outputs}, batch {batch_size}"
+        if density is not None:
+            name += f", {density:.0%} of inputs nonzero"
+        yield name + ": forward", time_call(forward)
+        yield name + ": backward", time_call(backward)
+
+
+def bench_activations(quick=False):
+    batch_size = 16
+    n_nodes = 256 if quick else 1024
+    for activation_class in find_classes(activation):
+        np.random.seed(SEED)
+        function = activation_class()
+        v = np.random.normal(size=(batch_size, n_nodes))
+        y = np.zeros_like(v)
+        out = np.zeros_like(v)
+        # calc_d() relies on results saved by the most recent calc().
+        function.calc(v, out=y)
+
+        name = (
+            f"activation {activation_class.__name__},"
+            + f" {batch_size}x{n_nodes}")
+        yield name + ": calc", time_call(lambda: function.calc(v, out=y))
+        yield name + ": calc_d", time_call(
+            lambda: function.calc_d(y, out=out))
+
+
+def bench_optimizers(quick=False):
+    """
+    One update of a 257 x 256 weight matrix, the size of a Dense layer
+    with 256 inputs, plus the bias, and 256 outputs.
+    """
+    n_rows, n_cols = 257, 256
+    optimizer_classes = (
+        find_classes(optimizers, base=optimizers.GenericOptimizer)
+        + find_classes(
+            experimental_optimizers, base=optimizers.GenericOptimizer)
+    )
+    for optimizer_class in optimizer_classes:
+        np.random.seed(SEED)
+        optimizer = optimizer_class()
+        # Anything with weights and de_dw will do in place of a layer.
+        layer = types.SimpleNamespace(
+            weights=np.random.normal(size=(n_rows, n_cols)),
+            de_dw=1e-3 * np.random.normal(size=(n_rows, n_cols)),
+            i_active_rows=None,
+        )
+        yield (
+            f"optimizer {optimizer_class.__name__}, {n_rows}x{n_cols}: update",
+            time_call(lambda: optimizer.update(layer)))
+
+
+def bench_initializers(quick=False):
+    sizes = [(50, 24), (257, 256)]
+    if not quick:
+        sizes.append((1025, 1024))
+    initializer_classes = (
+        find_classes(initializers) + find_classes(experimental_initializers))
+    for initializer_class in initializer_classes:
+        initializer = initializer_class()
+        for n_rows, n_cols in sizes:
+            np.random.seed(SEED)
+            yield (
+                f"initializer {initializer_class.__name__},"
+                + f" {n_rows}x{n_cols}: initialize",
+                time_call(lambda: initializer.initialize(n_rows, n_cols)))
+
+
+def bench_data_loaders(quick=False):
+    loaders = [
+        ("nordic runes", data_loader_nordic_runes),
+        ("two by two", data_loader_two_by_two),
+        ("three by three", data_loader_three_by_three),
+    ]
+    for loader_name, loader in loaders:
+        np.random.seed(SEED)
+        name = f"data {loader_name}"
+        yield name + ": get_data_sets", time_call(loader.get_data_sets)
+        training_set, _ = loader.get_data_sets()
+        yield name + ": next", time_call(lambda: next(training_set))
+        yield name + ": next_batch(16)", time_call(
+            lambda: training_set.next_batch(16))
+
+    # Memory-mapped data, in shards on disk
+    n_examples = 20000 if quick else 200000
+    with tempfile.TemporaryDirectory() as data_dir:
+        np.random.seed(SEED)
+        for i_shard in range(4):
+            np.save(
+                os.path.join(data_dir, f"shard_{i_shard:05d}.npy"),
+                np.random.uniform(
+                    size=(n_examples // 4, 7, 7)).astype(np.float32))
+        training_set, evaluation_set = data_loader_memmap.get_data_sets(
+            data_dir, data_dir)
+        name = f"data memmap, {n_examples} examples"
+        yield name + ": shuffled next_batch(16)", time_call(
+            lambda: training_set.next_batch(16))
+        yield name + ": fixed next_batch(16)", time_call(
+            lambda: evaluation_set.next_batch(16))
+        # Let go of the memory maps before the files are removed.
+        del training_set, evaluation_set
+
+
+def bench_printer(quick=False):
+    """
+    Rendering the autoencoder visualization. The first render builds
+    the figure, and later ones only update it.
+    """
+    np.random.seed(SEED)
+    training_set, _ = data_loader_nordic_runes.get_data_sets()
+    model = build_autoencoder(training_set, verbose=False)
+    example = next(training_set)
+    printer = Printer(input_shape=example.shape)
+    n_repeats = 2 if quick else 5
+    with tempfile.TemporaryDirectory() as savedir:
+        yield "printer: first render", time_once(
+            lambda: printer.render(model, example, savedir, "first"))
+        yield "printer: render", time_call(
+            lambda: printer.render(model, example, savedir, "later"),
+            min_seconds=0,
+            n_repeats=n_repeats)
@@ -0,0 +1,137 @@
+"""
+Save benchmark results as JSON, and compare them against earlier runs.
+
+A results file looks like
+
+    {
+        "format": "cottonwood benchmarks",
+        "version": 1,
+        "metadata": {"python": "3.11.7", "numpy": "1.26.4", ...},
+        "results": {
+            "dense 256x256, batch 16: forward": {
+                "median": 2.1e-05,
+                "min": 2.0e-05,
+                ...
+            },
+            ...
+        }
+    }
+
+with all the times in seconds per call.
+"""
+import datetime as dt
+import json
+import os
+import platform
+import subprocess
+import numpy as np
+
+FORMAT_NAME = "cottonwood benchmarks"
+FORMAT_VERSION = 1
+# Environment variables that change how many threads numpy's
+# linear algebra uses, and so how fast it is.
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+]
+
+
+def get_metadata():
+    """
+    Describe the machine and the code, so that runs can be
+    compared like for like.
+    """
+    metadata = {
+        "time": dt.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "n_cpus": os.cpu_count(),
+        "git_commit": get_git_commit(),
+    }
+    for variable in THREAD_VARIABLES:
+        metadata[variable] = os.environ.get(variable)
+    return metadata
+
+
+def get_git_commit():
+    """
+    The commit the code was checked out at, if it's in a git repository.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results, path, metadata=None):
+    if metadata is None:
+        metadata = get_metadata()
+    dirname = os.path.dirname(path)
+    if dirname != "":
+        os.makedirs(dirname, exist_ok=True)
+    with open(path, "w") as results_file:
+        json.dump({
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "metadata": metadata,
+            "results": results,
+        }, results_file, indent=2)
+
+
+def load(path):
+    """
+    Returns the results and the metadata.
+    """
+    with open(path) as results_file:
+        contents = json.load(results_file)
+    if contents.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} isn't a cottonwood benchmarks file.")
+    return contents["results"], contents["metadata"]
+
+
+def compare(results, baseline, threshold=.1):
+    """
+    Line up new results against a baseline, case by case.
+
+    A case counts as a regression if its median time is more than
+    threshold slower, as a fraction of the baseline time, and as an
+    improvement if it's more than threshold faster.
+
+    Returns a human-readable table, and the names of the cases
+    that regressed.
+    """
+    str_parts = [
+        f"{'case':<64}{'before ms':>11}{'after ms':>11}{'ratio':>8}",
+    ]
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            str_parts.append(f"{name:<64}{'':>11}"
+                             + f"{1000 * result['median']:>11.3f}    new")
+            continue
+        before = baseline[name]["median"]
+        after = result["median"]
+        ratio = after / before if before > 0 else np.inf
+        if ratio > 1 + threshold:
+            flag = "  slower"
+            regressions.append(name)
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        else:
+            flag = ""
+        str_parts.append(
+            f"{name:<64}{1000 * before:>11.3f}{1000 * after:>11.3f}"
+            + f"{ratio:>8.2f}{flag}")
+    n_not_run = len([name for name in baseline if name not in results])
+    if n_not_run > 0:
+        str_parts.append(f"{n_not_run} cases in the baseline weren't run.")
+    return "\n".join(str_parts), regressions
@@ -0,0 +1,61 @@
+import time
+import numpy as np
+
+
+def time_call(function, min_seconds=.1, n_repeats=5):
+    """
+    Find how long function() takes, in seconds per call.
+
+    Like timeit, it first works out how many calls in a row it takes
+    to fill at least min_seconds, so that the timer's resolution
+    doesn't matter. Then it times that many calls, n_repeats times over.
+    The median is the headline number. It isn't thrown off
+    by the occasional hiccup from the operating system.
+
+    The first call is a warm up, and isn't counted.
+    It gets one-time costs, like allocating buffers, out of the way.
+    """
+    function()
+    n_calls = 1
+    while True:
+        n_seconds = time_calls(function, n_calls)
+        if n_seconds >= min_seconds:
+            break
+        # Aim a bit past min_seconds, so that this usually
+        # only has to happen once or twice.
+        n_calls = int(
+            n_calls * min(10, 1.2 * min_seconds / max(n_seconds, 1e-9))) + 1
+
+    seconds_per_call = [
+        time_calls(function, n_calls) / n_calls for _ in range(n_repeats)]
+    return {
+        "median": float(np.median(seconds_per_call)),
+        "min": float(np.min(seconds_per_call)),
+        "max": float(np.max(seconds_per_call)),
+        "n_calls": n_calls,
+        "n_repeats": n_repeats,
+    }
+
+
+def time_calls(function, n_calls):
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        function()
+    return time.perf_counter() - start
+
+
+def time_once(function):
+    """
+    For things that only happen once, like building a figure
+    the first time, there's nothing to repeat.
+    """
+    start = time.perf_counter()
+    function()
+    n_seconds = time.perf_counter() - start
+    return {
+        "median": n_seconds,
+        "min": n_seconds,
+        "max": n_seconds,
+        "n_calls": 1,
+        "n_repeats": 1,
+    }
@@ -1,6 +1,9 @@
 import numpy as np
 
 # All of these need to be able to handle 2D numpy arrays as inputs.
+# calc() and calc_d() both accept an optional out array.
+# When it's provided, the result is written into it rather than
+# into a newly allocated array.
 
 
 class Logistic(object):
@@ -14,12 +17,19 @@ class Logistic(object):
     def __str__():
         return "logistic"
 
-    def calc(self, v):
-        self.calc_fwd = 1 / (1 + np.exp(-v))
+    def calc(self, v, out=None):
+        # 1 / (1 + exp(-v)), one step at a time so it can be done in place.
+        self.calc_fwd = np.negative(v, out=out)
+        np.exp(self.calc_fwd, out=self.calc_fwd)
+        self.calc_fwd += 1
+        np.reciprocal(self.calc_fwd, out=self.calc_fwd)
         return self.calc_fwd
 
-    def calc_d(self, v):
-        return self.calc_fwd * (1 - self.calc_fwd)
+    def calc_d(self, v, out=None):
+        # calc_fwd * (1 - calc_fwd)
+        out = np.subtract(1, self.calc_fwd, out=out)
+        out *= self.calc_fwd
+        return out
 
 
 class Sigmoid(Logistic):
@@ -33,14 +43,15 @@ class ReLU(object):
         return "ReLU"
 
     @staticmethod
-    def calc(v):
-        return np.maximum(0, v)
+    def calc(v, out=None):
+        return np.maximum(0, v, out=out)
 
     @staticmethod
-    def calc_d(v):
-        derivative = np.zeros(v.shape)
-        derivative[np.where(v > 0)] = 1
-        return derivative
+    def calc_d(v, out=None):
+        if out is None:
+            out = np.zeros(v.shape, dtype=v.dtype)
+        np.greater(v, 0, out=out)
+        return out
 
 
 class Tanh(object):
@@ -54,9 +65,12 @@ class Tanh(object):
     def __str__():
         return "hyperbolic tangent"
 
-    def calc(self, v):
-        self.calc_fwd = np.tanh(v)
+    def calc(self, v, out=None):
+        self.calc_fwd = np.tanh(v, out=out)
         return self.calc_fwd
 
-    def calc_d(self, v):
-        return 1 - self.calc_fwd ** 2
+    def calc_d(self, v, out=None):
+        # 1 - calc_fwd ** 2
+        out = np.multiply(self.calc_fwd, self.calc_fwd, out=out)
+        np.subtract(1, out, out=out)
+        return out
@@ -0,0 +1,144 @@
+"""
+Save a model's complete state to a single file and restore it later,
+so that an interrupted training run can pick up exactly where it left off.
+
+The file is an uncompressed .npz archive. Every array gets its own entry,
+named by its path through the model, like
+"layers/1/optimizer/first_moment". Everything else, the settings,
+counters, and layer types, goes into a small JSON header
+stored in the "header" entry.
+
+To use in a script:
+
+    model.save("checkpoint.npz")
+    ...
+    model = build_the_same_model()
+    model.load("checkpoint.npz")
+"""
+import json
+import numpy as np
+
+FORMAT_NAME = "cottonwood checkpoint"
+FORMAT_VERSION = 1
+HEADER_KEY = "header"
+
+
+def save(model, path):
+    """
+    Write the model's state to path, an .npz file.
+    """
+    header, arrays = flatten(get_model_state(model))
+    header["format"] = FORMAT_NAME
+    header["version"] = FORMAT_VERSION
+    arrays[HEADER_KEY] = np.array(json.dumps(header))
+    with open(path, "wb") as checkpoint_file:
+        np.savez(checkpoint_file, **arrays)
+
+
+def load(model, path):
+    """
+    Restore a model's state from a file written by save().
+    The model has to have been built with the same layers.
+    """
+    with np.load(path, allow_pickle=False) as checkpoint:
+        header = json.loads(str(checkpoint[HEADER_KEY]))
+        arrays = {
+            key: checkpoint[key] for key in checkpoint.files
+            if key != HEADER_KEY
+        }
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} isn't a cottonwood checkpoint.")
+
+    layer_types = [type(layer).__name__ for layer in model.layers]
+    if header["layer_types"] != layer_types:
+        raise ValueError(
+            "The checkpoint's layers, " + str(header["layer_types"])
+            + ", don't match the model's layers, " + str(layer_types) + ".")
+    set_model_state(model, unflatten(header, arrays))
+
+
+def get_model_state(model):
+    # With flat parameters, the optimizer state lives in the buffer.
+    # Share it back out to the layers, so that the checkpoint looks
+    # the same either way.
+    if model.parameters is not None:
+        model.parameters.scatter_optimizer_states()
+    keys, position, has_gauss, cached_gaussian = np.random.get_state()[1:]
+    return {
+        "i_iter": model.i_iter,
+        "dtype": model.dtype.str,
+        "error_history": model.error_history.get_state(),
+        "layer_types": [type(layer).__name__ for layer in model.layers],
+        "layers": {
+            str(i_layer): layer.get_state()
+            for i_layer, layer in enumerate(model.layers)
+        },
+        # The random number generator drives data sampling and dropout.
+        # Restoring it makes a resumed run identical to an unbroken one.
+        "random_state": {
+            "keys": keys,
+            "position": position,
+            "has_gauss": has_gauss,
+            "cached_gaussian": cached_gaussian,
+        },
+    }
+
+
+def set_model_state(model, state):
+    model.i_iter = state["i_iter"]
+    model.error_history.set_state(state["error_history"])
+    # Switch to the checkpoint's precision first, so that the restored
+    # arrays aren't converted on their way in.
+    model.dtype = np.dtype(state["dtype"])
+    # A flat parameter buffer gets rebuilt from the restored layers.
+    model.parameters = None
+    for i_layer, layer in enumerate(model.layers):
+        layer.set_dtype(model.dtype)
+        layer.set_state(state["layers"][str(i_layer)])
+    if model.execution_plan is not None:
+        model.compile()
+
+    random_state = state["random_state"]
+    np.random.set_state((
+        "MT19937",
+        random_state["keys"],
+        random_state["position"],
+        random_state["has_gauss"],
+        random_state["cached_gaussian"],
+    ))
+
+
+def flatten(state, path=""):
+    """
+    Split a nested dictionary into two: one that can be written out
+    as JSON, and a flat one holding all of the arrays,
+    keyed by their path through the nested dictionary.
+    """
+    header = {}
+    arrays = {}
+    for key, value in state.items():
+        value_path = path + key
+        if isinstance(value, dict):
+            sub_header, sub_arrays = flatten(value, value_path + "/")
+            header[key] = sub_header
+            arrays.update(sub_arrays)
+        elif isinstance(value, np.ndarray):
+            arrays[value_path] = value
+        elif isinstance(value, np.generic):
+            header[key] = value.item()
+        else:
+            header[key] = value
+    return header, arrays
+
+
+def unflatten(header, arrays):
+    """
+    Put the arrays back into the nested dictionary they came from.
+    """
+    for array_path, value in arrays.items():
+        keys = array_path.split("/")
+        branch = header
+        for key in keys[:-1]:
+            branch = branch.setdefault(key, {})
+        branch[keys[-1]] = value
+    return header
@@ -1,7 +1,11 @@
 import numpy as np
 
-# All of these expect two identically sized numpy arrays as inputs
-# and return the same size error output.
+# All of these expect a numpy array of deviations as input.
+# calc() averages over the last axis, so a single 1D example gives a single
+# error value and a 2D batch of shape (n_examples, n_features)
+# gives one error value per example.
+# calc_d() returns the elementwise derivative, the same size as the input.
+# It accepts an optional out array to write the result into.
 
 
 class Abs(object):
@@ -11,11 +15,11 @@ class Abs(object):
 
     @staticmethod
     def calc(x):
-        return np.mean(np.abs(x))
+        return np.mean(np.abs(x), axis=-1)
 
     @staticmethod
-    def calc_d(x):
-        return np.sign(x)
+    def calc_d(x, out=None):
+        return np.sign(x, out=out)
 
 
 class Sqr(object):
@@ -25,8 +29,8 @@ class Sqr(object):
 
     @staticmethod
     def calc(x):
-        return np.mean(x**2)
+        return np.mean(x**2, axis=-1)
 
     @staticmethod
-    def calc_d(x):
-        return 2 * x
+    def calc_d(x, out=None):
+        return np.multiply(x, 2, out=out)
@@ -0,0 +1,183 @@
+import numpy as np
+
+
+class ErrorHistory(object):
+    """
+    Keep track of the error on every example, without keeping every error.
+
+    Errors are collected into bins of bin_size examples each, and only
+    the mean of each bin is kept. Adding errors takes the same
+    amount of time no matter how long the history is, and the memory
+    it uses grows bin_size times slower than the number of examples.
+
+    A running total of the log errors makes it possible to find the mean
+    log error over any stretch that starts at a mark(). Optionally,
+    the most recent n_recent errors can be kept as they are,
+    in a ring buffer.
+
+    len() of an ErrorHistory is the total number of errors it has seen.
+    """
+    def __init__(self, bin_size=1000, n_recent=0):
+        self.bin_size = int(bin_size)
+        self.n_recent = int(n_recent)
+        self.n_values = 0
+        # The sum of log10(error + 1e-10) over all errors.
+        self.log_total = 0.0
+
+        # The sums of completed bins live at the front of bin_totals.
+        # It doubles in size whenever it fills up.
+        self.bin_totals = np.zeros(16)
+        self.n_bins = 0
+        # The bin currently being filled.
+        self.partial_total = 0.0
+        self.n_partial = 0
+
+        self.recent = np.zeros(self.n_recent)
+        self.i_recent = 0
+
+    def __len__(self):
+        return self.n_values
+
+    def __str__(self):
+        str_parts = [
+            "error history",
+            f"number of errors: {self.n_values}",
+            f"bin size: {self.bin_size}",
+        ]
+        return "\n".join(str_parts)
+
+    def extend(self, errors):
+        """
+        Add an array of errors, one for each example.
+        """
+        errors = np.asarray(errors, dtype=np.float64).ravel()
+        self.n_values += errors.size
+        self.log_total += float(np.sum(np.log10(errors + 1e-10)))
+        self.add_to_recent(errors)
+
+        i_start = 0
+        while i_start < errors.size:
+            i_stop = min(errors.size, i_start + self.bin_size - self.n_partial)
+            self.add_to_bins(
+                float(np.sum(errors[i_start: i_stop])), i_stop - i_start)
+            i_start = i_stop
+
+    def add_to_bins(self, total, count):
+        """
+        Add count errors, with a sum of total, to the bin being filled.
+        count can't be more than it takes to fill the bin.
+        """
+        self.partial_total += total
+        self.n_partial += count
+        if self.n_partial == self.bin_size:
+            if self.n_bins == self.bin_totals.size:
+                self.bin_totals = np.concatenate((
+                    self.bin_totals, np.zeros(self.bin_totals.size)))
+            self.bin_totals[self.n_bins] = self.partial_total
+            self.n_bins += 1
+            self.partial_total = 0.0
+            self.n_partial = 0
+
+    def add_to_recent(self, errors):
+        if self.n_recent == 0:
+            return
+        errors = errors[-self.n_recent:]
+        i_positions = (self.i_recent + np.arange(errors.size)) % self.n_recent
+        self.recent[i_positions] = errors
+        self.i_recent = (self.i_recent + errors.size) % self.n_recent
+
+    def get_bin_means(self):
+        """
+        The mean error of every completed bin, oldest first.
+        """
+        return self.bin_totals[:self.n_bins] / self.bin_size
+
+    def get_recent(self):
+        """
+        The most recent errors, oldest first.
+        There are at most n_recent of them.
+        """
+        n_kept = min(self.n_values, self.n_recent)
+        i_positions = (
+            self.i_recent - n_kept + np.arange(n_kept)) % max(self.n_recent, 1)
+        return self.recent[i_positions]
+
+    def mark(self):
+        """
+        Note where the history is now, to measure from later with
+        mean_log_error().
+        """
+        return (self.n_values, self.log_total)
+
+    def mean_log_error(self, since=None):
+        """
+        The mean of log10(error + 1e-10) over all the errors added
+        since a mark(), or over the whole history if since is None.
+        """
+        n_start, log_start = (0, 0.0) if since is None else since
+        n_values = self.n_values - n_start
+        if n_values == 0:
+            return np.nan
+        return (self.log_total - log_start) / n_values
+
+    def merge(self, histories):
+        """
+        Fold in the histories of several workers that ran side by side.
+        Their bins are added in order of how far along each worker was,
+        and they all need to have the same bin size as this one.
+        The workers' recent errors aren't carried over.
+        """
+        progress = []
+        totals = []
+        counts = []
+        for history in histories:
+            assert history.bin_size == self.bin_size
+            self.n_values += history.n_values
+            self.log_total += history.log_total
+            history_totals = list(history.bin_totals[:history.n_bins])
+            history_counts = [history.bin_size] * history.n_bins
+            if history.n_partial > 0:
+                history_totals.append(history.partial_total)
+                history_counts.append(history.n_partial)
+            n_seen = np.cumsum(history_counts)
+            progress.append(n_seen / max(history.n_values, 1))
+            totals += history_totals
+            counts += history_counts
+
+        for i_bin in np.argsort(np.concatenate(progress), kind="stable"):
+            total = totals[i_bin]
+            count = counts[i_bin]
+            # A worker's bin may straddle two of ours. Split it in
+            # proportion to how many errors go on either side.
+            while count > 0:
+                n_fit = min(count, self.bin_size - self.n_partial)
+                share = total * n_fit / count
+                self.add_to_bins(share, n_fit)
+                total -= share
+                count -= n_fit
+
+    def get_state(self):
+        return {
+            "bin_size": self.bin_size,
+            "n_recent": self.n_recent,
+            "n_values": self.n_values,
+            "log_total": self.log_total,
+            "bin_totals": self.bin_totals[:self.n_bins],
+            "partial_total": self.partial_total,
+            "n_partial": self.n_partial,
+            "recent": self.recent,
+            "i_recent": self.i_recent,
+        }
+
+    def set_state(self, state):
+        self.bin_size = state["bin_size"]
+        self.n_recent = state["n_recent"]
+        self.n_values = state["n_values"]
+        self.log_total = state["log_total"]
+        self.n_bins = state["bin_totals"].size
+        self.bin_totals = np.zeros(max(16, 2 * self.n_bins))
+        self.bin_totals[:self.n_bins] = state["bin_totals"]
+        self.partial_total = state["partial_total"]
+        self.n_partial = state["n_partial"]
+        self.recent = np.array(state["recent"], dtype=np.float64)
+        self.i_recent = state["i_recent"]
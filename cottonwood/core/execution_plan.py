@@ -0,0 +1,111 @@
+class ExecutionPlan(object):
+    """
+    A fixed schedule for running the layers of a model,
+    worked out once from the connections between them.
+
+    Layers are connected by references to the layers they read from,
+    which they report through get_input_layers(). The list of layers
+    has to be in topological order, with every layer coming after all
+    the layers it reads from.
+    """
+    def __init__(self, layers):
+        self.n_layers = len(layers)
+        i_layer_by_id = {id(layer): i for i, layer in enumerate(layers)}
+
+        # For each layer, the indices of the layers it reads from.
+        self.inputs = []
+        for i_layer, layer in enumerate(layers):
+            i_inputs = []
+            for input_layer in get_input_layers(layer):
+                i_input = i_layer_by_id.get(id(input_layer))
+                if i_input is None:
+                    raise ValueError(
+                        f"Layer {i_layer} reads from a layer"
+                        + " that isn't part of the model.")
+                if i_input >= i_layer:
+                    raise ValueError(
+                        f"Layer {i_layer} reads from layer {i_input}."
+                        + " Layers need to be listed in an order where each"
+                        + " one comes after all the layers it reads from.")
+                i_inputs.append(i_input)
+            self.inputs.append(i_inputs)
+
+        # A layer needs to pass gradients back if it has parameters
+        # to learn or if any of the layers upstream of it do.
+        self.needs_gradient = []
+        for i_layer, layer in enumerate(layers):
+            self.needs_gradient.append(
+                getattr(layer, "trainable", True)
+                or any(self.needs_gradient[i] for i in self.inputs[i_layer]))
+
+        # The backward pass only visits the layers that contribute
+        # to the output and need the gradient.
+        i_contributors = self.find_contributors(0, self.n_layers)
+        self.backward_schedule = [
+            i_layer for i_layer in reversed(i_contributors)
+            if self.needs_gradient[i_layer]
+        ]
+
+        self.forward_schedules = {}
+
+    def __str__(self):
+        str_parts = ["execution plan"]
+        for i_layer in range(self.n_layers):
+            str_parts.append(
+                f"layer {i_layer}: reads from {self.inputs[i_layer]},"
+                + f" needs gradient: {self.needs_gradient[i_layer]}")
+        return "\n".join(str_parts)
+
+    def find_contributors(self, i_start_layer, i_stop_layer):
+        """
+        Find all the layers from i_start_layer up to, but not including,
+        i_stop_layer that feed into the output of layer i_stop_layer - 1.
+        """
+        i_contributors = set([i_stop_layer - 1])
+        i_to_visit = [i_stop_layer - 1]
+        while len(i_to_visit) > 0:
+            for i_input in self.inputs[i_to_visit.pop()]:
+                if i_input >= i_start_layer and i_input not in i_contributors:
+                    i_contributors.add(i_input)
+                    i_to_visit.append(i_input)
+        return sorted(i_contributors)
+
+    def get_forward_schedule(self, i_start_layer, i_stop_layer):
+        """
+        Which layers need to be reset, and which need to run,
+        to get the output of layer i_stop_layer - 1 when the inputs
+        are injected at layer i_start_layer?
+
+        Returns two lists of layer indices, i_reset and i_run.
+        The start layer is always reset, since it receives the inputs.
+        Layers upstream of i_start_layer that feed into the pass are
+        reset, but don't run, so that they contribute zeros.
+        Schedules are worked out once for each range and then reused.
+        """
+        key = (i_start_layer, i_stop_layer)
+        schedule = self.forward_schedules.get(key)
+        if schedule is None:
+            i_run = self.find_contributors(i_start_layer, i_stop_layer)
+            i_upstream = set([i_start_layer])
+            for i_layer in i_run:
+                for i_input in self.inputs[i_layer]:
+                    if i_input < i_start_layer:
+                        i_upstream.add(i_input)
+            i_reset = sorted(i_upstream.union(i_run))
+            schedule = (i_reset, i_run)
+            self.forward_schedules[key] = schedule
+        return schedule
+
+
+def get_input_layers(layer):
+    """
+    Which layers does this layer read from?
+    Layers can report this for themselves. For those that don't,
+    fall back to previous_layer.
+    """
+    if hasattr(layer, "get_input_layers"):
+        return layer.get_input_layers()
+    previous_layer = getattr(layer, "previous_layer", None)
+    if previous_layer is None:
+        return []
+    return [previous_layer]
@@ -0,0 +1,138 @@
+"""
+Compare sets of hyperparameters by training a fresh model for each,
+several times over, spread across a pool of processes.
+
+To use in a script:
+
+    import cottonwood.core.hyperparameters as hp
+
+    def create_model(config, verbose=True):
+        # Build an ANN using the hyperparameter values in config,
+        # passing verbose along to it.
+        ...
+        return model, training_set, tuning_set
+
+    configs = hp.make_grid({
+        "learning_rate": [1e-4, 1e-3, 1e-2],
+        "n_nodes": [12, 24],
+    })
+    results = hp.evaluate_hyperparameters(create_model, configs)
+    for config, median_error, worst_error in results:
+        print(config, median_error, worst_error)
+
+create_model has to be a module-level function so that it can be
+sent to the worker processes. It's called with verbose=False, and has
+to pass that along to the ANN. Otherwise every model would create
+a reports directory named for the second it was made in, and runs
+started in the same second would write over each other's reports.
+"""
+import datetime as dt
+import itertools
+import multiprocessing as mp
+import numpy as np
+
+
+def make_grid(values_by_name):
+    """
+    Turn a dictionary of lists of values into a list of configs,
+    one for every combination.
+    """
+    names = list(values_by_name.keys())
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*values_by_name.values())
+    ]
+
+
+def summarize(error_means):
+    """
+    Reduce the results of several runs to their median and worst values.
+    """
+    error_means = sorted(error_means)
+    return np.median(error_means), error_means[-1]
+
+
+def evaluate_hyperparameters(
+    create_model,
+    configs,
+    n_repeats=5,
+    n_processes=None,
+    verbose=True,
+):
+    """
+    create_model: function
+        Takes a config and a verbose keyword argument, and returns
+        a tuple of (model, training_set, tuning_set) built from them.
+        It's called anew for every run, so every run starts fresh.
+    configs: list of dicts, or dict of lists
+        The hyperparameter sets to compare. A dict of lists is
+        expanded into a grid with make_grid().
+    n_repeats: int
+        How many times to train and evaluate each config.
+    n_processes: int
+        Defaults to the number of CPUs. With 1, everything runs
+        in this process, one run after another.
+
+    Returns a list of (config, median, worst) tuples in the same order
+    as configs. median and worst summarize the mean log errors
+    on the tuning set across the repeats.
+    """
+    if isinstance(configs, dict):
+        configs = make_grid(configs)
+    # Each (config, repeat) pair gets its own random seed.
+    seeds = np.random.randint(2 ** 31, size=(len(configs), n_repeats))
+    trials = [
+        (create_model, i_config, config, seeds[i_config, i_repeat])
+        for i_config, config in enumerate(configs)
+        for i_repeat in range(n_repeats)
+    ]
+
+    error_means = [[] for _ in configs]
+    if n_processes == 1:
+        trial_results = map(run_trial, trials)
+        pool = None
+    else:
+        pool = mp.Pool(n_processes)
+        trial_results = pool.imap_unordered(run_trial, trials)
+    try:
+        for i_trial, (i_config, error_mean) in enumerate(trial_results):
+            error_means[i_config].append(error_mean)
+            if verbose:
+                time_str = dt.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+                print(
+                    f"Finished hyperparameter evaluation run {i_trial + 1}"
+                    + f" of {len(trials)} at {time_str}")
+    except BaseException:
+        # If one trial fails, don't wait for all the rest to finish.
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        raise
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    results = []
+    for config, config_error_means in zip(configs, error_means):
+        median_error, worst_error = summarize(config_error_means)
+        results.append((config, median_error, worst_error))
+    return results
+
+
+def run_trial(trial):
+    """
+    Build a fresh model for one config, train it, and evaluate it.
+    """
+    create_model, i_config, config, seed = trial
+    np.random.seed(seed)
+    # Many runs at once would all be writing to the same reports,
+    # so the model is built without any.
+    model, training_set, tuning_set = create_model(config, verbose=False)
+    if model.verbose:
+        raise ValueError(
+            "create_model() needs to pass its verbose argument"
+            + " along to the ANN it builds.")
+    model.train(training_set)
+    start = model.error_history.mark()
+    model.evaluate(tuning_set)
+    return i_config, model.error_history.mean_log_error(start)
@@ -0,0 +1,226 @@
+"""
+A trained model, stripped down to just what it needs to make predictions.
+
+To use in a script:
+
+    frozen_model = model.freeze()
+    predictions = frozen_model.predict(examples)
+
+A frozen model keeps a copy of the weights and activation functions,
+and nothing else: no gradients, no optimizers, no regularizers,
+no dropout. It doesn't change when the original model keeps training,
+and it can be pickled and sent to another process for serving.
+refresh() brings it back up to date with the model, copying the
+weights into the arrays it already has.
+
+Each layer type knows how to freeze itself. Its freeze() method
+returns a step, an object with a calc() method that takes the outputs
+of the layers it reads from and returns its own output.
+calc() never modifies its inputs, since other steps may read them too.
+"""
+import copy
+import numpy as np
+import cottonwood.core.toolbox as tb
+
+
+class FrozenANN(object):
+    def __init__(self, model):
+        if model.execution_plan is None:
+            model.compile()
+        self.execution_plan = model.execution_plan
+        self.dtype = model.dtype
+        self.steps = [layer.freeze() for layer in model.layers]
+        self.n_outputs = [layer.y.shape[-1] for layer in model.layers]
+        self.schedules = {}
+
+    def refresh(self, model):
+        """
+        Catch up with the model, which has kept training since
+        it was frozen, reusing the steps' arrays where possible.
+        The model needs to still have the same layers.
+        """
+        self.steps = [
+            layer.refreeze(step)
+            for layer, step in zip(model.layers, self.steps)
+        ]
+        self.n_outputs = [layer.y.shape[-1] for layer in model.layers]
+
+    def __str__(self):
+        str_parts = [
+            "frozen model",
+            "precision: " + str(self.dtype),
+        ]
+        for step in self.steps:
+            str_parts.append("step:" + tb.indent(step.__str__()))
+        return "\n".join(str_parts)
+
+    def predict(self, x, i_start_layer=None, i_stop_layer=None):
+        """
+        x: array
+            Either a single example, as a 1D array, or a batch of them,
+            as a 2D array of shape (n_examples, n_features).
+            The result has the same form: 1D for a single example,
+            2D for a batch.
+        i_start_layer, i_stop_layer: int
+            Which layers to include, with the same meaning as in
+            ANN.forward_pass(). x goes in at layer i_start_layer, and
+            the output of layer i_stop_layer - 1 comes out.
+            Layers before i_start_layer contribute zeros.
+        """
+        if i_start_layer is None:
+            i_start_layer = 0
+        if i_stop_layer is None:
+            i_stop_layer = len(self.steps)
+        if i_start_layer >= i_stop_layer:
+            return x
+
+        x = np.asarray(x, dtype=self.dtype)
+        is_batch = x.ndim > 1
+        if is_batch:
+            x = x.reshape(x.shape[0], -1)
+        else:
+            x = x.ravel()[np.newaxis, :]
+
+        i_run, i_release = self.get_schedule(i_start_layer, i_stop_layer)
+        outputs = [None] * len(self.steps)
+        for i_layer in i_run:
+            if i_layer == i_start_layer:
+                # The examples come in here. Anything this layer reads
+                # from is upstream of the pass, and would only add zeros.
+                step_inputs = [x]
+            else:
+                step_inputs = [
+                    self.get_output(outputs, i_input, x.shape[0])
+                    for i_input in self.execution_plan.inputs[i_layer]
+                ]
+            outputs[i_layer] = self.steps[i_layer].calc(*step_inputs)
+            for i_done in i_release[i_layer]:
+                outputs[i_done] = None
+
+        y = outputs[i_stop_layer - 1]
+        if is_batch:
+            return y
+        return y.ravel()
+
+    def get_output(self, outputs, i_layer, n_examples):
+        """
+        Layers that didn't run, because they're upstream of
+        the start layer, have an output of all zeros.
+        """
+        if outputs[i_layer] is None:
+            return np.zeros(
+                (n_examples, self.n_outputs[i_layer]), dtype=self.dtype)
+        return outputs[i_layer]
+
+    def get_schedule(self, i_start_layer, i_stop_layer):
+        """
+        Which layers need to run, and after each one, which layers'
+        outputs are no longer needed?
+        These are worked out once for each range and then reused.
+        """
+        key = (i_start_layer, i_stop_layer)
+        schedule = self.schedules.get(key)
+        if schedule is None:
+            # Only the layers that feed into the output need to run.
+            i_run = self.execution_plan.find_contributors(
+                i_start_layer, i_stop_layer)
+            # As soon as nothing else reads a layer's output, let it go.
+            i_last_reader = {}
+            for i_layer in i_run:
+                for i_input in self.execution_plan.inputs[i_layer]:
+                    i_last_reader[i_input] = i_layer
+            i_release = [[] for _ in self.steps]
+            for i_layer, i_reader in i_last_reader.items():
+                i_release[i_reader].append(i_layer)
+            schedule = (i_run, i_release)
+            self.schedules[key] = schedule
+        return schedule
+
+
+class Passthrough(object):
+    """
+    Pass the inputs along unchanged. If there are several,
+    add them together.
+    """
+    @staticmethod
+    def __str__():
+        return "passthrough"
+
+    @staticmethod
+    def calc(*inputs):
+        if len(inputs) == 1:
+            return inputs[0]
+        return sum(inputs[1:], inputs[0])
+
+
+class FrozenDense(object):
+    def __init__(self, weights, activation_function):
+        self.weights = None
+        self.bias = None
+        self.set_weights(weights)
+        # The activation functions may cache results between calls.
+        # Give the frozen step its own.
+        self.activation_function = copy.copy(activation_function)
+
+    def __str__(self):
+        str_parts = [
+            "fully connected",
+            f"number of inputs: {self.weights.shape[0]}",
+            f"number of outputs: {self.weights.shape[1]}",
+            "activation function:" + tb.indent(
+                self.activation_function.__str__()),
+        ]
+        return "\n".join(str_parts)
+
+    def set_weights(self, weights):
+        """
+        Take a copy of weights, bias row and all, writing over
+        the old copy if they're the same size.
+        """
+        # Split the bias off from the rest of the weights,
+        # so that it can be added on directly instead of through
+        # an extra column of ones in the inputs.
+        if (
+            self.weights is None
+            or self.weights.shape[0] != weights.shape[0] - 1
+            or self.weights.shape[1] != weights.shape[1]
+            or self.weights.dtype != weights.dtype
+        ):
+            self.weights = np.array(weights[:-1, :])
+            self.bias = np.array(weights[-1, :])
+        else:
+            np.copyto(self.weights, weights[:-1, :])
+            np.copyto(self.bias, weights[-1, :])
+
+    def calc(self, *inputs):
+        x = Passthrough.calc(*inputs)
+        # v = x @ weights + bias, then y = f(v), reusing v's memory.
+        v = np.matmul(x, self.weights)
+        v += self.bias
+        return self.activation_function.calc(v, out=v)
+
+
+class FrozenDifference(object):
+    @staticmethod
+    def __str__():
+        return "difference"
+
+    @staticmethod
+    def calc(x, subtract_me):
+        return x - subtract_me
+
+
+class FrozenRangeNormalization(object):
+    def __init__(self, offset_factor, scale_factor):
+        self.offset_factor = offset_factor
+        self.scale_factor = scale_factor
+
+    def __str__(self):
+        return "range normalization"
+
+    def calc(self, *inputs):
+        # y = (x - offset_factor) / scale_factor - .5
+        y = np.subtract(Passthrough.calc(*inputs), self.offset_factor)
+        y /= self.scale_factor
+        y -= .5
+        return y
@@ -1,5 +1,8 @@
 import numpy as np
 
+# All of these take an optional dtype, the floating point precision
+# of the weights they return.
+
 
 class Glorot(object):
     """
@@ -15,11 +18,11 @@ class Glorot(object):
         return "Glorot"
 
     @staticmethod
-    def initialize(n_rows, n_cols):
+    def initialize(n_rows, n_cols, dtype=np.float64):
         return np.random.normal(
             scale=np.sqrt(2 / (n_rows + n_cols)),
             size=(n_rows, n_cols),
-        )
+        ).astype(dtype, copy=False)
 
 
 class He(object):
@@ -37,12 +40,12 @@ class He(object):
         return "He"
 
     @staticmethod
-    def initialize(n_rows, n_cols):
+    def initialize(n_rows, n_cols, dtype=np.float64):
         return np.random.uniform(
             low=-np.sqrt(6 / n_rows),
             high=np.sqrt(6 / n_rows),
             size=(n_rows, n_cols),
-        )
+        ).astype(dtype, copy=False)
 
 
 class LSUV(object):
@@ -69,7 +72,7 @@ class LSUV(object):
     def __str__():
         return "LSUV"
 
-    def initialize(self, n_rows, n_cols):
+    def initialize(self, n_rows, n_cols, dtype=np.float64):
         # Step 1: Generate a weight matrix that is orthonormal.
         # It's guaranteed to generate outputs that are independent
         # of each other. This from Saxe et al.
@@ -84,4 +87,5 @@ class LSUV(object):
             scale=self.input_stddev,
             size=(1, n_rows))
         output_values = input_values @ weights
-        return weights / np.std(output_values)
+        weights = weights / np.std(output_values)
+        return weights.astype(dtype, copy=False)
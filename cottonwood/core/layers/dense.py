@@ -1,12 +1,20 @@
 import numpy as np
 from cottonwood.core.activation import Tanh
+from cottonwood.core.inference import FrozenDense
 from cottonwood.core.initializers import LSUV
 from cottonwood.core.layers.generic_layer import GenericLayer
 from cottonwood.core.optimizers import SGD
 import cottonwood.core.toolbox as tb
 
+AUTO = "auto"
+
 
 class Dense(GenericLayer):
+    trainable = True
+    # With sparse_inputs="auto", batches where no more than this
+    # fraction of the inputs are nonzero take the sparse path.
+    max_sparse_density = .25
+
     def __init__(
         self,
         n_outputs,
@@ -16,15 +24,31 @@ class Dense(GenericLayer):
         initializer=None,
         previous_layer=None,
         optimizer=None,
+        sparse_inputs=False,
     ):
+        """
+        sparse_inputs: boolean or "auto"
+            If True, only the weights connected to nonzero inputs
+            are used to find the outputs and the weight gradient.
+            That saves a lot of computation when most of the inputs
+            are zero, as they are for binary images or after a Sparsify
+            or ReLU layer.
+            If "auto", check each batch for how many inputs are nonzero,
+            and take the sparse path when it's a small enough fraction.
+        """
         self.previous_layer = previous_layer
         if m_inputs is not None:
             self.m_inputs = m_inputs
         else:
-            self.m_inputs = self.previous_layer.y.size
+            self.m_inputs = self.previous_layer.y.shape[-1]
         self.n_outputs = int(n_outputs)
         self.activation_function = activation_function
         self.dropout_rate = dropout_rate
+        if sparse_inputs not in (False, True, AUTO):
+            raise ValueError(
+                f"sparse_inputs needs to be True, False, or '{AUTO}',"
+                + f" not {sparse_inputs}.")
+        self.sparse_inputs = sparse_inputs
 
         if activation_function is None:
             self.activation_function = Tanh()
@@ -45,7 +69,7 @@ class Dense(GenericLayer):
         # Inputs match to rows. Outputs match to columns.
         # Add one to m_inputs to account for the bias term.
         self.weights = self.initializer.initialize(
-            self.m_inputs + 1, self.n_outputs)
+            self.m_inputs + 1, self.n_outputs, dtype=self.dtype)
 
         self.reset()
         self.regularizers = []
@@ -62,6 +86,7 @@ class Dense(GenericLayer):
                 self.activation_function.__str__()),
             "initialization:" + tb.indent(self.initializer.__str__()),
             "optimizer:" + tb.indent(self.optimizer.__str__()),
+            f"sparse inputs: {self.sparse_inputs}",
         ]
         for regularizer in self.regularizers:
             str_parts.append(
@@ -71,11 +96,87 @@ class Dense(GenericLayer):
     def add_regularizer(self, new_regularizer):
         self.regularizers.append(new_regularizer)
 
-    def reset(self):
-        self.x = np.zeros((1, self.m_inputs))
-        self.y = np.zeros((1, self.n_outputs))
-        self.de_dx = np.zeros((1, self.m_inputs))
-        self.de_dy = np.zeros((1, self.n_outputs))
+    def reset(self, n_examples=1, reuse_buffers=False):
+        """
+        Get ready for a new pass.
+        All the arrays have one row for each example in the batch.
+
+        reuse_buffers: boolean
+            If True, and the batch is the same size as last time,
+            zero out the existing arrays rather than allocating new ones.
+        """
+        if reuse_buffers and self.x.shape[0] == n_examples:
+            self.x.fill(0)
+            self.y.fill(0)
+            self.de_dy.fill(0)
+            return
+
+        self.x = np.zeros((n_examples, self.m_inputs), dtype=self.dtype)
+        self.y = np.zeros((n_examples, self.n_outputs), dtype=self.dtype)
+        self.de_dx = np.zeros((n_examples, self.m_inputs), dtype=self.dtype)
+        self.de_dy = np.zeros((n_examples, self.n_outputs), dtype=self.dtype)
+
+        # x_w_bias holds a copy of the inputs plus an extra column
+        # of ones for the bias term. The column of ones stays put,
+        # so the bias never has to be concatenated on.
+        self.x_w_bias = np.ones(
+            (n_examples, self.m_inputs + 1), dtype=self.dtype)
+        self.v = np.zeros((n_examples, self.n_outputs), dtype=self.dtype)
+        self.de_dv = np.zeros((n_examples, self.n_outputs), dtype=self.dtype)
+        # de_dw is kept if it can be, since it may be a view into
+        # a flat parameter buffer. See cottonwood/core/parameter_buffer.py.
+        if (
+            getattr(self, "de_dw", None) is None
+            or self.de_dw.shape != self.weights.shape
+            or self.de_dw.dtype != self.dtype
+        ):
+            self.de_dw = np.zeros(self.weights.shape, dtype=self.dtype)
+
+        # The rows of the weights that connect to nonzero inputs,
+        # plus the bias row, when the sparse path is taken.
+        # None means all of them.
+        self.i_active_rows = None
+        # The rows of de_dw that might be nonzero. None means all of them.
+        self.i_gradient_rows = None
+
+    def set_dtype(self, dtype):
+        """
+        Switch to a different floating point precision,
+        like np.float32 or np.float64.
+        The weights and the optimizer's internal state are converted too.
+        """
+        self.weights = self.weights.astype(dtype, copy=False)
+        self.optimizer.set_dtype(dtype)
+        super().set_dtype(dtype)
+
+    def get_state(self):
+        return {
+            "weights": self.weights,
+            "dropout_rate": self.dropout_rate,
+            "optimizer": self.optimizer.get_state(),
+            "regularizers": {
+                str(i_regularizer): regularizer.get_state()
+                for i_regularizer, regularizer in enumerate(self.regularizers)
+            },
+        }
+
+    def set_state(self, state):
+        # Copy into the existing weights array, in case
+        # anything else is holding on to it.
+        np.copyto(self.weights, state["weights"])
+        self.dropout_rate = state["dropout_rate"]
+        self.optimizer.set_state(state["optimizer"])
+        for i_regularizer, regularizer in enumerate(self.regularizers):
+            regularizer.set_state(state["regularizers"][str(i_regularizer)])
+
+    def freeze(self):
+        self.optimizer.catch_up(self)
+        return FrozenDense(self.weights, self.activation_function)
+
+    def refreeze(self, step):
+        self.optimizer.catch_up(self)
+        step.set_weights(self.weights)
+        return step
 
     def forward_pass(self, evaluating=False, **kwargs):
         """
@@ -92,50 +193,118 @@ class Dense(GenericLayer):
         else:
             dropout_rate = self.dropout_rate
 
+        # Each example in the batch gets its own dropout pattern.
         if dropout_rate > 0:
-            self.i_dropout = np.zeros(self.x.size, dtype=bool)
-            self.i_dropout[np.where(
-                np.random.uniform(size=self.x.size) < dropout_rate)] = True
-            self.x[:, self.i_dropout] = 0
-            self.x[:, np.logical_not(self.i_dropout)] *= 1 / (1 - dropout_rate)
+            self.i_dropout = (
+                np.random.uniform(size=self.x.shape) < dropout_rate)
+            self.x[self.i_dropout] = 0
+            self.x *= 1 / (1 - dropout_rate)
         else:
             self.i_dropout = None
 
-        bias = np.ones((1, 1))
-        x_w_bias = np.concatenate((self.x, bias), axis=1)
-        v = x_w_bias @ self.weights
-        self.y = self.activation_function.calc(v)
+        i_active_inputs = None
+        if self.sparse_inputs:
+            i_active_inputs = np.flatnonzero(np.any(self.x, axis=0))
+            if self.sparse_inputs == AUTO and (
+                i_active_inputs.size > self.max_sparse_density * self.m_inputs
+            ):
+                i_active_inputs = None
+
+        if i_active_inputs is None:
+            self.i_active_rows = None
+            # A lazy optimizer may have left some of the weights
+            # out of date, and they're all about to be used.
+            if self.optimizer.stale_weights:
+                self.optimizer.catch_up(self)
+            # v = x_w_bias @ weights
+            np.copyto(self.x_w_bias[:, :-1], self.x)
+            np.matmul(self.x_w_bias, self.weights, out=self.v)
+        else:
+            # The inputs that are zero for every example in the batch
+            # don't contribute anything. Gather just the rows of the
+            # weights for the others, and add the bias row separately.
+            # v = x_active @ weights_active + bias
+            self.i_active_rows = np.append(i_active_inputs, self.m_inputs)
+            # A lazy optimizer may have left these rows behind.
+            self.optimizer.catch_up(self, self.i_active_rows)
+            self.x_active = self.x[:, i_active_inputs]
+            np.matmul(
+                self.x_active, self.weights[i_active_inputs, :], out=self.v)
+            self.v += self.weights[-1, :]
+
+        self.y = self.activation_function.calc(self.v, out=self.y)
 
-    def backward_pass(self):
+    def backward_pass(self, update=True, **kwargs):
         """
         Propagate the outputs back through the layer.
+
+        The weight gradient is averaged over all the examples in the batch,
+        so that one step on a batch of n examples is the same as
+        a minibatch of n single-example steps.
+
+        update: boolean
+            If False, calculate de_dw but leave the weights alone.
+            update_weights() can apply it later.
         """
-        bias = np.ones((1, 1))
-        x_w_bias = np.concatenate((self.x, bias), axis=1)
+        n_examples = self.x.shape[0]
+
+        # de_dv = de_dy * dy_dv
+        self.activation_function.calc_d(self.y, out=self.de_dv)
+        self.de_dv *= self.de_dy
+
+        if self.i_active_rows is None:
+            # v = x_w_bias @ weights, so dv_dw is x_w_bias transposed.
+            # One matrix multiply sums the gradient over the whole batch.
+            np.matmul(self.x_w_bias.transpose(), self.de_dv, out=self.de_dw)
+            self.de_dw /= n_examples
+            self.i_gradient_rows = None
+        else:
+            # The gradient is zero for the rows of inactive inputs.
+            # Clear out whatever the last pass left there, and fill in
+            # just the active rows.
+            if self.i_gradient_rows is None:
+                self.de_dw.fill(0)
+            else:
+                self.de_dw[self.i_gradient_rows, :] = 0
+            i_active_inputs = self.i_active_rows[:-1]
+            self.de_dw[i_active_inputs, :] = (
+                self.x_active.transpose() @ self.de_dv)
+            self.de_dw[-1, :] = np.sum(self.de_dv, axis=0)
+            self.de_dw[self.i_active_rows, :] /= n_examples
+            self.i_gradient_rows = self.i_active_rows
+
+        # dv_dx is the transpose of the weights.
+        # Leave out the bias row. There's no need to find the gradient
+        # with respect to the bias node.
+        # This uses the same weights as the forward pass did,
+        # before they get updated.
+        np.matmul(
+            self.de_dv, self.weights[:-1, :].transpose(), out=self.de_dx)
+
+        # Remove the dropped-out inputs from this run.
+        if self.i_dropout is not None:
+            self.de_dx[self.i_dropout] = 0
 
-        dy_dv = self.activation_function.calc_d(self.y)
-        # v = self.x @ self.weights
-        dv_dw = x_w_bias.transpose()
-        dv_dx = self.weights.transpose()
+        self.previous_layer.de_dy += self.de_dx
 
-        dy_dw = dv_dw @ dy_dv
-        self.de_dw = self.de_dy * dy_dw
+        if update:
+            self.update_weights()
 
+    def update_weights(self):
+        """
+        Adjust the weights based on de_dw, with regularization.
+
+        If i_active_rows isn't None, all the other rows of de_dw are zero,
+        and the optimizer is free to skip them. Anything that
+        makes them nonzero, like a regularizer or averaging gradients
+        from several workers, needs to set i_active_rows to None.
+        """
         for regularizer in self.regularizers:
             regularizer.pre_optim_update(self)
+        if self.i_active_rows is None:
+            self.i_gradient_rows = None
 
         self.optimizer.update(self)
 
         for regularizer in self.regularizers:
             regularizer.post_optim_update(self)
-
-        self.de_dx = (self.de_dy * dy_dv) @ dv_dx
-
-        # Remove the dropped-out inputs from this run.
-        de_dx_no_bias = self.de_dx[:, :-1]
-
-        if self.i_dropout is not None:
-            de_dx_no_bias[:, self.i_dropout] = 0
-
-        # Remove the bias node from the gradient vector.
-        self.previous_layer.de_dy += de_dx_no_bias
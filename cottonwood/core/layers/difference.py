@@ -1,3 +1,5 @@
+import numpy as np
+from cottonwood.core.inference import FrozenDifference
 from cottonwood.core.layers.generic_layer import GenericLayer
 
 
@@ -12,16 +14,25 @@ class Difference(GenericLayer):
     def __init__(self, previous_layer, subtract_me_layer):
         self.previous_layer = previous_layer
         self.subtract_me_layer = subtract_me_layer
-        assert self.subtract_me_layer.y.size == self.previous_layer.y.size
+        assert (self.subtract_me_layer.y.shape[-1]
+                == self.previous_layer.y.shape[-1])
 
-        self.size = self.previous_layer.y.size
+        self.size = self.previous_layer.y.shape[-1]
+        self.reset()
 
     def __str__(self):
         return "difference"
 
+    def get_input_layers(self):
+        return [self.previous_layer, self.subtract_me_layer]
+
+    def freeze(self):
+        return FrozenDifference()
+
     def forward_pass(self, **kwargs):
-        self.y = self.previous_layer.y - self.subtract_me_layer.y
+        np.subtract(
+            self.previous_layer.y, self.subtract_me_layer.y, out=self.y)
 
-    def backward_pass(self):
+    def backward_pass(self, **kwargs):
         self.previous_layer.de_dy += self.de_dy
         self.subtract_me_layer.de_dy -= self.de_dy
@@ -0,0 +1,356 @@
+import hashlib
+import os
+import numpy as np
+from cottonwood.core.inference import Passthrough
+from cottonwood.core.layers.generic_layer import GenericLayer
+
+RANGE = "range"
+STANDARD = "standard"
+# How many examples from each stored array go into its fingerprint
+N_FINGERPRINT_SAMPLES = 16
+
+
+class FeatureNormalization(GenericLayer):
+    """
+    Transform the input/output values so that each feature
+    falls in a similar range.
+
+    method: str
+        "range": shift and scale each feature so that it falls
+            between -.5 and .5, based on its minimum and maximum.
+        "standard": shift and scale each feature so that it has
+            a mean of 0 and a standard deviation of 1.
+    n_examples: int
+        How many examples to gather statistics from.
+        The default is all of them for a Dataset or MemmapDataset,
+        and 10,000 for a generator.
+    chunk_size: int
+        The statistics are gathered this many examples at a time.
+    update_during_training: boolean
+        If True, keep refining the statistics with each training batch.
+    cache_path: str
+        If given, the statistics are saved to this file after
+        they're gathered. If the file already exists, they're
+        read from it instead, skipping the scan through the data.
+        The file also holds a fingerprint of the data the statistics
+        came from. If it doesn't match training_data and n_examples,
+        a ValueError is raised, rather than normalizing with another
+        data set's statistics. A generator can't be fingerprinted
+        without using up examples, so for those only n_examples
+        is checked. The number of features is also checked against
+        the outputs of previous_layer, when there is one.
+
+    The statistics of a Dataset or a MemmapDataset are gathered
+    straight from its stored examples, so drawing from it afterward
+    goes on just as if they'd never been gathered.
+    Statistics from a generator use up examples from it.
+    """
+    def __init__(
+        self,
+        training_data,
+        method=RANGE,
+        n_examples=None,
+        chunk_size=1000,
+        update_during_training=False,
+        cache_path=None,
+        previous_layer=None,
+    ):
+        self.previous_layer = previous_layer
+        if method not in (RANGE, STANDARD):
+            raise ValueError(
+                f"method needs to be either '{RANGE}' or '{STANDARD}',"
+                + f" not '{method}'.")
+        self.method = method
+        self.update_during_training = update_during_training
+        self.cache_path = cache_path
+
+        fingerprint = find_fingerprint(training_data, n_examples)
+        if cache_path is not None and os.path.exists(cache_path):
+            self.statistics, cached_fingerprint = FeatureStatistics.load(
+                cache_path)
+            if cached_fingerprint != fingerprint:
+                raise ValueError(
+                    f"The statistics cached in {cache_path} came from"
+                    + f" different data: {cached_fingerprint},"
+                    + f" rather than {fingerprint}."
+                    + " Delete the file, or choose another cache_path,"
+                    + " to gather them again.")
+        else:
+            self.statistics = FeatureStatistics()
+            for chunk in get_chunks(training_data, n_examples, chunk_size):
+                self.statistics.update(chunk)
+            if cache_path is not None:
+                self.statistics.save(cache_path, fingerprint=fingerprint)
+
+        self.size = self.statistics.mean.size
+        if (
+            self.previous_layer is not None
+            and self.previous_layer.y.shape[-1] != self.size
+        ):
+            raise ValueError(
+                f"The statistics are for {self.size} features,"
+                + " but the previous layer has"
+                + f" {self.previous_layer.y.shape[-1]} outputs.")
+        self.update_scaling()
+        self.reset()
+
+    def __str__(self):
+        str_parts = [
+            "feature normalization",
+            f"method: {self.method}",
+            f"number of features: {self.size}",
+            f"examples seen: {self.statistics.n_examples}",
+            f"updated during training: {self.update_during_training}",
+        ]
+        return "\n".join(str_parts)
+
+    def update_scaling(self):
+        """
+        Work out the offset and scale for each feature.
+        y = (x - offset_factor) / scale_factor - shift
+        """
+        if self.method == RANGE:
+            offset = self.statistics.min
+            scale = self.statistics.max - self.statistics.min
+            self.shift = .5
+        else:
+            offset = self.statistics.mean
+            scale = np.sqrt(self.statistics.get_variance())
+            self.shift = 0
+        # Features that never change don't need to be scaled.
+        scale = np.where(scale > 0, scale, 1)
+        self.offset_factor = offset.astype(self.dtype)
+        self.scale_factor = scale.astype(self.dtype)
+
+    def set_dtype(self, dtype):
+        super().set_dtype(dtype)
+        self.update_scaling()
+
+    def get_state(self):
+        return {"statistics": self.statistics.get_state()}
+
+    def set_state(self, state):
+        self.statistics.set_state(state["statistics"])
+        self.update_scaling()
+
+    def freeze(self):
+        return FrozenFeatureNormalization(
+            self.offset_factor, self.scale_factor, self.shift)
+
+    def forward_pass(self, evaluating=False, **kwargs):
+        if self.previous_layer is not None:
+            self.x += self.previous_layer.y
+        if self.update_during_training and not evaluating:
+            self.statistics.update(self.x)
+            self.update_scaling()
+        # y = (x - offset_factor) / scale_factor - shift
+        np.subtract(self.x, self.offset_factor, out=self.y)
+        self.y /= self.scale_factor
+        self.y -= self.shift
+
+    def backward_pass(self, **kwargs):
+        # The statistics are treated as constants.
+        np.divide(self.de_dy, self.scale_factor, out=self.de_dx)
+        if self.previous_layer is not None:
+            self.previous_layer.de_dy += self.de_dx
+
+    def denormalize(self, vals):
+        """
+        In case you ever need to reverse the normalization process.
+        """
+        return self.scale_factor * (vals + self.shift) + self.offset_factor
+
+
+class FrozenFeatureNormalization(object):
+    def __init__(self, offset_factor, scale_factor, shift):
+        self.offset_factor = np.array(offset_factor)
+        self.scale_factor = np.array(scale_factor)
+        self.shift = shift
+
+    def __str__(self):
+        return "feature normalization"
+
+    def calc(self, *inputs):
+        # y = (x - offset_factor) / scale_factor - shift
+        y = np.subtract(Passthrough.calc(*inputs), self.offset_factor)
+        y /= self.scale_factor
+        y -= self.shift
+        return y
+
+
+class FeatureStatistics(object):
+    """
+    Keep a running count, mean, variance, minimum, and maximum
+    for each feature, updated a batch at a time.
+
+    Batches are combined with the parallel form of Welford's algorithm,
+    which keeps the variance accurate even after many updates.
+    Chan, Golub, and LeVeque, "Updating formulae and a pairwise algorithm
+    for computing sample variances" (1979)
+    """
+    def __init__(self):
+        self.n_examples = 0
+        self.mean = None
+        # The sum of squared differences from the mean
+        self.m2 = None
+        self.min = None
+        self.max = None
+
+    def update(self, batch):
+        """
+        batch: 2D array, one example per row, one feature per column.
+        """
+        batch = np.asarray(batch, dtype=np.float64)
+        n_batch = batch.shape[0]
+        if n_batch == 0:
+            return
+        batch_mean = np.mean(batch, axis=0)
+        batch_m2 = np.sum((batch - batch_mean) ** 2, axis=0)
+        batch_min = np.min(batch, axis=0)
+        batch_max = np.max(batch, axis=0)
+
+        if self.n_examples == 0:
+            self.n_examples = n_batch
+            self.mean = batch_mean
+            self.m2 = batch_m2
+            self.min = batch_min
+            self.max = batch_max
+            return
+
+        n_total = self.n_examples + n_batch
+        delta = batch_mean - self.mean
+        self.mean = self.mean + delta * (n_batch / n_total)
+        self.m2 = self.m2 + batch_m2 + delta ** 2 * (
+            self.n_examples * n_batch / n_total)
+        self.min = np.minimum(self.min, batch_min)
+        self.max = np.maximum(self.max, batch_max)
+        self.n_examples = n_total
+
+    def get_variance(self):
+        return self.m2 / max(self.n_examples, 1)
+
+    def get_state(self):
+        return {
+            "n_examples": self.n_examples,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    def set_state(self, state):
+        self.n_examples = int(state["n_examples"])
+        self.mean = np.array(state["mean"], dtype=np.float64)
+        self.m2 = np.array(state["m2"], dtype=np.float64)
+        self.min = np.array(state["min"], dtype=np.float64)
+        self.max = np.array(state["max"], dtype=np.float64)
+
+    def save(self, path, fingerprint=""):
+        """
+        fingerprint: str
+            A description of the data the statistics came from,
+            saved along with them. See find_fingerprint().
+        """
+        # Write through a file handle, so that np.savez doesn't
+        # tack .npz onto the end of the path.
+        with open(path, "wb") as stats_file:
+            np.savez(
+                stats_file, fingerprint=fingerprint, **self.get_state())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the statistics, and the fingerprint saved with them.
+        """
+        statistics = cls()
+        with np.load(path) as state:
+            statistics.set_state(state)
+            if "fingerprint" in state.files:
+                fingerprint = str(state["fingerprint"])
+            else:
+                fingerprint = "no fingerprint"
+        return statistics, fingerprint
+
+
+def get_chunks(data_set, n_examples=None, chunk_size=1000):
+    """
+    Step through a data set, chunk_size examples at a time.
+    Each chunk is a 2D array, with one flattened example per row.
+
+    For a Dataset or a MemmapDataset, read the stored examples
+    directly, without drawing from the data set. Otherwise draw
+    n_examples from it, or 10,000 if n_examples isn't given.
+    """
+    arrays = get_arrays(data_set)
+    if arrays is None:
+        if n_examples is None:
+            n_examples = 10000
+        for i_start in range(0, n_examples, chunk_size):
+            n_chunk = min(chunk_size, n_examples - i_start)
+            if hasattr(data_set, "next_batch"):
+                chunk = data_set.next_batch(n_chunk)
+            else:
+                chunk = np.stack([next(data_set) for _ in range(n_chunk)])
+            yield chunk.reshape(n_chunk, -1)
+        return
+
+    n_remaining = np.inf if n_examples is None else n_examples
+    for array in arrays:
+        for i_start in range(0, array.shape[0], chunk_size):
+            if n_remaining <= 0:
+                return
+            n_chunk = int(min(
+                chunk_size, array.shape[0] - i_start, n_remaining))
+            yield array[i_start: i_start + n_chunk].reshape(n_chunk, -1)
+            n_remaining -= n_chunk
+
+
+def get_arrays(data_set):
+    """
+    The arrays a Dataset or a MemmapDataset keeps its examples in,
+    or None for a generator.
+    """
+    if hasattr(data_set, "examples"):
+        return [data_set.examples]
+    if hasattr(data_set, "shards"):
+        return data_set.shards
+    return None
+
+
+def find_fingerprint(data_set, n_examples=None):
+    """
+    Describe the data statistics are gathered from, well enough
+    to tell whether cached statistics belong to it.
+
+    For a Dataset or a MemmapDataset, that's the number of examples,
+    the number of features, and a hash of a few examples spread
+    evenly through each stored array. It's quick, even for data
+    that's too big to fit in memory, but it can miss changes
+    to the examples in between.
+
+    A generator is only described by n_examples.
+    """
+    arrays = get_arrays(data_set)
+    if arrays is None:
+        if n_examples is None:
+            n_examples = 10000
+        return f"{n_examples} examples from a generator"
+
+    digest = hashlib.sha1()
+    n_stored = 0
+    n_features = None
+    for array in arrays:
+        n_stored += array.shape[0]
+        n_features = int(np.prod(array.shape[1:]))
+        digest.update(f"{array.shape} {array.dtype}".encode())
+        i_samples = np.unique(np.linspace(
+            0, array.shape[0] - 1, N_FINGERPRINT_SAMPLES).astype(int))
+        if array.shape[0] > 0:
+            digest.update(np.ascontiguousarray(array[i_samples]).tobytes())
+    if n_examples is None:
+        n_used = n_stored
+    else:
+        n_used = min(n_examples, n_stored)
+    return (
+        f"{n_used} of {n_stored} stored examples with {n_features} features,"
+        + f" sample hash {digest.hexdigest()[:12]}")
@@ -1,4 +1,5 @@
 import numpy as np
+from cottonwood.core.inference import Passthrough
 
 
 class GenericLayer(object):
@@ -6,21 +7,94 @@ class GenericLayer(object):
     This is a generic layer, but one without any useful function.
     When you go to write a custom layer, you can use it as a starting point.
     """
+    # Does the layer have parameters that it learns on the backward pass?
+    trainable = False
+    # The floating point precision of all the layer's arrays.
+    # See set_dtype().
+    dtype = np.dtype(np.float64)
+
     def __init__(self, previous_layer):
         self.previous_layer = previous_layer
-        self.size = self.previous_layer.y.size
+        self.size = self.previous_layer.y.shape[-1]
         self.reset()
 
-    def reset(self):
-        self.x = np.zeros((1, self.size))
-        self.y = np.zeros((1, self.size))
-        self.de_dx = np.zeros((1, self.size))
-        self.de_dy = np.zeros((1, self.size))
+    def get_input_layers(self):
+        """
+        Which layers does this one read from?
+        """
+        if self.previous_layer is None:
+            return []
+        return [self.previous_layer]
+
+    def reset(self, n_examples=1, reuse_buffers=False):
+        """
+        Get ready for a new pass.
+        All the arrays have one row for each example in the batch.
+
+        reuse_buffers: boolean
+            If True, and the batch is the same size as last time,
+            zero out the existing arrays rather than allocating new ones.
+        """
+        if reuse_buffers and self.x.shape[0] == n_examples:
+            self.x.fill(0)
+            self.y.fill(0)
+            self.de_dy.fill(0)
+            return
+
+        self.x = np.zeros((n_examples, self.size), dtype=self.dtype)
+        self.y = np.zeros((n_examples, self.size), dtype=self.dtype)
+        self.de_dx = np.zeros((n_examples, self.size), dtype=self.dtype)
+        self.de_dy = np.zeros((n_examples, self.size), dtype=self.dtype)
+
+    def set_dtype(self, dtype):
+        """
+        Switch to a different floating point precision,
+        like np.float32 or np.float64.
+        """
+        self.dtype = np.dtype(dtype)
+        self.reset(self.x.shape[0])
+
+    def get_state(self):
+        """
+        Gather up everything the layer has learned or estimated,
+        as a dictionary. The working arrays, like x and y,
+        don't need to be included.
+        """
+        return {}
+
+    def set_state(self, state):
+        """
+        Restore everything that get_state() gathered.
+        """
+        pass
+
+    def freeze(self):
+        """
+        Make a stripped down, inference-only version of this layer.
+        See cottonwood/core/inference.py.
+
+        A layer that only passes its inputs along can use this one.
+        Any layer that does something else in its forward pass
+        needs its own, or it would quietly freeze into a passthrough.
+        """
+        if type(self).forward_pass is not GenericLayer.forward_pass:
+            raise NotImplementedError(
+                f"{type(self).__name__} has its own forward_pass(),"
+                + " so it needs its own freeze() too.")
+        return Passthrough()
+
+    def refreeze(self, step):
+        """
+        Bring a step that this layer's freeze() made earlier up to date,
+        reusing its arrays where it can. Layers with big arrays to copy,
+        like Dense, do that in place. The rest just freeze again.
+        """
+        return self.freeze()
 
     def forward_pass(self, **kwargs):
         self.x += self.previous_layer.y
         self.y = self.x
 
-    def backward_pass(self):
+    def backward_pass(self, **kwargs):
         self.de_dx = self.de_dy
         self.previous_layer.de_dy += self.de_dx
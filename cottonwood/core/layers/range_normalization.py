@@ -1,4 +1,5 @@
 import numpy as np
+from cottonwood.core.inference import FrozenRangeNormalization
 from cottonwood.core.layers.generic_layer import GenericLayer
 
 
@@ -15,10 +16,12 @@ class RangeNormalization(GenericLayer):
         self.range_max = -1e10
         for _ in range(n_range_test):
             sample = next(training_data)
+            # Keep these as plain Python floats, so that they don't
+            # change the precision of the arrays they're applied to.
             if self.range_min > np.min(sample):
-                self.range_min = np.min(sample)
+                self.range_min = float(np.min(sample))
             if self.range_max < np.max(sample):
-                self.range_max = np.max(sample)
+                self.range_max = float(np.max(sample))
         self.scale_factor = self.range_max - self.range_min
         self.offset_factor = self.range_min
         self.size = sample.size
@@ -32,13 +35,31 @@ class RangeNormalization(GenericLayer):
         ]
         return "\n".join(str_parts)
 
+    def get_state(self):
+        return {
+            "range_min": self.range_min,
+            "range_max": self.range_max,
+        }
+
+    def set_state(self, state):
+        self.range_min = state["range_min"]
+        self.range_max = state["range_max"]
+        self.scale_factor = self.range_max - self.range_min
+        self.offset_factor = self.range_min
+
+    def freeze(self):
+        return FrozenRangeNormalization(self.offset_factor, self.scale_factor)
+
     def forward_pass(self, **kwargs):
         if self.previous_layer is not None:
             self.x += self.previous_layer.y
-        self.y = (self.x - self.offset_factor) / self.scale_factor - .5
+        # y = (x - offset_factor) / scale_factor - .5
+        np.subtract(self.x, self.offset_factor, out=self.y)
+        self.y /= self.scale_factor
+        self.y -= .5
 
-    def backward_pass(self):
-        self.de_dx = self.de_dy / self.scale_factor
+    def backward_pass(self, **kwargs):
+        np.divide(self.de_dy, self.scale_factor, out=self.de_dx)
         if self.previous_layer is not None:
             self.previous_layer.de_dy += self.de_dx
 
@@ -0,0 +1,207 @@
+"""
+Find out how much memory a model's arrays take up.
+
+To use in a script:
+
+    model = ANN(layers=layers)
+    model.train(training_set)
+    print(model.memory_footprint())
+
+The footprint lists the bytes in each layer's weights, its gradients
+(de_dw), its optimizer's state, and everything else it keeps
+in arrays. These are called buffers. They include
+    the layer's inputs, outputs, and other working arrays,
+    the scratch arrays (workspaces) of its regularizers, and
+    the arrays held by objects the layer keeps, one level down,
+    like the statistics of a FeatureNormalization.
+It also lists the flat parameter buffer, if there is one,
+the model's own working arrays, the frozen copy used by probe(),
+and the error history.
+
+Only numpy arrays are counted, not the Python objects around them.
+Other layers that a layer reads from are counted on their own,
+not as part of it.
+Arrays that share memory, like a layer's weights and its slice
+of a flat parameter buffer, are only counted once, under
+whichever comes first. The layers come first.
+Layer buffers grow with the batch size, and only exist after
+the first forward pass.
+
+With ANN(track_memory=True), the footprint is written to memory.txt
+in the reports directory at the end of train() and evaluate(),
+alongside a record of the memory allocated during each step.
+See cottonwood/core/profiling.py.
+"""
+import numpy as np
+from cottonwood.core.layers.generic_layer import GenericLayer
+
+MEMORY_REPORT_NAME = "memory.txt"
+
+WEIGHTS = "weights"
+GRADIENTS = "gradients"
+OPTIMIZER = "optimizer state"
+BUFFERS = "buffers"
+CATEGORIES = [WEIGHTS, GRADIENTS, OPTIMIZER, BUFFERS]
+
+
+class MemoryFootprint(object):
+    def __init__(self, model):
+        # For each component, the number of bytes in each category
+        self.sizes = {}
+        # The address ranges of all the memory counted so far,
+        # as (start, stop) pairs, sorted and not overlapping.
+        self.counted = []
+
+        for i_layer, layer in enumerate(model.layers or []):
+            component = f"layer {i_layer} {type(layer).__name__}"
+            for name, value in vars(layer).items():
+                if name == "weights":
+                    self.add(component, WEIGHTS, value)
+                elif name == "de_dw":
+                    self.add(component, GRADIENTS, value)
+                elif name == "optimizer":
+                    if value is not None and not isinstance(value, type):
+                        for optimizer_value in vars(value).values():
+                            self.add(component, OPTIMIZER, optimizer_value)
+                elif name == "regularizers":
+                    for regularizer in value:
+                        self.add(component, BUFFERS, regularizer.workspace)
+                elif isinstance(value, GenericLayer):
+                    continue
+                elif hasattr(value, "__dict__") and not isinstance(
+                    value, type
+                ):
+                    # One level down, like a FeatureNormalization's
+                    # FeatureStatistics
+                    for nested_value in vars(value).values():
+                        self.add(component, BUFFERS, nested_value)
+                else:
+                    self.add(component, BUFFERS, value)
+
+        if model.parameters is not None:
+            self.add("flat parameters", WEIGHTS, model.parameters.weights)
+            self.add("flat parameters", GRADIENTS, model.parameters.de_dw)
+            for value in vars(model.parameters.optimizer).values():
+                self.add("flat parameters", OPTIMIZER, value)
+
+        self.add("model", BUFFERS, model.error_d)
+        # probe() keeps its own copy of the weights.
+        if model.probe_model is not None:
+            for step in model.probe_model.steps:
+                for value in vars(step).values():
+                    self.add("probe model", WEIGHTS, value)
+
+        history = model.error_history
+        self.add("error history", BUFFERS, history.bin_totals)
+        self.add("error history", BUFFERS, history.recent)
+        # One 8 byte total per bin, in an array that doubles
+        # when it fills up.
+        self.history_bin_size = history.bin_size
+        self.history_n_examples = len(history)
+
+    def __str__(self):
+        str_parts = [
+            f"{'component':<32}"
+            + "".join(f"{category:>17}" for category in CATEGORIES)
+            + f"{'total':>12}",
+        ]
+        for component, sizes in self.sizes.items():
+            str_parts.append(
+                f"{component:<32}"
+                + "".join(
+                    f"{format_bytes(sizes.get(category, 0)):>17}"
+                    for category in CATEGORIES)
+                + f"{format_bytes(sum(sizes.values())):>12}")
+        str_parts.append(
+            f"{'total':<32}"
+            + "".join(
+                f"{format_bytes(self.get_total(category)):>17}"
+                for category in CATEGORIES)
+            + f"{format_bytes(self.get_total()):>12}")
+        str_parts.append(
+            f"The error history has seen {self.history_n_examples} examples."
+            + f" It grows by 8 bytes every {self.history_bin_size} examples.")
+        return "\n".join(str_parts)
+
+    def add(self, component, category, value):
+        """
+        Count the bytes in value, if it's an array,
+        leaving out any that have already been counted.
+        """
+        if not isinstance(value, np.ndarray):
+            return
+        n_bytes = self.count_new_bytes(value)
+        if component not in self.sizes:
+            self.sizes[component] = {}
+        sizes = self.sizes[component]
+        sizes[category] = sizes.get(category, 0) + n_bytes
+
+    def count_new_bytes(self, array):
+        """
+        Views that skip over elements are treated as if they
+        covered everything from their first element to their last.
+        """
+        if array.size == 0:
+            return 0
+        start, stop = find_byte_bounds(array)
+        n_counted = sum(
+            max(0, min(stop, counted_stop) - max(start, counted_start))
+            for counted_start, counted_stop in self.counted)
+
+        # Add the new range, merging it with any it overlaps.
+        merged = []
+        for counted_start, counted_stop in sorted(
+            self.counted + [(start, stop)]
+        ):
+            if len(merged) > 0 and counted_start <= merged[-1][1]:
+                merged[-1] = (
+                    merged[-1][0], max(merged[-1][1], counted_stop))
+            else:
+                merged.append((counted_start, counted_stop))
+        self.counted = merged
+        return max(array.nbytes - n_counted, 0)
+
+    def get_total(self, category=None):
+        """
+        The total bytes in one category, or in all of them
+        if category is None.
+        """
+        return sum(
+            n_bytes
+            for sizes in self.sizes.values()
+            for size_category, n_bytes in sizes.items()
+            if category is None or size_category == category)
+
+    def write_report(self, path):
+        with open(path, "w") as memory_file:
+            memory_file.write(str(self) + "\n")
+
+
+def find_byte_bounds(array):
+    """
+    The addresses of the first byte of an array and of the byte
+    just past its end, allowing for negative strides.
+    """
+    start = array.__array_interface__["data"][0]
+    stop = start + array.itemsize
+    for n_elements, stride in zip(array.shape, array.strides):
+        if stride < 0:
+            start += stride * (n_elements - 1)
+        else:
+            stop += stride * (n_elements - 1)
+    return start, stop
+
+
+def format_bytes(n_bytes):
+    """
+    A human-readable size, like 1.5 MB.
+    """
+    sign = "-" if n_bytes < 0 else ""
+    size = float(abs(n_bytes))
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            break
+        size /= 1024
+    if unit == "B":
+        return f"{sign}{int(size)} {unit}"
+    return f"{sign}{size:.1f} {unit}"
@@ -1,10 +1,18 @@
 import datetime as dt
 import os
 import numpy as np
-import matplotlib.pyplot as plt
+import cottonwood.core.checkpoint as checkpoint
 from cottonwood.core.error_function import Sqr
+from cottonwood.core.error_history import ErrorHistory
+from cottonwood.core.execution_plan import ExecutionPlan
+from cottonwood.core.inference import FrozenANN
+import cottonwood.core.hyperparameters as hp
+import cottonwood.core.memory as memory
+import cottonwood.core.parallel as parallel
+from cottonwood.core.parameter_buffer import ParameterBuffer
+import cottonwood.core.profiling as profiling
+import cottonwood.core.reporting as reporting
 import cottonwood.core.toolbox as tb
-plt.switch_backend("agg")
 
 
 class ANN(object):
@@ -15,24 +23,70 @@ class ANN(object):
         n_iter_train=8e5,
         n_iter_evaluate=2e5,
         n_iter_evaluate_hyperparameters=5,
+        batch_size=1,
+        preallocate=False,
+        dtype=np.float64,
+        flat_parameters=False,
+        profile=False,
+        track_memory=False,
         printer=None,
         verbose=True,
         reporting_bin_size=1e3,
+        n_recent_errors=0,
         report_interval=1e4,
+        report_in_background=True,
         viz_interval=1e6,
     ):
         if error_function is None:
             self.error_function = Sqr()
+        elif isinstance(error_function, type):
+            # Error functions are often passed as classes, like Sqr.
+            # Use an instance, so that there's an object to profile.
+            self.error_function = error_function()
         else:
             self.error_function = error_function
 
         self.layers = layers
-        self.error_history = []
+        # The execution plan gets worked out the first time it's needed.
+        # See compile().
+        self.execution_plan = None
+        # A frozen copy of the model that probe() keeps up to date
+        # and reuses, rather than making a new one every time.
+        self.probe_model = None
+        # If flat_parameters is True, all the trainable weights are
+        # gathered into one ParameterBuffer when the model is compiled,
+        # and each backward pass ends with a single optimizer step
+        # for the whole model.
+        self.flat_parameters = flat_parameters
+        self.parameters = None
+        # Errors are summarized as they come in, in bins of
+        # reporting_bin_size examples, rather than all being kept.
+        # The last n_recent_errors are also kept as they are.
+        self.error_history = ErrorHistory(
+            bin_size=reporting_bin_size, n_recent=n_recent_errors)
         self.i_iter = 0
         self.n_iter_train = int(n_iter_train)
         self.n_iter_evaluate = int(n_iter_evaluate)
         self.n_iter_evaluate_hyperparameters = int(
             n_iter_evaluate_hyperparameters)
+        # How many examples to push through the network at once.
+        # Iteration counts and reporting intervals are all
+        # measured in examples, regardless of batch size.
+        self.batch_size = int(batch_size)
+        # If preallocate is True, each layer keeps and reuses the same
+        # working arrays from one pass to the next, rather than
+        # allocating new ones. The arrays returned by forward_pass()
+        # are then overwritten by the next pass.
+        self.preallocate = preallocate
+        self.error_d = None
+
+        # The floating point precision used throughout the model,
+        # np.float64 or np.float32. Inputs are converted to it
+        # on their way in.
+        self.dtype = np.dtype(dtype)
+        if self.layers is not None:
+            for layer in self.layers:
+                layer.set_dtype(self.dtype)
         self.viz_interval = int(viz_interval)
         self.report_interval = int(report_interval)
         self.reporting_bin_size = int(reporting_bin_size)
@@ -40,6 +94,19 @@ class ANN(object):
         self.report_max = 0
         self.printer = printer
         self.verbose = verbose
+        # Performance reports are plotted and saved in a background thread,
+        # so that training doesn't wait on them.
+        self.report_in_background = report_in_background
+        self.reporter = reporting.Reporter()
+        # If profile is True, time all the parts of each pass.
+        # If track_memory is True, also follow the memory they allocate,
+        # and report how much the model's arrays take up.
+        # See cottonwood/core/profiling.py and cottonwood/core/memory.py.
+        if profile or track_memory:
+            self.profiler = profiling.Profiler(track_memory=track_memory)
+            profiling.instrument(self)
+        else:
+            self.profiler = None
 
         time_dir = dt.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
         self.reports_path = os.path.join("reports", time_dir)
@@ -64,6 +131,8 @@ class ANN(object):
             "artificial neural network",
             "number of training iterations: " + str(self.n_iter_train),
             "number of evaluation iterations: " + str(self.n_iter_evaluate),
+            "batch size: " + str(self.batch_size),
+            "precision: " + str(self.dtype),
             "error_function:" + tb.indent(self.error_function.__str__())
         ]
         for i_layer, layer in enumerate(self.layers):
@@ -73,48 +142,128 @@ class ANN(object):
         return "\n".join(str_parts)
 
     def train(self, training_set):
-        for _ in range(self.n_iter_train):
-            self.i_iter += 1
-            x = next(training_set).ravel()
+        for i_example in range(0, self.n_iter_train, self.batch_size):
+            n_examples = min(self.batch_size, self.n_iter_train - i_example)
+            self.i_iter += n_examples
+            x = self.next_batch(training_set, n_examples)
             y = self.forward_pass(x)
             error = self.error_function.calc(y)
-            error_d = self.error_function.calc_d(y)
-            self.error_history.append(error)
+            error_d = self.error_function.calc_d(
+                y, out=self.get_error_d_workspace(y))
+            self.error_history.extend(error)
             self.backward_pass(error_d)
 
-            if (self.i_iter) % self.report_interval == 0 and self.verbose:
+            if self.is_due(self.report_interval, n_examples) and self.verbose:
                 self.report_performance()
 
-            if (self.i_iter) % self.viz_interval == 0 and self.verbose:
+            if self.is_due(self.viz_interval, n_examples) and self.verbose:
                 if self.printer is not None:
                     self.printer.render(
                         self,
-                        x,
+                        x[-1],
                         self.reports_path,
                         f"train_{self.i_iter:08d}")
+        self.catch_up_weights()
+        self.reporter.flush()
+        self.report_profile()
         return self.error_history
 
+    def catch_up_weights(self):
+        """
+        Lazy optimizers, like LazyAdam, leave the weights in rows
+        that haven't had a gradient for a while to be updated later.
+        Bring them all up to date.
+        """
+        for layer in self.layers:
+            if getattr(layer, "trainable", False):
+                layer.optimizer.catch_up(layer)
+
+    def train_hogwild(self, get_training_set, n_workers=None):
+        """
+        Train with several processes at once, all updating the same
+        shared weights without locking.
+        See cottonwood.core.parallel.train_hogwild() for the details.
+        """
+        return parallel.train_hogwild(
+            self, get_training_set, n_workers=n_workers)
+
+    def train_data_parallel(self, training_set, n_workers=None):
+        """
+        Train with each batch split across several processes,
+        getting the same results as training in just one.
+        See cottonwood.core.parallel.train_data_parallel() for the details.
+        """
+        return parallel.train_data_parallel(
+            self, training_set, n_workers=n_workers)
+
     def evaluate(self, evaluation_set):
-        for _ in range(self.n_iter_evaluate):
-            self.i_iter += 1
-            x = next(evaluation_set).ravel()
+        for i_example in range(0, self.n_iter_evaluate, self.batch_size):
+            n_examples = min(
+                self.batch_size, self.n_iter_evaluate - i_example)
+            self.i_iter += n_examples
+            x = self.next_batch(evaluation_set, n_examples)
             y = self.forward_pass(x, evaluating=True)
             error = self.error_function.calc(y)
-            self.error_history.append(error)
+            self.error_history.extend(error)
 
-            if (self.i_iter) % self.report_interval == 0 and self.verbose:
+            if self.is_due(self.report_interval, n_examples) and self.verbose:
                 self.report_performance()
 
-            if (self.i_iter) % self.viz_interval == 0 and self.verbose:
+            if self.is_due(self.viz_interval, n_examples) and self.verbose:
                 if self.printer is not None:
                     self.printer.render(
                         self,
-                        x,
+                        x[-1],
                         self.reports_path,
                         f"eval_{self.i_iter:08d}")
+        self.reporter.flush()
+        self.report_profile()
         return self.error_history
 
+    def next_batch(self, data_set, n_examples):
+        """
+        Pull n_examples from a data set and stack them into
+        a 2D array, one flattened example per row.
+
+        data_set can be anything with a next_batch(n_examples) method,
+        like a cottonwood.data.dataset.Dataset, or a plain generator
+        that produces one example at a time.
+        """
+        if hasattr(data_set, "next_batch"):
+            batch = data_set.next_batch(n_examples)
+            return batch.reshape(n_examples, -1).astype(
+                self.dtype, copy=False)
+        return np.stack([
+            next(data_set).ravel() for _ in range(n_examples)
+        ]).astype(self.dtype, copy=False)
+
+    def get_error_d_workspace(self, y):
+        """
+        When preallocating, reuse the same array for the error derivative.
+        Otherwise return None and let the error function make a new one.
+        """
+        if not self.preallocate:
+            return None
+        if self.error_d is None or self.error_d.shape != y.shape:
+            self.error_d = np.zeros(y.shape, dtype=y.dtype)
+        return self.error_d
+
+    def is_due(self, interval, n_examples):
+        """
+        Did the most recent batch of n_examples carry i_iter
+        across a multiple of interval?
+        """
+        return (
+            self.i_iter // interval > (self.i_iter - n_examples) // interval)
+
     def evaluate_hyperparameters(self, training_set, tuning_set):
+        """
+        Train and evaluate this model several times over.
+        Note that every run picks up where the last one left off.
+        For comparisons between independently trained models,
+        spread across several processes, see
+        cottonwood.core.hyperparameters.evaluate_hyperparameters().
+        """
         error_means = []
         for i_run in range(self.n_iter_evaluate_hyperparameters):
             time_str = dt.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
@@ -123,14 +272,81 @@ class ANN(object):
                     f"Running hyperparameter evaluation iteration {i_run + 1}"
                     + f" of {self.n_iter_evaluate_hyperparameters} at {time_str}"
                 )
-            error_history_train = self.train(training_set)
-            n_train = len(error_history_train)
-            error_history = self.evaluate(tuning_set)
-            error_history_evaluate = error_history[n_train:]
-            log_errors = np.log10(np.array(error_history_evaluate) + 1e-10)
-            error_means.append(np.mean(log_errors))
-        error_means.sort()
-        return np.median(error_means), error_means[-1]
+            self.train(training_set)
+            start = self.error_history.mark()
+            self.evaluate(tuning_set)
+            error_means.append(self.error_history.mean_log_error(start))
+        return hp.summarize(error_means)
+
+    def save(self, path):
+        """
+        Write everything needed to resume training to a checkpoint file:
+        the weights, the optimizer and regularizer state, the error
+        history, the iteration count, and the random number generator state.
+        """
+        checkpoint.save(self, path)
+
+    def load(self, path):
+        """
+        Pick up where a checkpoint left off. The model needs to have been
+        built with the same layers as the one that was saved.
+        """
+        checkpoint.load(self, path)
+
+    def freeze(self):
+        """
+        Make an inference-only copy of the model, for fast predictions
+        on batches of examples. See cottonwood/core/inference.py.
+        """
+        return FrozenANN(self)
+
+    def probe(self, x, i_start_layer=None, i_stop_layer=None):
+        """
+        Run examples through some or all of the layers, without
+        touching anything that training relies on.
+        The model's working arrays, like each layer's x and y,
+        are left as they were, and there's no dropout.
+
+        The arguments are the same as for forward_pass().
+        Passing a whole batch at once, like the rows of an identity
+        matrix, gets all the results in one vectorized pass.
+        """
+        if self.execution_plan is None:
+            self.compile()
+        if (
+            self.probe_model is None
+            or self.probe_model.execution_plan is not self.execution_plan
+            or self.probe_model.dtype != self.dtype
+        ):
+            self.probe_model = self.freeze()
+        else:
+            self.probe_model.refresh(self)
+        return self.probe_model.predict(
+            x, i_start_layer=i_start_layer, i_stop_layer=i_stop_layer)
+
+    def compile(self):
+        """
+        Walk the connections between layers once and work out a fixed
+        schedule for forward and backward passes.
+        This happens automatically before the first pass. Call it again
+        if the layers or their connections change after that.
+        """
+        self.execution_plan = ExecutionPlan(self.layers)
+
+        if self.parameters is not None:
+            # Let the layers' own optimizers catch up before
+            # the buffer is rebuilt.
+            self.parameters.scatter_optimizer_states()
+            self.parameters = None
+        if self.flat_parameters:
+            i_trainable = [
+                i_layer for i_layer in self.execution_plan.backward_schedule
+                if getattr(self.layers[i_layer], "trainable", False)
+            ]
+            self.parameters = ParameterBuffer(
+                self.layers, sorted(i_trainable))
+        if self.profiler is not None:
+            profiling.instrument(self)
 
     def forward_pass(
         self,
@@ -140,6 +356,11 @@ class ANN(object):
         i_stop_layer=None,
     ):
         """
+        x: array
+            Either a single example, as a 1D array, or a batch of them,
+            as a 2D array of shape (n_examples, n_features).
+            The result has the same form: 1D for a single example,
+            2D for a batch.
         evaluating: boolean
             Tells whether this is an evaluation
             (or testing, or validation) run. Some layers behave
@@ -151,6 +372,8 @@ class ANN(object):
             For some purposes, like visualization, it's helpful to
             inject activities into a layer, or pull them out from
             a middle layer.
+            Only the layers that feed into layer[i_stop_layer - 1]
+            are run.
         """
         if i_start_layer is None:
             i_start_layer = 0
@@ -160,23 +383,54 @@ class ANN(object):
         if i_start_layer >= i_stop_layer:
             return x
 
-        # Reset all the layers to get them ready for the new iteration.
-        for layer in self.layers:
-            layer.reset()
+        # Convert the inputs into a 2D array of the right shape,
+        # one example per row.
+        x = np.asarray(x, dtype=self.dtype)
+        is_batch = x.ndim > 1
+        if is_batch:
+            x = x.reshape(x.shape[0], -1)
+        else:
+            x = x.ravel()[np.newaxis, :]
+        n_examples = x.shape[0]
+
+        if self.execution_plan is None:
+            self.compile()
+        i_reset, i_run = self.execution_plan.get_forward_schedule(
+            i_start_layer, i_stop_layer)
+
+        # Reset the layers to get them ready for the new iteration.
+        for i_layer in i_reset:
+            self.layers[i_layer].reset(
+                n_examples, reuse_buffers=self.preallocate)
+
+        # Increment the inputs of the start layer.
+        self.layers[i_start_layer].x += x
 
-        # Convert the inputs into a 2D array of the right shape
-        # and increment the inputs of the start layer.
-        self.layers[i_start_layer].x += x.ravel()[np.newaxis, :]
+        for i_layer in i_run:
+            self.layers[i_layer].forward_pass(evaluating=evaluating)
 
-        for layer in self.layers[i_start_layer: i_stop_layer]:
-            layer.forward_pass(evaluating=evaluating)
+        layer = self.layers[i_stop_layer - 1]
 
+        if is_batch:
+            return layer.y
         return layer.y.ravel()
 
-    def backward_pass(self, de_dy):
+    def backward_pass(self, de_dy, update=True):
+        """
+        Only the layers that contribute to the output and have
+        something upstream to learn are visited.
+
+        update: boolean
+            If False, find all the gradients but leave the weights alone.
+        """
+        # With flat parameters, the layers only find their gradients,
+        # and the weights are all updated together at the end.
+        update_layers = update and self.parameters is None
         self.layers[-1].de_dy += de_dy
-        for layer in self.layers[::-1]:
-            layer.backward_pass()
+        for i_layer in self.execution_plan.backward_schedule:
+            self.layers[i_layer].backward_pass(update=update_layers)
+        if update and self.parameters is not None:
+            self.parameters.update_weights()
 
     def report_parameters(self):
         """
@@ -188,31 +442,45 @@ class ANN(object):
         ) as param_file:
             param_file.write(param_info)
 
+    def report_profile(self):
+        """
+        Write out where the time, and the memory, have gone so far,
+        if the model is being profiled.
+        """
+        if self.profiler is None or not self.verbose:
+            return
+        self.profiler.write_report(
+            os.path.join(self.reports_path, profiling.PROFILE_REPORT_NAME))
+        if self.profiler.track_memory:
+            self.memory_footprint().write_report(
+                os.path.join(self.reports_path, memory.MEMORY_REPORT_NAME))
+
+    def memory_footprint(self):
+        """
+        How many bytes the model's weights, gradients, optimizer states,
+        working arrays, and error history take up.
+        """
+        return memory.MemoryFootprint(self)
+
     def report_performance(self):
         """
         Create a plot of the error history.
         """
-        n_bins = int(len(self.error_history) // self.reporting_bin_size)
-        smoothed_history = []
-        for i_bin in range(n_bins):
-            smoothed_history.append(np.mean(self.error_history[
-                i_bin * self.reporting_bin_size:
-                (i_bin + 1) * self.reporting_bin_size
-            ]))
-        error_history = np.log10(np.array(smoothed_history) + 1e-10)
-        ymin = np.minimum(self.report_min, np.min(error_history))
-        ymax = np.maximum(self.report_max, np.max(error_history))
-        fig = plt.figure()
-        ax = plt.gca()
-        ax.plot(
-            np.arange(len(error_history)) + 1,
-            error_history,
-            color="blue",
+        # Hand a snapshot of the binned history off to be plotted.
+        # get_bin_means() returns a fresh array, so it won't change
+        # while the plot is being made.
+        bin_means = self.error_history.get_bin_means()
+        # Wait until there's at least one full bin to show.
+        if bin_means.size == 0:
+            return
+        report_args = (
+            bin_means,
+            self.reporting_bin_size,
+            self.report_min,
+            self.report_max,
+            os.path.join(self.reports_path, self.performance_report_name),
         )
-        ax.set_xlabel(f"x{self.reporting_bin_size:,} iterations")
-        ax.set_ylabel("log error")
-        ax.set_ylim(ymin, ymax)
-        ax.grid()
-        fig.savefig(os.path.join(
-            self.reports_path, self.performance_report_name))
-        plt.close()
+        if self.report_in_background:
+            self.reporter.submit(reporting.plot_performance, *report_args)
+        else:
+            reporting.plot_performance(*report_args)
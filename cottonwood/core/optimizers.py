@@ -1,7 +1,16 @@
 import numpy as np
+import cottonwood.core.toolbox as tb
 
 
 class GenericOptimizer(object):
+    # Lazy optimizers only update the rows of the weights that have
+    # a gradient, and catch the others up later. See catch_up().
+    lazy = False
+    # Whether the weights themselves, and not just the optimizer's state,
+    # can be out of date in the rows that have been left behind.
+    # If so, they need to be caught up before they're used.
+    stale_weights = False
+
     def __init__(self, **kwargs):
         default_adam_beta_1 = .9
         default_adam_beta_2 = .999
@@ -28,25 +37,113 @@ class GenericOptimizer(object):
 
         self.i_minibatch = 0
         self.de_dw_total = None
+        # A scratch array for intermediate results. See get_workspace().
+        self.workspace = None
+
+    def get_workspace(self, like):
+        """
+        Keep a scratch array around for intermediate results,
+        so that each update doesn't have to allocate a new one.
+        """
+        if (
+            self.workspace is None
+            or self.workspace.shape != like.shape
+            or self.workspace.dtype != like.dtype
+        ):
+            self.workspace = np.zeros_like(like)
+        return self.workspace
+
+    def set_dtype(self, dtype):
+        """
+        Convert any internal state to a different floating point precision.
+        """
+        self.de_dw_total = tb.cast(self.de_dw_total, dtype)
+        self.workspace = None
+
+    def get_settings(self):
+        """
+        Gather up the optimizer's hyperparameters as a dictionary.
+        """
+        return {
+            "adam_beta_1": self.adam_beta_1,
+            "adam_beta_2": self.adam_beta_2,
+            "epsilon": self.epsilon,
+            "learning_rate": self.learning_rate,
+            "minibatch_size": self.minibatch_size,
+            "momentum_amount": self.momentum_amount,
+            "scaling_factor": self.scaling_factor,
+        }
+
+    def get_state(self):
+        """
+        Gather up everything needed to pick up exactly where
+        the optimizer left off, as a dictionary.
+        """
+        state = self.get_settings()
+        state["i_minibatch"] = self.i_minibatch
+        # The partial sum of gradients for the current minibatch.
+        state["de_dw_total"] = self.de_dw_total
+        return state
+
+    def set_state(self, state):
+        """
+        Restore everything that get_state() gathered.
+        """
+        self.adam_beta_1 = state["adam_beta_1"]
+        self.adam_beta_2 = state["adam_beta_2"]
+        self.epsilon = state["epsilon"]
+        self.learning_rate = state["learning_rate"]
+        self.minibatch_size = state["minibatch_size"]
+        self.momentum_amount = state["momentum_amount"]
+        self.scaling_factor = state["scaling_factor"]
+        self.i_minibatch = state["i_minibatch"]
+        self.de_dw_total = state["de_dw_total"]
+
+    def catch_up(self, layer, i_rows=None):
+        """
+        Bring any weights that a lazy optimizer has left behind up to date.
+        Other optimizers are always up to date.
+
+        i_rows: array of int
+            Which rows of the weights to catch up. The default is all of them.
+        """
+        pass
+
+    def find_active_rows(self, layer, de_dw_batch):
+        """
+        Which rows of the weights have a gradient this time?
+        A layer with sparse inputs already knows. Otherwise,
+        look for rows of the gradient that aren't all zero.
+        """
+        i_active_rows = getattr(layer, "i_active_rows", None)
+        if i_active_rows is not None and self.minibatch_size <= 1:
+            return i_active_rows
+        return np.flatnonzero(np.any(de_dw_batch, axis=1))
 
     def update_minibatch(self, layer):
+        """
+        Accumulate gradients until there are minibatch_size of them,
+        then return their average. Return None until then.
+        The array returned shouldn't be modified.
+        """
+        if self.minibatch_size <= 1:
+            return layer.de_dw
+
         if self.de_dw_total is None:
-            self.de_dw_total = np.zeros(layer.de_dw.shape)
-        self.de_dw_total += layer.de_dw
+            self.de_dw_total = np.zeros_like(layer.de_dw)
+        # Start a fresh total at the beginning of each minibatch.
+        if self.i_minibatch == 0:
+            np.copyto(self.de_dw_total, layer.de_dw)
+        else:
+            self.de_dw_total += layer.de_dw
         self.i_minibatch += 1
 
         de_dw_batch = None
-        if self.minibatch_size > 1:
-            if self.i_minibatch >= self.minibatch_size:
-                de_dw_batch = self.de_dw_total / self.minibatch_size
-                self.de_dw_total = None
-                self.i_minibatch = 0
-        else:
+        if self.i_minibatch >= self.minibatch_size:
+            self.de_dw_total /= self.minibatch_size
             de_dw_batch = self.de_dw_total
-            self.de_dw_total = None
             self.i_minibatch = 0
 
-
         return de_dw_batch
 
 
@@ -69,7 +166,20 @@ class SGD(GenericOptimizer):
         de_dw_batch = self.update_minibatch(layer)
         if de_dw_batch is None:
             return
-        layer.weights -= de_dw_batch * self.learning_rate
+        # When the layer's inputs were sparse, only the rows of the
+        # gradient for the active inputs are nonzero, and only those
+        # rows of the weights need to change.
+        # A minibatch gathers gradients from several passes,
+        # so it takes the full update.
+        i_active_rows = getattr(layer, "i_active_rows", None)
+        if i_active_rows is not None and self.minibatch_size <= 1:
+            layer.weights[i_active_rows, :] -= (
+                de_dw_batch[i_active_rows, :] * self.learning_rate)
+            return
+
+        adjustment = self.get_workspace(layer.weights)
+        np.multiply(de_dw_batch, self.learning_rate, out=adjustment)
+        layer.weights -= adjustment
 
 
 class Momentum(GenericOptimizer):
@@ -95,21 +205,36 @@ class Momentum(GenericOptimizer):
         ]
         return "\n".join(str_parts)
 
+    def set_dtype(self, dtype):
+        super().set_dtype(dtype)
+        self.previous_adjustment = tb.cast(self.previous_adjustment, dtype)
+
+    def get_state(self):
+        state = super().get_state()
+        state["previous_adjustment"] = self.previous_adjustment
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.previous_adjustment = state["previous_adjustment"]
+
     def update(self, layer):
         de_dw_batch = self.update_minibatch(layer)
         if de_dw_batch is None:
             return
 
         if self.previous_adjustment is None:
-            self.previous_adjustment = np.zeros(layer.weights.shape)
-        new_adjustment = (
-            self.previous_adjustment * self.momentum_amount
-            + de_dw_batch * self.learning_rate
-        )
-        layer.weights -= new_adjustment
-
-        # Update previous_adjustment to get set up for the next iteration.
-        self.previous_adjustment = new_adjustment
+            self.previous_adjustment = np.zeros_like(layer.weights)
+        # new_adjustment = (
+        #     previous_adjustment * momentum_amount
+        #     + de_dw_batch * learning_rate)
+        # It's built up in place in previous_adjustment,
+        # which gets it set up for the next iteration too.
+        step = self.get_workspace(layer.weights)
+        np.multiply(de_dw_batch, self.learning_rate, out=step)
+        self.previous_adjustment *= self.momentum_amount
+        self.previous_adjustment += step
+        layer.weights -= self.previous_adjustment
 
 
 class Adam(GenericOptimizer):
@@ -122,8 +247,8 @@ class Adam(GenericOptimizer):
     """
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.first_moment = 0
-        self.second_moment = 0
+        self.first_moment = None
+        self.second_moment = None
         self.timestep = 0
 
     def __str__(self):
@@ -136,6 +261,24 @@ class Adam(GenericOptimizer):
         ]
         return "\n".join(str_parts)
 
+    def set_dtype(self, dtype):
+        super().set_dtype(dtype)
+        self.first_moment = tb.cast(self.first_moment, dtype)
+        self.second_moment = tb.cast(self.second_moment, dtype)
+
+    def get_state(self):
+        state = super().get_state()
+        state["first_moment"] = self.first_moment
+        state["second_moment"] = self.second_moment
+        state["timestep"] = self.timestep
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.first_moment = state["first_moment"]
+        self.second_moment = state["second_moment"]
+        self.timestep = state["timestep"]
+
     def update(self, layer):
         self.timestep += 1
 
@@ -143,19 +286,236 @@ class Adam(GenericOptimizer):
         if de_dw_batch is None:
             return
 
-        self.first_moment = (
-            self.adam_beta_1 * self.first_moment
-            + (1 - self.adam_beta_1) * de_dw_batch
-        )
-        self.second_moment = (
-            self.adam_beta_2 * self.second_moment
-            + (1 - self.adam_beta_2) * de_dw_batch ** 2
-        )
-        corrected_first_moment = self.first_moment / (
-            1 - self.adam_beta_1 ** self.timestep)
-        corrected_second_moment = self.second_moment / (
-            1 - self.adam_beta_2 ** self.timestep)
-
-        adjustment = self.learning_rate * corrected_first_moment / (
-            corrected_second_moment ** .5 + self.epsilon)
-        layer.weights -= adjustment
+        if self.first_moment is None:
+            self.first_moment = np.zeros_like(layer.weights)
+            self.second_moment = np.zeros_like(layer.weights)
+        workspace = self.get_workspace(layer.weights)
+
+        # first_moment = beta_1 * first_moment + (1 - beta_1) * de_dw_batch
+        self.first_moment *= self.adam_beta_1
+        np.multiply(de_dw_batch, 1 - self.adam_beta_1, out=workspace)
+        self.first_moment += workspace
+
+        # second_moment = (
+        #     beta_2 * second_moment + (1 - beta_2) * de_dw_batch ** 2)
+        self.second_moment *= self.adam_beta_2
+        np.square(de_dw_batch, out=workspace)
+        workspace *= 1 - self.adam_beta_2
+        self.second_moment += workspace
+
+        # adjustment = learning_rate * corrected_first_moment / (
+        #     corrected_second_moment ** .5 + epsilon)
+        first_moment_correction = 1 - self.adam_beta_1 ** self.timestep
+        second_moment_correction = 1 - self.adam_beta_2 ** self.timestep
+        np.divide(self.second_moment, second_moment_correction, out=workspace)
+        np.sqrt(workspace, out=workspace)
+        workspace += self.epsilon
+        np.divide(self.first_moment, workspace, out=workspace)
+        workspace *= self.learning_rate / first_moment_correction
+        layer.weights -= workspace
+
+
+class LazyMomentum(Momentum):
+    """
+    Uses minibatch_size, learning_rate, momentum_amount parameters.
+
+    Momentum, but only the rows of the weights that have a gradient
+    get updated on each step. For the other rows, momentum would keep
+    shrinking the previous adjustment and moving the weights by it.
+    That's caught up all at once, in closed form, when the row is next
+    needed, so each update only costs as much as the number of rows
+    with a gradient.
+
+    That leaves the weights in those rows out of date, so a Dense layer
+    catches up the rows it's about to use at the start of each forward
+    pass, and its outputs are then the same as with Momentum.
+    Without sparse_inputs, that's all of them, and only the optimizer
+    update itself is any cheaper than Momentum's.
+    With sparse_inputs, the rows for inputs that are zero are left
+    behind, and the gradient passed back to those inputs uses
+    their out of date weights. That doesn't matter when the inputs
+    come straight from the data, or from a Sparsify layer, which
+    passes no gradient back through inactive nodes. Otherwise the
+    results differ from Momentum's.
+    At the end of training, all the rows are caught up.
+    """
+    lazy = True
+    stale_weights = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # How many updates have been made, and for each row of the weights,
+        # the update it's been brought up to date through.
+        self.i_update = 0
+        self.last_update = None
+
+    def __str__(self):
+        str_parts = [
+            "lazy momentum",
+            f"learning_rate: {self.learning_rate}",
+            f"momentum amount: {self.momentum_amount}",
+            f"minibatch size: {self.minibatch_size}",
+        ]
+        return "\n".join(str_parts)
+
+    def get_state(self):
+        state = super().get_state()
+        state["i_update"] = self.i_update
+        state["last_update"] = self.last_update
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.i_update = state["i_update"]
+        self.last_update = state["last_update"]
+
+    def update(self, layer):
+        de_dw_batch = self.update_minibatch(layer)
+        if de_dw_batch is None:
+            return
+
+        if self.previous_adjustment is None:
+            self.previous_adjustment = np.zeros_like(layer.weights)
+            self.last_update = np.zeros(layer.weights.shape[0], dtype=int)
+        i_rows = self.find_active_rows(layer, de_dw_batch)
+        self.catch_up(layer, i_rows)
+        self.i_update += 1
+
+        # new_adjustment = (
+        #     previous_adjustment * momentum_amount
+        #     + de_dw_batch * learning_rate)
+        adjustment = self.previous_adjustment[i_rows, :]
+        adjustment *= self.momentum_amount
+        adjustment += de_dw_batch[i_rows, :] * self.learning_rate
+        self.previous_adjustment[i_rows, :] = adjustment
+        layer.weights[i_rows, :] -= adjustment
+        self.last_update[i_rows] = self.i_update
+
+    def catch_up(self, layer, i_rows=None):
+        """
+        Without a gradient, each update shrinks the previous adjustment
+        by a factor of momentum_amount, m, and subtracts it from
+        the weights. After n of them, the adjustment has shrunk by m ** n,
+        and the weights have moved by
+            previous_adjustment * (m + m ** 2 + ... + m ** n)
+            = previous_adjustment * m * (1 - m ** n) / (1 - m)
+        """
+        if self.previous_adjustment is None:
+            return
+        if i_rows is None:
+            i_rows = np.arange(self.last_update.size)
+        n_skipped = self.i_update - self.last_update[i_rows]
+        if not np.any(n_skipped):
+            return
+        decay = self.momentum_amount ** n_skipped
+        if self.momentum_amount == 1:
+            total = n_skipped
+        else:
+            total = self.momentum_amount * (1 - decay) / (
+                1 - self.momentum_amount)
+        layer.weights[i_rows, :] -= (
+            self.previous_adjustment[i_rows, :] * total[:, np.newaxis])
+        self.previous_adjustment[i_rows, :] *= decay[:, np.newaxis]
+        self.last_update[i_rows] = self.i_update
+
+
+class LazyAdam(Adam):
+    """
+    Uses parameters minbatch_size, learning_rate, beta_1, beta_2, epsilon
+
+    Adam, but only the rows of the weights that have a gradient
+    get updated on each step. For the other rows, the first and second
+    moments would keep decaying. That's caught up all at once, in closed
+    form, the next time the row gets a gradient.
+    Unlike in Adam, the weights in rows without a gradient stay put
+    in the meantime. Each update only costs as much as
+    the number of rows with a gradient.
+    """
+    lazy = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # How many updates have been made, and for each row of the weights,
+        # the update it's been brought up to date through.
+        self.i_update = 0
+        self.last_update = None
+
+    def __str__(self):
+        str_parts = [
+            "lazy adam",
+            f"learning_rate: {self.learning_rate}",
+            f"beta 1: {self.adam_beta_1}",
+            f"beta 2: {self.adam_beta_2}",
+            f"minibatch size: {self.minibatch_size}",
+        ]
+        return "\n".join(str_parts)
+
+    def get_state(self):
+        state = super().get_state()
+        state["i_update"] = self.i_update
+        state["last_update"] = self.last_update
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.i_update = state["i_update"]
+        self.last_update = state["last_update"]
+
+    def update(self, layer):
+        self.timestep += 1
+
+        de_dw_batch = self.update_minibatch(layer)
+        if de_dw_batch is None:
+            return
+
+        if self.first_moment is None:
+            self.first_moment = np.zeros_like(layer.weights)
+            self.second_moment = np.zeros_like(layer.weights)
+            self.last_update = np.zeros(layer.weights.shape[0], dtype=int)
+        i_rows = self.find_active_rows(layer, de_dw_batch)
+        self.catch_up(layer, i_rows)
+        self.i_update += 1
+        de_dw_rows = de_dw_batch[i_rows, :]
+
+        # first_moment = beta_1 * first_moment + (1 - beta_1) * de_dw_batch
+        first_moment = self.first_moment[i_rows, :]
+        first_moment *= self.adam_beta_1
+        first_moment += de_dw_rows * (1 - self.adam_beta_1)
+        self.first_moment[i_rows, :] = first_moment
+
+        # second_moment = (
+        #     beta_2 * second_moment + (1 - beta_2) * de_dw_batch ** 2)
+        second_moment = self.second_moment[i_rows, :]
+        second_moment *= self.adam_beta_2
+        second_moment += de_dw_rows ** 2 * (1 - self.adam_beta_2)
+        self.second_moment[i_rows, :] = second_moment
+
+        # adjustment = learning_rate * corrected_first_moment / (
+        #     corrected_second_moment ** .5 + epsilon)
+        first_moment_correction = 1 - self.adam_beta_1 ** self.timestep
+        second_moment_correction = 1 - self.adam_beta_2 ** self.timestep
+        adjustment = np.sqrt(second_moment / second_moment_correction)
+        adjustment += self.epsilon
+        np.divide(first_moment, adjustment, out=adjustment)
+        adjustment *= self.learning_rate / first_moment_correction
+        layer.weights[i_rows, :] -= adjustment
+        self.last_update[i_rows] = self.i_update
+
+    def catch_up(self, layer, i_rows=None):
+        """
+        Without a gradient, each update shrinks the first moment
+        by a factor of beta_1 and the second moment by beta_2.
+        After n of them, they've shrunk by beta_1 ** n and beta_2 ** n.
+        """
+        if self.first_moment is None:
+            return
+        if i_rows is None:
+            i_rows = np.arange(self.last_update.size)
+        n_skipped = self.i_update - self.last_update[i_rows]
+        if not np.any(n_skipped):
+            return
+        self.first_moment[i_rows, :] *= (
+            self.adam_beta_1 ** n_skipped)[:, np.newaxis]
+        self.second_moment[i_rows, :] *= (
+            self.adam_beta_2 ** n_skipped)[:, np.newaxis]
+        self.last_update[i_rows] = self.i_update
@@ -0,0 +1,438 @@
+"""
+Train one model across several processes at once.
+
+There are two ways to do it here.
+train_hogwild() runs independent workers that all update the same
+shared weights whenever they like.
+train_data_parallel() splits each batch across workers, averages
+their gradients, and takes a single optimizer step, so that it gets
+the same results as training in one process.
+
+Hogwild!: A Lock-Free Approach to Parallelizing Stochastic Gradient Descent
+Feng Niu, Benjamin Recht, Christopher Re, Stephen J. Wright
+https://arxiv.org/abs/1106.5730
+"""
+import multiprocessing as mp
+import os
+import queue
+import traceback
+from multiprocessing import shared_memory
+import numpy as np
+from cottonwood.core.error_history import ErrorHistory
+
+# The key for a model's flat parameter buffer among its shared weights
+PARAMETERS = "parameters"
+
+
+class SharedArray(object):
+    """
+    A numpy array that lives in shared memory, where several processes
+    can read and write it at once.
+
+    When a SharedArray is pickled to be sent to another process,
+    only its name, shape, and dtype go along. The other process
+    attaches to the same block of memory when it's unpickled.
+    """
+    def __init__(self, shape, dtype=np.float64, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        n_bytes = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        if name is None:
+            self.shared_memory = shared_memory.SharedMemory(
+                create=True, size=n_bytes)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(
+            self.shape, dtype=self.dtype, buffer=self.shared_memory.buf)
+
+    @classmethod
+    def copy_of(cls, values):
+        """
+        Make a new SharedArray with the same contents as values.
+        """
+        shared = cls(values.shape, dtype=values.dtype)
+        shared.array[...] = values
+        return shared
+
+    def __getstate__(self):
+        return (self.shape, self.dtype.str, self.shared_memory.name)
+
+    def __setstate__(self, state):
+        shape, dtype, name = state
+        self.__init__(shape, dtype=dtype, name=name)
+
+    def close(self):
+        """
+        Stop using the shared memory from this process.
+        All other references to self.array need to be gone by now.
+        """
+        self.array = None
+        self.shared_memory.close()
+
+    def unlink(self):
+        """
+        Free the shared memory. Only one process needs to do this,
+        after everyone is done with it.
+        """
+        self.close()
+        self.shared_memory.unlink()
+
+
+def share_weights(model):
+    """
+    Move the weights of every trainable layer into shared memory.
+    The layers keep working as before, but their weights arrays
+    are now views into SharedArrays.
+
+    Returns a dictionary of SharedArrays, keyed by layer index.
+    If the model has a flat parameter buffer, there's just one,
+    keyed by PARAMETERS, and sharing it is a single copy.
+    """
+    if model.parameters is not None:
+        shared = SharedArray.copy_of(model.parameters.weights)
+        model.parameters.attach(shared.array)
+        return {PARAMETERS: shared}
+
+    shared_weights = {}
+    for i_layer, layer in enumerate(model.layers):
+        if getattr(layer, "trainable", False):
+            shared = SharedArray.copy_of(layer.weights)
+            layer.weights = shared.array
+            shared_weights[i_layer] = shared
+    return shared_weights
+
+
+def attach_weights(model, shared_weights):
+    """
+    Point the layers' weights at arrays that are already shared.
+    """
+    for i_layer, shared in shared_weights.items():
+        if i_layer == PARAMETERS:
+            model.parameters.attach(shared.array)
+        else:
+            model.layers[i_layer].weights = shared.array
+
+
+def unshare_weights(model, shared_weights):
+    """
+    Copy the weights back out of shared memory and free it.
+    """
+    for i_layer, shared in shared_weights.items():
+        if i_layer == PARAMETERS:
+            model.parameters.attach(np.array(shared.array))
+        else:
+            model.layers[i_layer].weights = np.array(shared.array)
+        shared.unlink()
+
+
+def get_owner(model, i_layer):
+    """
+    Find what holds the weights and gradients for a key
+    in the shared weights: either a layer or the flat parameter buffer.
+    Both have de_dw and update_weights().
+    """
+    if i_layer == PARAMETERS:
+        return model.parameters
+    return model.layers[i_layer]
+
+
+def split_evenly(n_total, n_parts):
+    """
+    Break n_total into n_parts integers that differ by at most one.
+    """
+    return [
+        n_total // n_parts + (1 if i_part < n_total % n_parts else 0)
+        for i_part in range(n_parts)
+    ]
+
+
+def train_hogwild(model, get_training_set, n_workers=None):
+    """
+    Train the model with several worker processes at once, Hogwild style.
+    The weights live in shared memory, and each worker applies its
+    updates to them directly, without any locking.
+
+    model: ANN
+        Its n_iter_train examples are divided among the workers.
+    get_training_set: function
+        Each worker calls this once to create its own training data set.
+        On platforms where new processes are spawned rather than
+        forked (Windows and macOS), it has to be a module-level
+        function so that it can be pickled.
+    n_workers: int
+        Defaults to the number of CPUs.
+
+    Each worker has its own copy of the optimizers, so optimizer state,
+    like momentum, isn't shared. Plain SGD is the classic choice here.
+    Reports and visualizations aren't generated while the workers run.
+    The performance report is updated once at the end.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if model.execution_plan is None:
+        model.compile()
+
+    n_iter_workers = split_evenly(model.n_iter_train, n_workers)
+    # Draw the worker seeds here, so that they follow the parent's seed.
+    seeds = np.random.randint(2 ** 31, size=n_workers)
+
+    shared_weights = share_weights(model)
+    results = mp.Queue()
+    workers = []
+    try:
+        for i_worker in range(n_workers):
+            worker = mp.Process(
+                target=run_hogwild_worker,
+                args=(
+                    i_worker,
+                    model,
+                    shared_weights,
+                    get_training_set,
+                    n_iter_workers[i_worker],
+                    seeds[i_worker],
+                    results,
+                ),
+            )
+            worker.start()
+            workers.append(worker)
+
+        # Collect the results before joining, so that no worker is left
+        # blocked trying to hand over a large error history.
+        histories = [None] * n_workers
+        errors = []
+        for _ in range(n_workers):
+            i_worker, history, error = get_result(results, workers)
+            histories[i_worker] = history
+            if error is not None:
+                errors.append(error)
+        for worker in workers:
+            worker.join()
+    finally:
+        unshare_weights(model, shared_weights)
+
+    if len(errors) > 0:
+        raise RuntimeError(
+            "A Hogwild worker failed.\n" + "\n".join(errors))
+
+    model.error_history.merge(histories)
+    model.i_iter += model.n_iter_train
+    if model.verbose:
+        model.report_performance()
+        model.reporter.flush()
+    model.report_profile()
+    return model.error_history
+
+
+def get_result(results, workers, poll_interval=1):
+    """
+    Wait for the next worker result, but don't wait forever
+    on a worker that died without sending one.
+    """
+    while True:
+        try:
+            return results.get(timeout=poll_interval)
+        except queue.Empty:
+            for worker in workers:
+                if worker.exitcode not in (None, 0):
+                    raise RuntimeError(
+                        f"Worker process {worker.pid} exited"
+                        + f" with code {worker.exitcode}.")
+
+
+def run_hogwild_worker(
+    i_worker,
+    model,
+    shared_weights,
+    get_training_set,
+    n_iter,
+    seed,
+    results,
+):
+    """
+    Train a model on its own data, with its weights in shared memory.
+    """
+    history = None
+    error = None
+    try:
+        np.random.seed(seed)
+        attach_weights(model, shared_weights)
+        model.verbose = False
+        model.error_history = ErrorHistory(
+            bin_size=model.error_history.bin_size)
+        model.n_iter_train = n_iter
+        history = model.train(get_training_set())
+    except Exception:
+        error = traceback.format_exc()
+    results.put((i_worker, history, error))
+
+
+def train_data_parallel(model, training_set, n_workers=None):
+    """
+    Train the model with each batch split across several worker processes.
+
+    Every worker holds a replica of the model. Its weights are views into
+    shared memory, so they always match the original. For each batch,
+    each worker finds the gradient for its share of the examples.
+    The gradients are averaged in a fixed order, and the model's own
+    regularizers and optimizer take one step for the whole batch.
+    Apart from dropout, which each worker draws for itself,
+    the results match training on the same batches in a single process.
+
+    model: ANN
+        model.batch_size examples are split across the workers each step.
+    training_set: Dataset or generator
+        The examples are drawn here, in the parent process.
+    n_workers: int
+        Defaults to the number of CPUs.
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if model.execution_plan is None:
+        model.compile()
+    n_inputs = model.layers[0].x.shape[1]
+    # Seed the workers from the parent's random state, but without
+    # advancing it, so that the training data drawn here is the same
+    # as it would be in a single process.
+    random_state = np.random.RandomState()
+    random_state.set_state(np.random.get_state())
+    seeds = random_state.randint(2 ** 31, size=n_workers)
+
+    shared_weights = share_weights(model)
+    shared_inputs = SharedArray((model.batch_size, n_inputs), model.dtype)
+    shared_errors = SharedArray((model.batch_size,), model.dtype)
+    # Each worker gets its own slot to write its gradients into.
+    shared_gradients = {
+        i_layer: SharedArray(
+            (n_workers,) + shared.shape, dtype=shared.dtype)
+        for i_layer, shared in shared_weights.items()
+    }
+
+    connections = []
+    workers = []
+    try:
+        for i_worker in range(n_workers):
+            parent_end, worker_end = mp.Pipe()
+            worker = mp.Process(
+                target=run_data_parallel_worker,
+                args=(
+                    i_worker,
+                    n_workers,
+                    model,
+                    shared_weights,
+                    shared_inputs,
+                    shared_errors,
+                    shared_gradients,
+                    seeds[i_worker],
+                    worker_end,
+                ),
+            )
+            worker.start()
+            connections.append(parent_end)
+            workers.append(worker)
+
+        for i_example in range(0, model.n_iter_train, model.batch_size):
+            n_examples = min(
+                model.batch_size, model.n_iter_train - i_example)
+            model.i_iter += n_examples
+            x = model.next_batch(training_set, n_examples)
+            shared_inputs.array[:n_examples] = x
+
+            for connection in connections:
+                connection.send(n_examples)
+            for connection in connections:
+                error = connection.recv()
+                if error is not None:
+                    raise RuntimeError(
+                        "A data parallel worker failed.\n" + error)
+
+            # Average the workers' gradients, weighted by how many
+            # examples each one handled. Always adding them up in the
+            # same order keeps the results reproducible.
+            n_shards = split_evenly(n_examples, n_workers)
+            for i_layer, gradients in shared_gradients.items():
+                owner = get_owner(model, i_layer)
+                owner.de_dw.fill(0)
+                for i_worker, n_shard in enumerate(n_shards):
+                    if n_shard > 0:
+                        owner.de_dw += (
+                            gradients.array[i_worker] * (n_shard / n_examples))
+                # The workers' gradients may each have had
+                # different active rows.
+                owner.i_active_rows = None
+                owner.update_weights()
+
+            model.error_history.extend(shared_errors.array[:n_examples])
+
+            if model.is_due(model.report_interval, n_examples) and (
+                model.verbose
+            ):
+                model.report_performance()
+
+            if model.is_due(model.viz_interval, n_examples) and (
+                model.verbose
+            ):
+                if model.printer is not None:
+                    model.printer.render(
+                        model,
+                        x[-1],
+                        model.reports_path,
+                        f"train_{model.i_iter:08d}")
+    finally:
+        for connection in connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in workers:
+            worker.join()
+        unshare_weights(model, shared_weights)
+        shared_inputs.unlink()
+        shared_errors.unlink()
+        for gradients in shared_gradients.values():
+            gradients.unlink()
+
+    model.catch_up_weights()
+    model.reporter.flush()
+    model.report_profile()
+    return model.error_history
+
+
+def run_data_parallel_worker(
+    i_worker,
+    n_workers,
+    model,
+    shared_weights,
+    shared_inputs,
+    shared_errors,
+    shared_gradients,
+    seed,
+    connection,
+):
+    """
+    Wait for the number of examples in the next batch, find the gradients
+    for this worker's share of them, and report back.
+    A None tells the worker to stop.
+    """
+    np.random.seed(seed)
+    attach_weights(model, shared_weights)
+    model.verbose = False
+    while True:
+        n_examples = connection.recv()
+        if n_examples is None:
+            break
+        try:
+            n_shards = split_evenly(n_examples, n_workers)
+            i_start = sum(n_shards[:i_worker])
+            i_stop = i_start + n_shards[i_worker]
+            if i_stop > i_start:
+                y = model.forward_pass(shared_inputs.array[i_start:i_stop])
+                shared_errors.array[i_start:i_stop] = (
+                    model.error_function.calc(y))
+                model.backward_pass(
+                    model.error_function.calc_d(y), update=False)
+                for i_layer, gradients in shared_gradients.items():
+                    gradients.array[i_worker] = (
+                        get_owner(model, i_layer).de_dw)
+            connection.send(None)
+        except Exception:
+            connection.send(traceback.format_exc())
@@ -0,0 +1,165 @@
+"""
+Keep all of a model's trainable weights in one flat, contiguous array.
+
+Each trainable layer's weights and de_dw become views into a slice of
+a single parameter vector and a single gradient vector. The layers
+work on them just as before, but after the backward pass
+one optimizer step updates the whole model at once,
+rather than one step per layer.
+
+To use in a script:
+
+    model = ANN(layers=layers, flat_parameters=True)
+
+All the trainable layers need to use the same kind of optimizer,
+with the same settings, and it can't be a lazy one, like LazyAdam.
+The regularizers are still applied layer by layer, since they work
+on the views in place.
+"""
+import copy
+import numpy as np
+
+
+class ParameterBuffer(object):
+    def __init__(self, layers, i_layers):
+        """
+        layers: list of layers
+        i_layers: list of int
+            The indices of the trainable layers whose weights
+            will be moved into the buffer.
+        """
+        self.layers = layers
+        self.i_layers = list(i_layers)
+        # Like a layer's, for the benefit of the optimizer.
+        # The flat gradient is never treated as sparse.
+        self.i_active_rows = None
+
+        trainable = [self.layers[i_layer] for i_layer in self.i_layers]
+        if len(trainable) == 0:
+            raise ValueError("There are no trainable layers to gather.")
+        optimizer_types = set(type(layer.optimizer) for layer in trainable)
+        optimizer_settings = [
+            layer.optimizer.get_settings() for layer in trainable]
+        if len(optimizer_types) > 1 or any(
+            settings != optimizer_settings[0]
+            for settings in optimizer_settings
+        ):
+            raise ValueError(
+                "flat_parameters needs all the trainable layers to have"
+                + " the same kind of optimizer, with the same settings.")
+        if trainable[0].optimizer.lazy:
+            raise ValueError(
+                "Lazy optimizers update each layer's weights row by row,"
+                + " so they can't be used with flat_parameters.")
+
+        self.dtype = trainable[0].weights.dtype
+        self.shapes = [layer.weights.shape for layer in trainable]
+        sizes = [int(np.prod(shape)) for shape in self.shapes]
+        # Each layer's slice of the buffer runs from
+        # starts[i] up to starts[i + 1].
+        self.starts = np.cumsum([0] + sizes)
+        self.size = int(self.starts[-1])
+
+        weights = np.concatenate(
+            [layer.weights.ravel() for layer in trainable]).astype(
+                self.dtype, copy=False)
+        self.de_dw = np.zeros(self.size, dtype=self.dtype)
+        self.attach(weights)
+
+        # One optimizer for the whole buffer, picking up any state
+        # the layers' own optimizers have built up so far.
+        self.optimizer = copy.deepcopy(trainable[0].optimizer)
+        self.gather_optimizer_states()
+
+    def __str__(self):
+        str_parts = [
+            "flat parameter buffer",
+            f"number of parameters: {self.size}",
+            f"layers: {self.i_layers}",
+        ]
+        return "\n".join(str_parts)
+
+    def __setstate__(self, state):
+        # Pickling doesn't keep track of which arrays are views
+        # into which, so hook the layers back up after unpickling.
+        self.__dict__.update(state)
+        self.attach(self.weights)
+
+    def attach(self, weights):
+        """
+        Make weights, a flat array, the buffer's parameter vector,
+        and point each layer's weights and de_dw at its slice.
+        """
+        self.weights = weights
+        for i_slot, i_layer in enumerate(self.i_layers):
+            layer = self.layers[i_layer]
+            i_start = self.starts[i_slot]
+            i_stop = self.starts[i_slot + 1]
+            layer.weights = self.weights[i_start:i_stop].reshape(
+                self.shapes[i_slot])
+            layer.de_dw = self.de_dw[i_start:i_stop].reshape(
+                self.shapes[i_slot])
+            # The rows of de_dw that might be nonzero. See Dense.
+            layer.i_gradient_rows = None
+
+    def update_weights(self):
+        """
+        Adjust all the weights at once based on de_dw, with regularization.
+        """
+        regularized_layers = [
+            self.layers[i_layer] for i_layer in self.i_layers
+            if len(getattr(self.layers[i_layer], "regularizers", [])) > 0
+        ]
+        for layer in regularized_layers:
+            for regularizer in layer.regularizers:
+                regularizer.pre_optim_update(layer)
+            # A regularizer can make any row of de_dw nonzero.
+            if getattr(layer, "i_active_rows", None) is None:
+                layer.i_gradient_rows = None
+
+        self.optimizer.update(self)
+
+        for layer in regularized_layers:
+            for regularizer in layer.regularizers:
+                regularizer.post_optim_update(layer)
+
+    def gather_optimizer_states(self):
+        """
+        Join up the layers' optimizer states into one for the buffer.
+        Arrays are concatenated. Everything else, like the number of
+        steps taken, is the same for all of them, and is taken
+        from the first layer.
+        """
+        layer_states = [
+            self.layers[i_layer].optimizer.get_state()
+            for i_layer in self.i_layers
+        ]
+        state = dict(layer_states[0])
+        for key, value in state.items():
+            if isinstance(value, np.ndarray):
+                if any(
+                    not isinstance(layer_state[key], np.ndarray)
+                    for layer_state in layer_states
+                ):
+                    raise ValueError(
+                        f"Only some of the layers' optimizers have a {key}.")
+                state[key] = np.concatenate([
+                    layer_state[key].ravel() for layer_state in layer_states
+                ]).astype(self.dtype, copy=False)
+        self.optimizer.set_state(state)
+
+    def scatter_optimizer_states(self):
+        """
+        Hand each layer's optimizer its share of the buffer's
+        optimizer state, as views, so that the layers can be saved
+        or trained on their own again.
+        """
+        state = self.optimizer.get_state()
+        for i_slot, i_layer in enumerate(self.i_layers):
+            layer_state = dict(state)
+            for key, value in state.items():
+                if isinstance(value, np.ndarray) and value.size == self.size:
+                    layer_state[key] = value[
+                        self.starts[i_slot]: self.starts[i_slot + 1]
+                    ].reshape(self.shapes[i_slot])
+            self.layers[i_layer].optimizer.set_state(layer_state)
@@ -0,0 +1,336 @@
+"""
+Find out where the time, and optionally the memory, goes during training.
+
+To use in a script:
+
+    model = ANN(layers=layers, profile=True)
+    model.train(training_set)
+    print(model.profiler)
+
+With profile=True, the model times every call to each layer's
+forward_pass() and backward_pass(), each optimizer's update(),
+each regularizer's pre_optim_update() and post_optim_update(),
+the error function, the error history, and its own next_batch(),
+report_performance(), and printer.
+At the end of train() and evaluate() the results are written
+to profile.txt in the reports directory, if the model is verbose.
+
+With track_memory=True, the same calls are also followed with Python's
+tracemalloc, which sees numpy's array allocations too. For each call
+it notes how many bytes were still allocated when it finished,
+and how far above its starting point the allocations peaked.
+Memory that a call hands back, like a new batch of inputs,
+counts as kept by that call, even if it's let go of later.
+Anything that keeps growing from one training step to the next
+shows up as kept memory, and in the growth of the traced memory
+since profiling started. Tracing allocations slows everything down
+a lot, so times taken while tracking memory are only rough.
+See cottonwood/core/memory.py for the sizes of the arrays the model holds.
+
+The timed methods are replaced by TimedMethod wrappers on the
+individual objects, not on their classes. When profiling is off,
+nothing is wrapped, and nothing is slowed down.
+
+Calls can be nested. An optimizer update happens inside its layer's
+backward pass, for instance. Each call's own time leaves out
+the time spent in any timed calls inside it, so that the own times
+add up to the total time spent in all of them. The same goes
+for the memory each call keeps.
+
+Time and memory used in other processes, like Hogwild or data parallel
+workers, aren't included.
+"""
+import inspect
+import time
+import tracemalloc
+import numpy as np
+from cottonwood.core.memory import format_bytes
+
+PROFILE_REPORT_NAME = "profile.txt"
+
+# The positions of the measurements in each record.
+N_CALLS = 0
+TOTAL_SECONDS = 1
+OWN_SECONDS = 2
+TOTAL_BYTES = 3
+OWN_BYTES = 4
+PEAK_BYTES = 5
+# The positions of the measurements in each Call's memory array
+START = 0
+PEAK = 1
+NESTED = 2
+
+
+class Profiler(object):
+    def __init__(self, track_memory=False):
+        """
+        track_memory: boolean
+            If True, start tracemalloc, if it isn't already running,
+            and follow the allocations made during each timed call.
+        """
+        self.track_memory = track_memory
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # For each (component, activity), the number of calls, the total
+        # and own time, the total and own bytes kept, and the highest
+        # peak above the starting point of any one call.
+        self.records = {}
+        # A Call for each timed call that's currently running,
+        # innermost last.
+        self.running = []
+        self.start_time = time.perf_counter()
+        self.start_memory, _ = self.get_memory()
+        self.peak_memory = self.start_memory
+
+    def __str__(self):
+        str_parts = []
+        if self.track_memory:
+            str_parts.append(
+                "Times include the overhead of tracing memory allocations.")
+        str_parts.append(self.format_table(
+            {f"{component}: {activity}": record
+             for (component, activity), record in self.records.items()},
+            "where"))
+        str_parts.append("")
+        str_parts.append(self.format_table(
+            self.summarize(lambda key: key[0]), "component"))
+
+        elapsed = time.perf_counter() - self.start_time
+        total_own = sum(
+            record[OWN_SECONDS] for record in self.records.values())
+        str_parts.append("")
+        str_parts.append(
+            f"timed: {total_own:.3f} s of {elapsed:.3f} s"
+            + " since profiling started")
+        if self.track_memory:
+            memory, _ = self.get_memory()
+            str_parts.append(
+                f"traced memory: {format_bytes(memory)} now,"
+                + f" {format_bytes(self.start_memory)} when profiling started,"
+                + f" {format_bytes(self.peak_memory)} at its highest")
+        return "\n".join(str_parts)
+
+    def format_table(self, records, heading):
+        total_own = sum(record[OWN_SECONDS] for record in records.values())
+        header = (
+            f"{heading:<48}{'calls':>9}{'total s':>10}{'own s':>10}"
+            + f"{'ms/call':>10}{'share':>8}")
+        if self.track_memory:
+            header += f"{'kept/call':>12}{'peak':>12}"
+        str_parts = [header]
+        for label, record in sorted(
+            records.items(), key=lambda item: -item[1][OWN_SECONDS]
+        ):
+            n_calls = record[N_CALLS]
+            share = record[OWN_SECONDS] / total_own if total_own > 0 else 0
+            line = (
+                f"{label:<48}{n_calls:>9d}{record[TOTAL_SECONDS]:>10.3f}"
+                + f"{record[OWN_SECONDS]:>10.3f}"
+                + f"{1000 * record[TOTAL_SECONDS] / max(n_calls, 1):>10.3f}"
+                + f"{share:>8.1%}")
+            if self.track_memory:
+                line += (
+                    f"{format_bytes(record[OWN_BYTES] / max(n_calls, 1)):>12}"
+                    + f"{format_bytes(record[PEAK_BYTES]):>12}")
+            str_parts.append(line)
+        return "\n".join(str_parts)
+
+    def summarize(self, get_group):
+        """
+        Add up the records by group, where get_group() takes
+        a (component, activity) key and returns its group.
+        """
+        summary = {}
+        for key, record in self.records.items():
+            group = get_group(key)
+            if group not in summary:
+                summary[group] = [0, 0.0, 0.0, 0, 0, 0]
+            group_record = summary[group]
+            for i_value in (
+                N_CALLS, TOTAL_SECONDS, OWN_SECONDS, TOTAL_BYTES, OWN_BYTES
+            ):
+                group_record[i_value] += record[i_value]
+            group_record[PEAK_BYTES] = max(
+                group_record[PEAK_BYTES], record[PEAK_BYTES])
+        return summary
+
+    def reset(self):
+        self.__init__(track_memory=self.track_memory)
+
+    def wrap(self, owner, method_name, component, activity):
+        """
+        Time every call to owner.method_name(), and record it
+        under (component, activity). The component is the layer,
+        or other part of the model, and the activity is what it's doing.
+        A method that's already being timed is left alone.
+        """
+        if owner is None or isinstance(owner, type):
+            return
+        # A copy of a wrapped object, like the optimizer of a flat
+        # parameter buffer, comes with a copy of the profiler too.
+        # Point it back at this one.
+        timed_method = owner.__dict__.get(method_name)
+        if (
+            isinstance(timed_method, TimedMethod)
+            and timed_method.profiler is self
+            and timed_method.owner is owner
+        ):
+            return
+        setattr(owner, method_name, TimedMethod(
+            self, owner, method_name, (component, activity)))
+
+    def get_memory(self):
+        """
+        The number of bytes allocated now, and the most that have been
+        allocated since the peak was last reset.
+        """
+        if self.track_memory and tracemalloc.is_tracing():
+            return tracemalloc.get_traced_memory()
+        return 0, 0
+
+    def start_call(self):
+        # Make the Call, and note the time, before measuring the memory,
+        # so that they aren't counted as part of what the call allocates.
+        call = Call()
+        self.running.append(call)
+        call.start_time = time.perf_counter()
+        memory, peak = self.get_memory()
+        if len(self.running) > 1:
+            caller = self.running[-2]
+            caller.memory[PEAK] = max(caller.memory[PEAK], peak)
+        # tracemalloc only keeps one peak, so it's reset at the start
+        # of each call, after handing the peak so far to the caller.
+        # reset_peak() is new in Python 3.9. Before that, the peaks
+        # reported are the highest since tracing started.
+        if self.track_memory and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        call.memory[START] = memory
+        call.memory[PEAK] = memory
+        return call
+
+    def end_call(self, key, call):
+        n_seconds = time.perf_counter() - call.start_time
+        memory, peak = self.get_memory()
+        self.running.pop()
+        start_memory = int(call.memory[START])
+        peak = max(peak, int(call.memory[PEAK]))
+        n_bytes = memory - start_memory
+        if len(self.running) > 0:
+            caller = self.running[-1]
+            caller.nested_seconds[0] += n_seconds
+            caller.memory[NESTED] += n_bytes
+            caller.memory[PEAK] = max(caller.memory[PEAK], peak)
+        else:
+            self.peak_memory = max(self.peak_memory, peak)
+
+        record = self.records.get(key)
+        if record is None:
+            record = [0, 0.0, 0.0, 0, 0, 0]
+            self.records[key] = record
+        record[N_CALLS] += 1
+        record[TOTAL_SECONDS] += n_seconds
+        record[OWN_SECONDS] += n_seconds - float(call.nested_seconds[0])
+        record[TOTAL_BYTES] += n_bytes
+        record[OWN_BYTES] += n_bytes - int(call.memory[NESTED])
+        record[PEAK_BYTES] = max(
+            record[PEAK_BYTES], peak - start_memory)
+
+    def write_report(self, path):
+        with open(path, "w") as profile_file:
+            profile_file.write(str(self) + "\n")
+
+
+class Call(object):
+    """
+    What there is to keep track of while a timed call is running.
+    """
+    def __init__(self):
+        self.start_time = None
+        # The bytes allocated at the start, the peak so far, and the bytes
+        # kept by timed calls inside this one. Like the time spent in
+        # those calls, they're kept in arrays, rather than as Python
+        # numbers, so that updating them doesn't allocate anything.
+        self.memory = np.zeros(3, dtype=np.int64)
+        self.nested_seconds = np.zeros(1)
+
+
+class TimedMethod(object):
+    """
+    Stands in for a method on one particular object,
+    and times each call to it.
+
+    It looks the method up on the object's class, rather than
+    holding on to a bound method when it's pickled, so that it
+    can be pickled along with the object.
+    """
+    def __init__(self, profiler, owner, method_name, key):
+        self.profiler = profiler
+        self.owner = owner
+        self.method_name = method_name
+        self.key = key
+        self.method = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["method"] = None
+        return state
+
+    def __call__(self, *args, **kwargs):
+        if self.method is None:
+            # Binding it this way works for static methods too,
+            # like the error functions'.
+            self.method = inspect.getattr_static(
+                type(self.owner), self.method_name
+            ).__get__(self.owner, type(self.owner))
+        call = self.profiler.start_call()
+        try:
+            return self.method(*args, **kwargs)
+        finally:
+            self.profiler.end_call(self.key, call)
+
+
+def instrument(model):
+    """
+    Wrap everything in the model that's worth timing.
+    It's safe to call again, after layers or a parameter buffer
+    have been added. Only the new parts get wrapped.
+    """
+    profiler = model.profiler
+    profiler.wrap(model, "next_batch", "data", "next batch")
+    profiler.wrap(model, "report_performance", "reporting", "performance")
+    profiler.wrap(model.printer, "render", "reporting", "visualization")
+    profiler.wrap(model.error_function, "calc", "error function", "calc")
+    profiler.wrap(model.error_function, "calc_d", "error function", "calc_d")
+    profiler.wrap(model.error_history, "extend", "error history", "extend")
+
+    for i_layer, layer in enumerate(model.layers or []):
+        component = f"layer {i_layer} {type(layer).__name__}"
+        profiler.wrap(layer, "forward_pass", component, "forward")
+        profiler.wrap(layer, "backward_pass", component, "backward")
+        profiler.wrap(
+            getattr(layer, "optimizer", None),
+            "update",
+            component,
+            "optimizer update")
+        for i_regularizer, regularizer in enumerate(
+            getattr(layer, "regularizers", [])
+        ):
+            regularizer_name = (
+                f"regularizer {i_regularizer} {type(regularizer).__name__}")
+            profiler.wrap(
+                regularizer,
+                "pre_optim_update",
+                component,
+                regularizer_name + " before update")
+            profiler.wrap(
+                regularizer,
+                "post_optim_update",
+                component,
+                regularizer_name + " after update")
+
+    if model.parameters is not None:
+        profiler.wrap(
+            model.parameters.optimizer,
+            "update",
+            "flat parameters",
+            "optimizer update")
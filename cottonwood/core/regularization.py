@@ -2,6 +2,9 @@ import numpy as np
 
 
 class GenericRegularizer:
+    # A scratch array for intermediate results. See get_workspace().
+    workspace = None
+
     def __init__(self):
         pass
 
@@ -11,6 +14,31 @@ class GenericRegularizer:
     def post_optim_update(self, layer):
         pass
 
+    def get_state(self):
+        """
+        Gather up the regularizer's settings as a dictionary.
+        """
+        return {}
+
+    def set_state(self, state):
+        """
+        Restore the settings that get_state() gathered.
+        """
+        pass
+
+    def get_workspace(self, like):
+        """
+        Keep a scratch array around for intermediate results,
+        so that each update doesn't have to allocate a new one.
+        """
+        if (
+            self.workspace is None
+            or self.workspace.shape != like.shape
+            or self.workspace.dtype != like.dtype
+        ):
+            self.workspace = np.zeros_like(like)
+        return self.workspace
+
 
 class L1(GenericRegularizer):
     def __init__(self, regularization_amount=1e-2):
@@ -23,8 +51,20 @@ class L1(GenericRegularizer):
         ]
         return "\n".join(str_parts)
 
+    def get_state(self):
+        return {"regularization_amount": self.regularization_amount}
+
+    def set_state(self, state):
+        self.regularization_amount = state["regularization_amount"]
+
     def pre_optim_update(self, layer):
-        layer.de_dw += np.sign(layer.weights) * self.regularization_amount
+        # de_dw += sign(weights) * regularization_amount
+        penalty = self.get_workspace(layer.weights)
+        np.sign(layer.weights, out=penalty)
+        penalty *= self.regularization_amount
+        layer.de_dw += penalty
+        # Every row of the gradient is nonzero now.
+        layer.i_active_rows = None
 
 
 class L2(GenericRegularizer):
@@ -38,8 +78,20 @@ class L2(GenericRegularizer):
         ]
         return "\n".join(str_parts)
 
+    def get_state(self):
+        return {"regularization_amount": self.regularization_amount}
+
+    def set_state(self, state):
+        self.regularization_amount = state["regularization_amount"]
+
     def pre_optim_update(self, layer):
-        layer.de_dw += 2 * layer.weights * self.regularization_amount
+        # de_dw += 2 * weights * regularization_amount
+        penalty = self.get_workspace(layer.weights)
+        np.multiply(
+            layer.weights, 2 * self.regularization_amount, out=penalty)
+        layer.de_dw += penalty
+        # Every row of the gradient is nonzero now.
+        layer.i_active_rows = None
 
 
 class Limit(GenericRegularizer):
@@ -53,6 +105,16 @@ class Limit(GenericRegularizer):
         ]
         return "\n".join(str_parts)
 
+    def get_state(self):
+        return {"weight_limit": self.weight_limit}
+
+    def set_state(self, state):
+        self.weight_limit = state["weight_limit"]
+
     def post_optim_update(self, layer):
-        layer.weights = np.minimum(self.weight_limit, layer.weights)
-        layer.weights = np.maximum(-self.weight_limit, layer.weights)
+        # Clip in place, so that the weights array itself is preserved.
+        np.clip(
+            layer.weights,
+            -self.weight_limit,
+            self.weight_limit,
+            out=layer.weights)
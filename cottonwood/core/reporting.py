@@ -0,0 +1,117 @@
+"""
+Make reports in a background thread, so that training doesn't have to
+stop and wait while plots are drawn and saved.
+
+The training loop hands off a small snapshot of whatever the report
+needs. The snapshot waits in a queue with room for just one.
+If a new one arrives before the last one has been picked up,
+the old one is dropped. Each report shows the whole history up to
+that point, so the newer one covers everything the older one would have.
+"""
+import os
+import queue
+import threading
+import traceback
+import numpy as np
+# Use matplotlib's object-oriented interface rather than pyplot.
+# pyplot keeps global state, and isn't safe to use from a second thread.
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+class Reporter(object):
+    """
+    Run report jobs, one at a time, in a background thread.
+    The thread starts on the first submit().
+
+    A Reporter can be pickled along with a model, for instance
+    to send it to another process. The copy starts out fresh,
+    with nothing in the queue and no thread running.
+    """
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=1)
+        self.thread = None
+        self.error = None
+        self.n_dropped = 0
+
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def submit(self, function, *args):
+        """
+        Queue up a call to function(*args). If a previous job is
+        still waiting, it gets replaced.
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+        while True:
+            try:
+                self.queue.put_nowait((function, args))
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.n_dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        while True:
+            function, args = self.queue.get()
+            try:
+                function(*args)
+            except Exception:
+                self.error = traceback.format_exc()
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """
+        Wait for the queued job, if any, to finish.
+        If a job failed, the error gets raised here.
+        """
+        if self.thread is not None:
+            self.queue.join()
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise RuntimeError("Making a report failed.\n" + error)
+
+
+def plot_performance(
+    bin_means,
+    bin_size,
+    report_min,
+    report_max,
+    filename,
+):
+    """
+    Create a plot of the error history, binned and on a log scale.
+    """
+    error_history = np.log10(bin_means + 1e-10)
+    ymin = np.minimum(report_min, np.min(error_history))
+    ymax = np.maximum(report_max, np.max(error_history))
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.gca()
+    ax.plot(
+        np.arange(len(error_history)) + 1,
+        error_history,
+        color="blue",
+    )
+    ax.set_xlabel(f"x{bin_size:,} iterations")
+    ax.set_ylabel("log error")
+    ax.set_ylim(ymin, ymax)
+    ax.grid()
+    # Write to a temporary file first and then swap it in, so that
+    # nobody looking at the report ever sees a half-written one.
+    root, extension = os.path.splitext(filename)
+    temp_filename = root + "_partial" + extension
+    fig.savefig(temp_filename)
+    os.replace(temp_filename, filename)
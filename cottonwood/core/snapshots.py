@@ -0,0 +1,235 @@
+"""
+Record snapshots of a model while it trains, and render them later.
+
+Rendering a visualization can take much longer than a training step.
+A SnapshotRecorder stands in for a printer. Instead of drawing
+anything, it appends the inputs and the current weights to a log file,
+and training carries on. Afterward, render_snapshots() reads the log
+back and hands each snapshot to the real printer, spread across
+a pool of processes.
+
+To use in a script:
+
+    recorder = SnapshotRecorder(printer)
+    model = ANN(layers=layers, printer=recorder)
+    model.train(training_set)
+    render_snapshots(recorder.log_path)
+
+or from the command line:
+
+    python3 -m cottonwood.examples.autoencoder.render_snapshots <log_path>
+
+The log starts with a pickled copy of the model and the printer,
+followed by a series of arrays written with np.save(). Each snapshot
+is the frame name, the inputs, the weights of each trainable layer,
+and then the state of the other layers, from their get_state().
+Some of those change during training too, like the statistics of
+a FeatureNormalization with update_during_training=True.
+Only open logs from sources you trust, since unpickling
+can run arbitrary code.
+"""
+import copy
+import multiprocessing as mp
+import os
+import pickle
+import numpy as np
+
+LOG_FILENAME = "snapshots.log"
+
+
+class SnapshotRecorder(object):
+    def __init__(self, printer, log_filename=LOG_FILENAME):
+        """
+        printer: object with a render(nn, inputs, savedir, name) method
+            The printer that will eventually render the snapshots.
+        log_filename: str
+            The name of the log file. It goes in the savedir
+            passed to render(), usually the model's reports directory.
+        """
+        self.printer = printer
+        self.log_filename = log_filename
+        self.log_path = None
+        self.log_file = None
+        self.i_layers = None
+        self.state_keys = None
+
+    def __getstate__(self):
+        # An open file can't be pickled. A copy starts out
+        # without a log, and opens a new one on its first render().
+        state = self.__dict__.copy()
+        state["log_path"] = None
+        state["log_file"] = None
+        return state
+
+    def render(self, nn, inputs, savedir=".", name=""):
+        """
+        Append a snapshot to the log.
+        This has the same signature as a printer's render().
+        """
+        if self.log_file is None:
+            self.start_log(nn, savedir)
+        np.save(self.log_file, np.array(name))
+        np.save(self.log_file, np.asarray(inputs))
+        for i_layer in self.i_layers:
+            np.save(self.log_file, nn.layers[i_layer].weights)
+        for i_layer, key_path in self.state_keys:
+            value = nn.layers[i_layer].get_state()
+            for key in key_path:
+                value = value[key]
+            np.save(self.log_file, np.asarray(value))
+        self.log_file.flush()
+
+    def start_log(self, nn, savedir):
+        os.makedirs(savedir, exist_ok=True)
+        self.log_path = os.path.join(savedir, self.log_filename)
+        self.log_file = open(self.log_path, "wb")
+        self.i_layers = [
+            i_layer for i_layer, layer in enumerate(nn.layers)
+            if getattr(layer, "trainable", False)
+        ]
+        # For every other layer, where to find each of the values
+        # in its state, as (i_layer, key path) pairs.
+        self.state_keys = []
+        for i_layer, layer in enumerate(nn.layers):
+            if i_layer not in self.i_layers:
+                for key_path in find_key_paths(layer.get_state()):
+                    self.state_keys.append((i_layer, key_path))
+
+        # Leave the recorder itself out of the model that gets saved.
+        model = copy.copy(nn)
+        model.printer = None
+        pickle.dump({
+            "model": model,
+            "printer": self.printer,
+            "i_layers": self.i_layers,
+            "state_keys": self.state_keys,
+        }, self.log_file)
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+
+def find_key_paths(state):
+    """
+    List the keys leading to each value in a nested state dictionary.
+    """
+    key_paths = []
+    for key, value in state.items():
+        if isinstance(value, dict):
+            key_paths += [(key,) + path for path in find_key_paths(value)]
+        else:
+            key_paths.append((key,))
+    return key_paths
+
+
+def read_header(log_file):
+    """
+    Returns the header dictionary, and the position in the file of the
+    start of each snapshot.
+    """
+    header = pickle.load(log_file)
+    n_arrays = 2 + len(header["i_layers"]) + len(header["state_keys"])
+    log_size = os.fstat(log_file.fileno()).st_size
+
+    # Step through the arrays, reading just enough of each one
+    # to know how far to skip ahead.
+    snapshot_positions = []
+    i_array = 0
+    while True:
+        position = log_file.tell()
+        try:
+            version = np.lib.format.read_magic(log_file)
+            if version == (1, 0):
+                shape, _, dtype = np.lib.format.read_array_header_1_0(
+                    log_file)
+            else:
+                shape, _, dtype = np.lib.format.read_array_header_2_0(
+                    log_file)
+        except ValueError:
+            # The end of the file, or a snapshot that was cut off.
+            break
+        log_file.seek(int(np.prod(shape)) * dtype.itemsize, os.SEEK_CUR)
+        if log_file.tell() > log_size:
+            break
+        if i_array % n_arrays == 0:
+            snapshot_positions.append(position)
+        i_array += 1
+
+    # Leave off a final snapshot that didn't get completely written.
+    if i_array % n_arrays != 0:
+        snapshot_positions.pop()
+    return header, snapshot_positions
+
+
+def render_snapshots(log_path, savedir=None, n_processes=None):
+    """
+    Render every snapshot in a log, in parallel.
+
+    log_path: str
+    savedir: str
+        Where to put the rendered images. Defaults to the directory
+        the log is in.
+    n_processes: int
+        Defaults to the number of CPUs. With 1, all the rendering
+        happens in this process.
+
+    Returns the number of snapshots rendered.
+    """
+    if savedir is None:
+        savedir = os.path.dirname(log_path)
+    with open(log_path, "rb") as log_file:
+        _, snapshot_positions = read_header(log_file)
+
+    if n_processes == 1:
+        start_renderer(log_path, savedir)
+        for position in snapshot_positions:
+            render_snapshot(position)
+        renderer["log_file"].close()
+    else:
+        with mp.Pool(
+            n_processes,
+            initializer=start_renderer,
+            initargs=(log_path, savedir),
+        ) as pool:
+            # Consume the results to surface any errors.
+            for _ in pool.imap_unordered(render_snapshot, snapshot_positions):
+                pass
+    return len(snapshot_positions)
+
+
+# Each rendering process loads the model and the printer once,
+# and keeps them here.
+renderer = {}
+
+
+def start_renderer(log_path, savedir):
+    log_file = open(log_path, "rb")
+    header = pickle.load(log_file)
+    renderer.update(header)
+    renderer["log_file"] = log_file
+    renderer["savedir"] = savedir
+
+
+def render_snapshot(position):
+    log_file = renderer["log_file"]
+    model = renderer["model"]
+    log_file.seek(position)
+    name = str(np.load(log_file))
+    inputs = np.load(log_file)
+    for i_layer in renderer["i_layers"]:
+        np.copyto(model.layers[i_layer].weights, np.load(log_file))
+    states = {}
+    for i_layer, key_path in renderer["state_keys"]:
+        value = np.load(log_file)
+        if value.ndim == 0:
+            # Plain numbers go back to being plain numbers.
+            value = value.item()
+        state = states.setdefault(i_layer, {})
+        for key in key_path[:-1]:
+            state = state.setdefault(key, {})
+        state[key_path[-1]] = value
+    for i_layer, state in states.items():
+        model.layers[i_layer].set_state(state)
+    renderer["printer"].render(model, inputs, renderer["savedir"], name)
@@ -1,3 +1,15 @@
+import numpy as np
+
+
+def cast(values, dtype):
+    """
+    Convert an array to a new dtype, passing None through untouched.
+    """
+    if values is None:
+        return None
+    return np.asarray(values).astype(dtype, copy=False)
+
+
 def indent(unindented, n_spaces=2):
     """
     Indent a multi-line string using spaces.
@@ -0,0 +1,35 @@
+from cottonwood.data.memmap_dataset import MemmapDataset
+
+
+def get_data_sets(training_path, evaluation_path, chunk_size=None):
+    """
+    This function creates two MemmapDatasets from data stored on disk.
+    One is a training data set and the other, an evaluation set.
+    The training set goes through the examples in shuffled chunks.
+    The evaluation set steps through all of them in a fixed order.
+
+    Each path is either a .npy file or a directory of .npy shards,
+    with one example for each index along the first axis.
+    To save a data set in shards:
+
+        for i_shard, shard in enumerate(shards):
+            np.save(os.path.join(dirname, f"shard_{i_shard:05d}.npy"), shard)
+
+    To use in a script:
+
+        import cottonwood.data.data_loader_memmap as dat
+
+        training_set, evaluation_set = dat.get_data_sets(
+            "data/training", "data/evaluation")
+        new_training_example = next(training_set)
+        new_training_batch = training_set.next_batch(16)
+        new_evaluation_example = next(evaluation_set)
+
+    Examples keep the dtype they were saved with. ANN converts them
+    to its own precision as they come in. That's free when they match.
+    """
+    training_set = MemmapDataset(
+        training_path, order="shuffled", chunk_size=chunk_size)
+    evaluation_set = MemmapDataset(
+        evaluation_path, order="fixed", chunk_size=chunk_size)
+    return training_set, evaluation_set
@@ -1,11 +1,14 @@
 import numpy as np
+from cottonwood.data.dataset import Dataset
 import cottonwood.data.elder_futhark as ef
 
 
-def get_data_sets():
+def get_data_sets(dtype=np.float64):
     """
-    This function creates two other functions that generate data.
-    One generates a training data set and the other, an evaluation set.
+    This function creates two Datasets.
+    One is a training data set and the other, an evaluation set.
+    The training set draws examples at random. The evaluation set
+    steps through all of them in a fixed order.
 
     The examples have the format of a two-dimensional numpy array.
     They can be thought of as a very small (7-pixel by 7-pixel) image.
@@ -17,21 +20,16 @@ def get_data_sets():
 
         import data_loader_nordic_runes as dat
 
-        training_generator, evaluation_grenerator = dat.get_data_sets()
-        new_training_example = training_generator.next()
-        new_evaluation_example = evaluation_generator.next()
+        training_set, evaluation_set = dat.get_data_sets()
+        new_training_example = next(training_set)
+        new_training_batch = training_set.next_batch(16)
+        new_evaluation_example = next(evaluation_set)
+
+    dtype is the floating point precision of the examples.
     """
 
     examples = list(ef.runes.values())
 
-    def training_set():
-        while True:
-            index = np.random.choice(len(examples))
-            yield examples[index]
-
-    def evaluation_set():
-        while True:
-            index = np.random.choice(len(examples))
-            yield examples[index]
-
-    return training_set(), evaluation_set()
+    training_set = Dataset(examples, order="random", dtype=dtype)
+    evaluation_set = Dataset(examples, order="fixed", dtype=dtype)
+    return training_set, evaluation_set
@@ -0,0 +1,139 @@
+import numpy as np
+
+RANDOM = "random"
+SHUFFLED = "shuffled"
+FIXED = "fixed"
+
+
+class GenericDataset(object):
+    """
+    What Dataset and MemmapDataset have in common: checking the order,
+    stepping through the examples epoch by epoch, and acting like
+    a generator that runs forever.
+
+    Each epoch steps through n_blocks blocks of neighboring examples,
+    in the order given by i_order. For a Dataset each block is a single
+    example. For a MemmapDataset it's a chunk.
+    Subclasses fill in next_in_order() and gather().
+    """
+    def __init__(self, n_examples, order, n_blocks):
+        if n_examples == 0:
+            raise ValueError("There are no examples to draw from.")
+        if order not in (RANDOM, SHUFFLED, FIXED):
+            raise ValueError(
+                f"order needs to be one of '{RANDOM}', '{SHUFFLED}',"
+                + f" or '{FIXED}', not '{order}'.")
+        self.n_examples = n_examples
+        self.order = order
+        self.n_blocks = n_blocks
+
+        # The position within the current pass through the blocks
+        self.i_block = 0
+        self.i_epoch = 0
+        self.i_order = None
+
+    def __len__(self):
+        return self.n_examples
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next_batch(1)[0]
+
+    def next_batch(self, n_examples):
+        """
+        Returns an array of shape (n_examples, ...) with
+        one example in each row.
+        """
+        if self.order == RANDOM:
+            return self.gather(
+                np.random.randint(self.n_examples, size=n_examples))
+        return self.next_in_order(n_examples)
+
+    def next_in_order(self, n_examples):
+        """
+        Step through the blocks in i_order, calling start_epoch()
+        each time i_block wraps around to 0.
+        """
+        raise NotImplementedError
+
+    def gather(self, indices):
+        """
+        Collect the examples at these indices into a new array.
+        """
+        raise NotImplementedError
+
+    def start_epoch(self):
+        if self.order == SHUFFLED:
+            self.i_order = np.random.permutation(self.n_blocks)
+        elif self.i_order is None:
+            self.i_order = np.arange(self.n_blocks)
+        self.i_epoch += 1
+
+
+class Dataset(GenericDataset):
+    """
+    A set of examples, all stacked together into one array,
+    that hands them out one at a time or in batches.
+
+    order: str
+        How the examples are drawn.
+        "random": each example is drawn at random from the whole set,
+            with replacement.
+        "shuffled": the examples are shuffled, and then drawn in order,
+            without replacement. Once they've all been drawn,
+            they're shuffled again for the next epoch.
+        "fixed": the examples are drawn in the order they were given,
+            starting over at the beginning after the last one.
+            This is a good choice for evaluation sets.
+
+    To use in a script:
+
+        data_set = Dataset(examples)
+        example = next(data_set)
+        batch = data_set.next_batch(16)
+
+    Like a generator, a Dataset runs forever.
+    """
+    def __init__(self, examples, order=RANDOM, dtype=np.float64):
+        """
+        examples: array or list of arrays
+            Either an array with one example for each index along
+            the first axis, or a list of examples of the same shape.
+        """
+        if len(examples) == 0:
+            raise ValueError("There are no examples to draw from.")
+        self.examples = np.ascontiguousarray(np.stack(examples), dtype=dtype)
+        self.example_shape = self.examples.shape[1:]
+        n_examples = self.examples.shape[0]
+        super().__init__(n_examples, order, n_blocks=n_examples)
+
+    def __str__(self):
+        str_parts = [
+            "data set",
+            f"number of examples: {self.n_examples}",
+            f"example shape: {self.example_shape}",
+            f"order: {self.order}",
+        ]
+        return "\n".join(str_parts)
+
+    def next_in_order(self, n_examples):
+        # Step through the examples, and wrap around to a new epoch
+        # as many times as needed.
+        indices = []
+        n_remaining = n_examples
+        while n_remaining > 0:
+            if self.i_block == 0:
+                self.start_epoch()
+            n_take = min(n_remaining, self.n_examples - self.i_block)
+            indices.append(
+                self.i_order[self.i_block: self.i_block + n_take])
+            self.i_block = (self.i_block + n_take) % self.n_examples
+            n_remaining -= n_take
+        if len(indices) == 0:
+            return self.gather(np.zeros(0, dtype=int))
+        return self.gather(np.concatenate(indices))
+
+    def gather(self, indices):
+        return self.examples[indices]
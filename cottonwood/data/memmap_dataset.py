@@ -0,0 +1,140 @@
+import os
+import numpy as np
+from cottonwood.data.dataset import GenericDataset, SHUFFLED
+
+
+class MemmapDataset(GenericDataset):
+    """
+    A set of examples stored on disk in .npy files, too big to
+    hold in memory all at once. The files are memory-mapped, and the
+    operating system pages in just the parts that get used.
+
+    It has the same interface as Dataset: next() for one example,
+    and next_batch(n_examples) for a batch of them.
+
+    path: str
+        Either a single .npy file, or a directory of .npy files
+        (shards), all holding examples of the same shape and dtype.
+        The first axis of each array runs over the examples.
+        Shards are read in order of their file names.
+    order: str
+        How the examples are drawn.
+        "shuffled": the examples are split into chunks of neighboring
+            examples. Each epoch goes through the chunks in a new
+            random order, and through the examples within each chunk
+            in order. Reading whole chunks keeps disk access sequential.
+        "fixed": the examples are drawn in order, starting over at the
+            beginning after the last one.
+        "random": each example is drawn at random from the whole set,
+            with replacement. This reads from all over the disk,
+            and so it's the slowest.
+    chunk_size: int
+        The number of examples in each chunk. The default is
+        enough examples to fill about a megabyte.
+
+    When all the examples in a batch come from the same chunk,
+    which is most of the time for batches smaller than the chunk,
+    the batch is a read-only view into the file rather than a copy.
+    Examples keep the dtype they were saved with.
+    """
+    def __init__(self, path, order=SHUFFLED, chunk_size=None):
+        if os.path.isdir(path):
+            filenames = sorted(
+                filename for filename in os.listdir(path)
+                if filename.endswith(".npy"))
+            shard_paths = [
+                os.path.join(path, filename) for filename in filenames]
+        else:
+            shard_paths = [path]
+        if len(shard_paths) == 0:
+            raise ValueError(f"There are no .npy files in {path}.")
+
+        self.shards = [
+            np.load(shard_path, mmap_mode="r") for shard_path in shard_paths]
+        self.example_shape = self.shards[0].shape[1:]
+        self.dtype = self.shards[0].dtype
+        for shard_path, shard in zip(shard_paths, self.shards):
+            if shard.shape[1:] != self.example_shape or (
+                shard.dtype != self.dtype
+            ):
+                raise ValueError(
+                    f"The examples in {shard_path} don't have the same"
+                    + " shape and dtype as the ones in " + shard_paths[0])
+        # The index of the first example of each shard,
+        # and the total number of examples at the end.
+        self.shard_starts = np.cumsum(
+            [0] + [shard.shape[0] for shard in self.shards])
+        if self.shard_starts[-1] == 0:
+            raise ValueError(f"There are no examples in {path}.")
+
+        if chunk_size is None:
+            example_bytes = max(
+                1, int(np.prod(self.example_shape)) * self.dtype.itemsize)
+            chunk_size = max(1, 2 ** 20 // example_bytes)
+        self.chunk_size = int(chunk_size)
+        # Each chunk is (i_shard, i_start, i_stop). They never
+        # cross from one shard into the next.
+        self.chunks = []
+        for i_shard, shard in enumerate(self.shards):
+            for i_start in range(0, shard.shape[0], self.chunk_size):
+                self.chunks.append((
+                    i_shard,
+                    i_start,
+                    min(shard.shape[0], i_start + self.chunk_size)))
+
+        super().__init__(
+            int(self.shard_starts[-1]), order, n_blocks=len(self.chunks))
+        # The position within the current chunk
+        self.i_next = 0
+
+    def __str__(self):
+        str_parts = [
+            "memory-mapped data set",
+            f"number of examples: {self.n_examples}",
+            f"number of shards: {len(self.shards)}",
+            f"example shape: {self.example_shape}",
+            f"order: {self.order}",
+            f"chunk size: {self.chunk_size}",
+        ]
+        return "\n".join(str_parts)
+
+    def next_in_order(self, n_examples):
+        # Step through the chunks, wrapping around to a new epoch
+        # as many times as needed.
+        pieces = []
+        n_remaining = n_examples
+        while n_remaining > 0:
+            if self.i_block == 0 and self.i_next == 0:
+                self.start_epoch()
+            i_shard, i_start, i_stop = self.chunks[
+                self.i_order[self.i_block]]
+            n_take = min(n_remaining, i_stop - i_start - self.i_next)
+            i_first = i_start + self.i_next
+            pieces.append(self.shards[i_shard][i_first: i_first + n_take])
+            n_remaining -= n_take
+
+            self.i_next += n_take
+            if i_start + self.i_next == i_stop:
+                self.i_next = 0
+                self.i_block = (self.i_block + 1) % self.n_blocks
+
+        if len(pieces) == 1:
+            return pieces[0]
+        if len(pieces) == 0:
+            return np.zeros((0,) + self.example_shape, dtype=self.dtype)
+        return np.concatenate(pieces)
+
+    def gather(self, indices):
+        """
+        Collect examples from anywhere in the data set into a new array.
+        """
+        batch = np.zeros((indices.size,) + self.example_shape, self.dtype)
+        i_shards = np.searchsorted(
+            self.shard_starts, indices, side="right") - 1
+        for i_shard in np.unique(i_shards):
+            in_shard = np.where(i_shards == i_shard)[0]
+            # Reading in sorted order is easier on the disk.
+            in_shard = in_shard[np.argsort(indices[in_shard])]
+            batch[in_shard] = self.shards[i_shard][
+                indices[in_shard] - self.shard_starts[i_shard]]
+        return batch
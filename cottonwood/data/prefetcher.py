@@ -0,0 +1,238 @@
+"""
+Prepare batches of examples in the background, while the model trains.
+
+To use in a script:
+
+    training_set = Prefetcher(training_set, batch_size=model.batch_size)
+    model.train(training_set)
+    training_set.close()
+
+or, to have it closed automatically,
+
+    with Prefetcher(training_set, batch_size=model.batch_size) as prefetcher:
+        model.train(prefetcher)
+
+Any data set works, whether it's a Dataset, a MemmapDataset,
+or a plain generator of single examples. A worker pulls batches
+from it and puts them in a queue, up to depth batches ahead.
+If the data set raises an error, it's raised again in the trainer
+at the next call to next_batch().
+
+The worker can be a thread or a separate process. A thread is
+lighter, and is plenty when the data set spends its time in numpy
+or reading from disk. A process gets around Python's global
+interpreter lock for data sets that do a lot of work in Python,
+but the data set has to be picklable, so generators won't work.
+
+Both the model and a threaded worker draw from numpy's global random
+number generator. They take turns in an unpredictable order,
+so runs with dropout won't be exactly reproducible.
+A worker process gets its own random seed, drawn from the parent's.
+"""
+import multiprocessing as mp
+import queue
+import threading
+import traceback
+import numpy as np
+
+# Markers that the worker puts in the queue in place of a batch
+DONE = "done"
+ERROR = "error"
+
+
+class Prefetcher(object):
+    def __init__(
+        self,
+        data_set,
+        batch_size=16,
+        depth=4,
+        use_process=False,
+        poll_interval=.1,
+    ):
+        """
+        data_set: Dataset, MemmapDataset, or generator
+        batch_size: int
+            How many examples the worker prepares at a time.
+            next_batch() can ask for any number.
+        depth: int
+            The most batches to have ready and waiting.
+        use_process: boolean
+            If True, the worker runs in its own process.
+            Otherwise it runs in a thread.
+        poll_interval: float
+            How often, in seconds, a blocked worker checks whether
+            it's been asked to stop.
+        """
+        self.batch_size = int(batch_size)
+        self.depth = int(depth)
+        self.use_process = use_process
+        self.poll_interval = poll_interval
+        # Examples that have been taken off the queue but not handed out
+        self.pending = None
+        self.i_pending = 0
+        self.finished = False
+
+        if use_process:
+            self.queue = mp.Queue(maxsize=self.depth)
+            self.stop_event = mp.Event()
+            self.worker = mp.Process(
+                target=run_worker,
+                args=(
+                    data_set,
+                    self.batch_size,
+                    self.queue,
+                    self.stop_event,
+                    self.poll_interval,
+                    np.random.randint(2 ** 31),
+                ),
+                daemon=True,
+            )
+        else:
+            self.queue = queue.Queue(maxsize=self.depth)
+            self.stop_event = threading.Event()
+            self.worker = threading.Thread(
+                target=run_worker,
+                args=(
+                    data_set,
+                    self.batch_size,
+                    self.queue,
+                    self.stop_event,
+                    self.poll_interval,
+                ),
+                daemon=True,
+            )
+        self.worker.start()
+
+    def __str__(self):
+        str_parts = [
+            "prefetcher",
+            f"batch size: {self.batch_size}",
+            f"depth: {self.depth}",
+            "worker: " + ("process" if self.use_process else "thread"),
+        ]
+        return "\n".join(str_parts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next_batch(1)[0]
+
+    def next_batch(self, n_examples):
+        """
+        Returns an array of shape (n_examples, ...) with
+        one example in each row.
+        """
+        pieces = []
+        n_remaining = n_examples
+        while n_remaining > 0:
+            if self.pending is None or self.i_pending == len(self.pending):
+                self.pending = self.get_batch()
+                self.i_pending = 0
+            n_take = min(n_remaining, len(self.pending) - self.i_pending)
+            pieces.append(
+                self.pending[self.i_pending: self.i_pending + n_take])
+            self.i_pending += n_take
+            n_remaining -= n_take
+        if len(pieces) == 1:
+            return pieces[0]
+        return np.concatenate(pieces)
+
+    def get_batch(self):
+        if self.finished:
+            raise StopIteration
+        while True:
+            try:
+                batch = self.queue.get(timeout=self.poll_interval)
+                break
+            except queue.Empty:
+                if not self.worker.is_alive():
+                    raise RuntimeError(
+                        "The prefetching worker stopped unexpectedly.")
+
+        if isinstance(batch, tuple):
+            marker, message = batch
+            self.finished = True
+            if marker == ERROR:
+                raise RuntimeError(
+                    "The data set raised an error while prefetching.\n"
+                    + message)
+            raise StopIteration
+        return batch
+
+    def close(self):
+        """
+        Stop the worker and wait for it to finish.
+        """
+        self.stop_event.set()
+        # Clear out the queue, in case the worker is waiting for room.
+        while self.worker.is_alive():
+            try:
+                self.queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                pass
+        self.worker.join()
+        self.finished = True
+
+
+def run_worker(
+    data_set,
+    batch_size,
+    batch_queue,
+    stop_event,
+    poll_interval,
+    seed=None,
+):
+    """
+    Keep the queue full of batches until told to stop.
+    """
+    if seed is not None:
+        np.random.seed(seed)
+    try:
+        while not stop_event.is_set():
+            try:
+                batch = make_batch(data_set, batch_size)
+            except StopIteration:
+                put(batch_queue, (DONE, ""), stop_event, poll_interval)
+                return
+            put(batch_queue, batch, stop_event, poll_interval)
+    except Exception:
+        put(
+            batch_queue,
+            (ERROR, traceback.format_exc()),
+            stop_event,
+            poll_interval)
+
+
+def make_batch(data_set, batch_size):
+    if hasattr(data_set, "next_batch"):
+        return data_set.next_batch(batch_size)
+    # A generator may run out partway through a batch.
+    # Hand out what there is, and stop next time.
+    examples = []
+    for _ in range(batch_size):
+        try:
+            examples.append(next(data_set))
+        except StopIteration:
+            if len(examples) == 0:
+                raise
+            break
+    return np.stack(examples)
+
+
+def put(batch_queue, item, stop_event, poll_interval):
+    """
+    Wait for room in the queue, but give up if told to stop.
+    """
+    while not stop_event.is_set():
+        try:
+            batch_queue.put(item, timeout=poll_interval)
+            return
+        except queue.Full:
+            pass
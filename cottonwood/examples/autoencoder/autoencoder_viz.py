@@ -3,8 +3,12 @@ Generate an autoencoder neural network visualization
 """
 import os
 import numpy as np
-import matplotlib.pyplot as plt
-plt.switch_backend("agg")
+# Use matplotlib's object-oriented interface rather than pyplot,
+# so that the figure can be kept and reused from one render to the next.
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgb
+from matplotlib.figure import Figure
 
 
 class Printer(object):
@@ -42,37 +46,67 @@ class Printer(object):
         self.error_gap_scale = 0.3
         self.between_layer_scale = 0.8
         self.between_node_scale = 0.4
+        # The number of points in each connection curve
+        self.n_curve_points = 50
+
+        # The figure, with all its images and connections in place,
+        # gets built once for each network architecture and then reused.
+        # Later renders only update the image data and
+        # the connection colors and widths.
+        self.n_nodes = None
+        self.fig = None
+
+    def __getstate__(self):
+        # Leave the figure behind. It gets rebuilt on the next render().
+        state = self.__dict__.copy()
+        state["n_nodes"] = None
+        state["fig"] = None
+        return state
 
     def render(self, nn, inputs, savedir=".", name=""):
         """
         Build a visualization of an image autoencoder neural network,
         piece by piece.
         """
-        fig, ax_boss = self.create_background()
+        # inputs is a single example, no matter its shape.
+        inputs = np.ravel(inputs)
+        if self.fig is None or self.find_n_nodes(nn) != self.n_nodes:
+            self.build_template(nn)
+        self.update_images(nn, inputs)
+        self.update_connections(nn)
+        self.save_nn_viz(self.fig, savedir, name)
+
+    def build_template(self, nn):
+        """
+        Lay out the figure and create everything in it.
+        """
+        self.fig, ax_boss = self.create_background()
         self.find_nn_size(nn)
         self.find_node_image_size()
         self.find_between_layer_gap()
         self.find_between_node_gap()
         self.find_error_image_position()
 
+        # image_axes holds a list of Axes for each column of images,
+        # and self.images the matching AxesImages.
         image_axes = []
-        self.add_input_image(fig, image_axes, nn, inputs)
+        self.images = []
+        self.add_input_image(self.fig, image_axes)
         for i_viz_layer in range(self.n_viz_layers):
-            self.add_node_images(fig, i_viz_layer, image_axes, nn, inputs)
-        self.add_output_image(fig, image_axes, nn, inputs)
-        self.add_error_image(fig, image_axes, nn, inputs)
+            self.add_node_images(self.fig, i_viz_layer, image_axes)
+        self.add_output_image(self.fig, image_axes)
+        self.add_error_image(self.fig, image_axes)
         self.add_layer_connections(ax_boss, image_axes, nn)
-        self.save_nn_viz(fig, savedir, name)
-        plt.close()
 
     def create_background(self):
-        fig = plt.figure(
+        fig = Figure(
             edgecolor=self.tan,
             facecolor=self.black,
             # facecolor=self.green,
             figsize=(self.figure_width, self.figure_height),
             linewidth=4,
         )
+        FigureCanvasAgg(fig)
         ax_boss = fig.add_axes((0, 0, 1, 1), facecolor="none")
         ax_boss.set_xlim(0, 1)
         ax_boss.set_ylim(0, 1)
@@ -89,13 +123,20 @@ class Printer(object):
         self.input_image_width = self.input_image_height * self.aspect_ratio
 
         # The network as a whole
-        self.n_nodes = []
-        for layer in nn.layers[self.i_dense_layer_offset: -1]:
-            self.n_nodes.append(layer.m_inputs)
-        self.n_nodes.append(layer.n_outputs)
+        self.n_nodes = self.find_n_nodes(nn)
         self.n_viz_layers = len(self.n_nodes)
         self.max_nodes = np.max(self.n_nodes)
 
+    def find_n_nodes(self, nn):
+        """
+        How many nodes are there in each column of node images?
+        """
+        n_nodes = []
+        for layer in nn.layers[self.i_dense_layer_offset: -1]:
+            n_nodes.append(layer.m_inputs)
+        n_nodes.append(layer.n_outputs)
+        return n_nodes
+
     def find_node_image_size(self):
         """
         What should the height and width of each node image be?
@@ -216,36 +257,24 @@ class Printer(object):
             - self.error_image_width / 2
         )
 
-    def add_input_image(self, fig, image_axes, nn, inputs):
+    def add_input_image(self, fig, image_axes):
         """
         All Axes to be added use the rectangle specification
             (left, bottom, width, height)
         """
-        normalized_inputs = nn.forward_pass(inputs, i_stop_layer=1)
-        input_image = normalized_inputs.reshape(
-                self.n_image_rows, self.n_image_cols)
         absolute_pos = (
             self.left_border,
             self.input_image_bottom,
             self.input_image_width,
             self.input_image_height)
         ax_input = self.add_image_axes(fig, image_axes, absolute_pos)
-        ax_input.imshow(
-            input_image,
-            vmin=self.im_vmin,
-            vmax=self.im_vmax,
-            cmap=self.cmap,
-            zorder=6,
-        )
+        self.images.append([self.add_image(ax_input, self.cmap)])
         image_axes.append([ax_input])
 
-    def add_node_images(self, fig, i_viz_layer, image_axes, nn, inputs):
+    def add_node_images(self, fig, i_viz_layer, image_axes):
         """
         Add in all the node images for a single layer
         """
-        i_dense_layer = i_viz_layer + self.i_dense_layer_offset
-        node_activities = nn.forward_pass(
-            inputs, i_stop_layer=i_dense_layer)
         node_image_left = (
             self.left_border
             + self.input_image_width
@@ -259,19 +288,8 @@ class Printer(object):
         )
         layer_bottom = (self.figure_height - total_layer_height) / 2
         layer_axes = []
+        layer_images = []
         for i_node in range(n_nodes):
-            node_signal = np.zeros((1, n_nodes))
-            node_signal[0, i_node] = 1
-            node_signature = nn.forward_pass(
-                node_signal,
-                i_start_layer=i_dense_layer,
-                i_stop_layer=self.n_viz_layers + self.i_dense_layer_offset - 1,
-            )
-            node_image = node_signature.reshape(
-                self.n_image_rows, self.n_image_cols)
-            # node_image *= node_activities[i_node]
-            node_image *= np.sign(node_activities[i_node])
-
             node_image_bottom = (
                 layer_bottom + i_node * (
                     self.node_image_height + self.between_node_gap))
@@ -282,19 +300,12 @@ class Printer(object):
                 self.node_image_width,
                 self.node_image_height)
             ax = self.add_image_axes(fig, image_axes, absolute_pos)
-            ax.imshow(
-                node_image,
-                vmin=self.im_vmin,
-                vmax=self.im_vmax,
-                cmap=self.cmap,
-                zorder=6,
-            )
+            layer_images.append(self.add_image(ax, self.cmap))
             layer_axes.append(ax)
+        self.images.append(layer_images)
         image_axes.append(layer_axes)
 
-    def add_output_image(self, fig, image_axes, nn, inputs):
-        outputs = nn.forward_pass(inputs, i_stop_layer=len(nn.layers) - 1)
-        output_image = outputs.reshape(self.n_image_rows, self.n_image_cols)
+    def add_output_image(self, fig, image_axes):
         output_image_left = (
             self.figure_width
             - self.input_image_width
@@ -306,32 +317,64 @@ class Printer(object):
             self.input_image_width,
             self.input_image_height)
         ax_output = self.add_image_axes(fig, image_axes, absolute_pos)
-        ax_output.imshow(
-            output_image,
-            vmin=self.im_vmin,
-            vmax=self.im_vmax,
-            cmap=self.cmap,
-            zorder=6,
-        )
+        self.images.append([self.add_image(ax_output, self.cmap)])
         image_axes.append([ax_output])
 
-    def add_error_image(self, fig, image_axes, nn, inputs):
-        outputs = nn.forward_pass(inputs)
-        error_image = outputs.reshape(self.n_image_rows, self.n_image_cols)
+    def add_error_image(self, fig, image_axes):
         absolute_pos = (
             self.error_image_left,
             self.error_image_bottom,
             self.error_image_width,
             self.error_image_height)
         ax_error = self.add_image_axes(fig, image_axes, absolute_pos)
-        ax_error.imshow(
-            error_image,
+        # The error image isn't part of the chain of connections,
+        # so it's kept separate from the other images.
+        self.error_image = self.add_image(ax_error, self.error_cmap)
+
+    def add_image(self, ax, cmap):
+        """
+        Start with a blank image. The data gets filled in on each render.
+        """
+        return ax.imshow(
+            np.zeros((self.n_image_rows, self.n_image_cols)),
             vmin=self.im_vmin,
             vmax=self.im_vmax,
-            cmap=self.error_cmap,
+            cmap=cmap,
             zorder=6,
         )
 
+    def update_images(self, nn, inputs):
+        """
+        Fill in the images with what the network does with these inputs.
+        """
+        image_shape = (self.n_image_rows, self.n_image_cols)
+
+        normalized_inputs = nn.probe(inputs, i_stop_layer=1)
+        self.images[0][0].set_data(normalized_inputs.reshape(image_shape))
+
+        for i_viz_layer in range(self.n_viz_layers):
+            i_dense_layer = i_viz_layer + self.i_dense_layer_offset
+            node_activities = nn.probe(inputs, i_stop_layer=i_dense_layer)
+            # Find the signatures of all the nodes in one pass.
+            # Each row of the identity matrix activates just one node.
+            node_signatures = nn.probe(
+                np.eye(self.n_nodes[i_viz_layer]),
+                i_start_layer=i_dense_layer,
+                i_stop_layer=(
+                    self.n_viz_layers + self.i_dense_layer_offset - 1),
+            )
+            # node_signatures *= node_activities[:, np.newaxis]
+            node_signatures = (
+                node_signatures * np.sign(node_activities)[:, np.newaxis])
+            for i_node, image in enumerate(self.images[i_viz_layer + 1]):
+                image.set_data(node_signatures[i_node].reshape(image_shape))
+
+        outputs = nn.probe(inputs, i_stop_layer=len(nn.layers) - 1)
+        self.images[-1][0].set_data(outputs.reshape(image_shape))
+
+        errors = nn.probe(inputs)
+        self.error_image.set_data(errors.reshape(image_shape))
+
     def add_image_axes(self, fig, image_axes, absolute_pos):
         """
         Locate the Axes for the image corresponding to this node
@@ -364,68 +407,92 @@ class Printer(object):
         Add in the connectors between all the layers
         Treat the input image as the first layer and
         the output layer as the last.
+
+        All the connections between one layer and the next are drawn
+        as a single LineCollection. Their shapes are fixed here.
+        Their colors and widths are filled in by update_connections().
         """
+        self.connections = []
+        # Each connection is a half cosine wave, easing from
+        # the start node over to the end node.
+        curve_x = np.linspace(0, 1, num=self.n_curve_points)
+        curve_y = (-np.cos(np.pi * curve_x) + 1) / 2
+
         for i_start_layer in range(len(image_axes) - 1):
-            n_start_nodes = len(image_axes[i_start_layer])
-            n_end_nodes = len(image_axes[i_start_layer + 1])
-            x_start = image_axes[i_start_layer][0].get_position().x1
-            x_end = image_axes[i_start_layer + 1][0].get_position().x0
+            start_axes = image_axes[i_start_layer]
+            end_axes = image_axes[i_start_layer + 1]
+            n_start_nodes = len(start_axes)
+            n_end_nodes = len(end_axes)
+            x_start = start_axes[0].get_position().x1
+            x_end = end_axes[0].get_position().x0
+
+            # The connections fan out from each start node and into each
+            # end node, spread evenly along the side of the image.
+            # Rows are start nodes, columns are end nodes.
+            y_start_min = np.array([
+                ax.get_position().y0 for ax in start_axes])[:, np.newaxis]
+            y_start_max = np.array([
+                ax.get_position().y1 for ax in start_axes])[:, np.newaxis]
+            y_end_min = np.array([
+                ax.get_position().y0 for ax in end_axes])[np.newaxis, :]
+            y_end_max = np.array([
+                ax.get_position().y1 for ax in end_axes])[np.newaxis, :]
+            start_spacing = (y_start_max - y_start_min) / (n_end_nodes + 1)
+            end_spacing = (y_end_max - y_end_min) / (n_start_nodes + 1)
+            i_end = np.arange(n_end_nodes)[np.newaxis, :]
+            i_start = np.arange(n_start_nodes)[:, np.newaxis]
+            y_start = (y_start_min + start_spacing * (i_end + 1)).ravel()
+            y_end = (y_end_min + end_spacing * (i_start + 1)).ravel()
+
+            # segments has shape (n_connections, n_curve_points, 2)
+            segments = np.zeros((y_start.size, self.n_curve_points, 2))
+            segments[:, :, 0] = x_start + (x_end - x_start) * curve_x
+            segments[:, :, 1] = (
+                y_start[:, np.newaxis]
+                + (y_end - y_start)[:, np.newaxis] * curve_y)
+
+            collection = LineCollection(segments)
+            ax_boss.add_collection(collection)
 
             i_layer = i_start_layer + self.i_dense_layer_offset - 1
-
             # For Dense layers that have weights, pull those weights
             # out for drawing connections.
+            # Other connections get a constant weight.
             if i_layer > 0 and i_layer < len(nn.layers) - 1:
-                weights = nn.layers[i_layer].weights
+                self.connections.append((collection, i_layer))
             else:
-                weights = None
-
-            for i_start_ax, ax_start in enumerate(image_axes[i_start_layer]):
-                ax_start_pos = ax_start.get_position()
-                y_start_min = ax_start_pos.y0
-                y_start_max = ax_start_pos.y1
-                start_spacing = (y_start_max - y_start_min) / (n_end_nodes + 1)
-
-                for i_end_ax, ax_end in enumerate(
-                    image_axes[i_start_layer + 1]
-                ):
-                    ax_end_pos = ax_end.get_position()
-                    y_end_min = ax_end_pos.y0
-                    y_end_max = ax_end_pos.y1
-                    end_spacing = (y_end_max - y_end_min) / (n_start_nodes + 1)
-
-                    # Spread out y_start and y_end a bit
-                    y_start = y_start_min + start_spacing * (i_end_ax + 1)
-                    y_end = y_end_min + end_spacing * (i_start_ax + 1)
-
-                    if weights is not None:
-                        weight = weights[i_start_ax, i_end_ax]
-                    else:
-                        weight = .5
-                    self.plot_connection(
-                        ax_boss, x_start, x_end, y_start, y_end, weight)
-
-    def plot_connection(self, ax_boss, x0, x1, y0, y1, weight=1):
+                self.connections.append((collection, None))
+                self.set_connection_weights(
+                    collection, np.full(y_start.size, .5))
+
+    def update_connections(self, nn):
+        for collection, i_layer in self.connections:
+            if i_layer is not None:
+                n_start_nodes, n_end_nodes = self.n_nodes[
+                    i_layer - self.i_dense_layer_offset:
+                    i_layer - self.i_dense_layer_offset + 2]
+                weights = nn.layers[i_layer].weights
+                self.set_connection_weights(
+                    collection,
+                    weights[:n_start_nodes, :n_end_nodes].ravel())
+
+    def set_connection_weights(self, collection, weights):
         """
         Represent the weights connecting nodes in one layer
         to nodes in the next.
+        Positive weights are tan and negative weights are blue.
+        The stronger the weight, the wider and more opaque the line.
         """
-        # weight = np.random.sample() * 2 - 1
-        x = np.linspace(x0, x1, num=50)
-        y = y0 + (y1 - y0) * (
-            -np.cos(
-                np.pi * (x - x0) / (x1 - x0)
-            ) + 1) / 2
-        if weight > 0:
-            conn_color = self.tan
-        else:
-            conn_color = self.blue
         # Limit the magnitude of weights to be 1 or less.
-        if weight > 1:
-            weight = 1
-        if weight < -1:
-            weight = -1
-        ax_boss.plot(x, y, color=conn_color, linewidth=weight, alpha=weight)
+        strength = np.minimum(np.abs(weights), 1)
+        colors = np.zeros((weights.size, 4))
+        colors[:, :3] = np.where(
+            weights[:, np.newaxis] > 0,
+            to_rgb(self.tan),
+            to_rgb(self.blue))
+        colors[:, 3] = strength
+        collection.set_color(colors)
+        collection.set_linewidth(strength)
 
     def save_nn_viz(self, fig, savedir, postfix="0"):
         """
@@ -0,0 +1,23 @@
+"""
+Render the visualizations recorded in a snapshot log,
+spread across all the CPUs.
+
+    python3 -m cottonwood.examples.autoencoder.render_snapshots \
+        reports/<run_dir>/snapshots.log [n_processes]
+
+The images go in the same directory as the log.
+"""
+import sys
+from cottonwood.core.snapshots import render_snapshots
+
+
+def run(log_path, n_processes=None):
+    n_rendered = render_snapshots(log_path, n_processes=n_processes)
+    print(f"Rendered {n_rendered} snapshots from {log_path}")
+
+
+if __name__ == "__main__":
+    n_processes = None
+    if len(sys.argv) > 2:
+        n_processes = int(sys.argv[2])
+    run(sys.argv[1], n_processes=n_processes)
@@ -10,6 +10,7 @@ from cottonwood.core.layers.range_normalization import RangeNormalization
 from cottonwood.core.layers.difference import Difference
 from cottonwood.core.optimizers import Momentum
 from cottonwood.core.regularization import L1, Limit
+from cottonwood.core.snapshots import SnapshotRecorder, render_snapshots
 from cottonwood.examples.autoencoder.autoencoder_viz import Printer
 from cottonwood.experimental.initializers import Uniform
 
@@ -18,9 +19,37 @@ def run():
     training_set, evaluation_set = dat.get_data_sets()
 
     sample = next(training_set)
-    n_pixels = np.prod(sample.shape)
-    printer = Printer(input_shape=sample.shape)
+    # Record snapshots during the run, and render them all at the end.
+    recorder = SnapshotRecorder(Printer(input_shape=sample.shape))
+    autoencoder = build_autoencoder(training_set, printer=recorder)
 
+    msg = """
+
+Running autoencoder demo
+    on Nordic Runes data set.
+    Find performance history plots,
+    model parameter report,
+    and neural network visualizations
+    in the {} directory.
+
+""".format(autoencoder.reports_path)
+
+    print(msg)
+
+    autoencoder.train(training_set)
+    autoencoder.evaluate(evaluation_set)
+
+    recorder.close()
+    if recorder.log_path is not None:
+        render_snapshots(recorder.log_path)
+
+
+def build_autoencoder(training_set, **ann_kwargs):
+    """
+    Put together the autoencoder used in the demo.
+    Any keyword arguments are passed along to the ANN.
+    """
+    n_pixels = int(np.prod(training_set.example_shape))
     N_NODES = [24]
     n_nodes = N_NODES + [n_pixels]
     layers = []
@@ -43,24 +72,8 @@ def run():
 
     layers.append(Difference(layers[-1], layers[0]))
 
-    autoencoder = ANN(
+    return ANN(
         layers=layers,
         error_function=Sqr,
-        printer=printer,
+        **ann_kwargs,
     )
-
-    msg = """
-
-Running autoencoder demo
-    on Nordic Runes data set.
-    Find performance history plots,
-    model parameter report,
-    and neural network visualizations
-    in the {} directory.
-
-""".format(autoencoder.reports_path)
-
-    print(msg)
-
-    autoencoder.train(training_set)
-    autoencoder.evaluate(evaluation_set)
@@ -11,12 +11,12 @@ class Uniform(object):
     def __str__(self):
         return f"Uniform distribution on [{-self.scale}, {self.scale}]"
 
-    def initialize(self, n_rows, n_cols):
+    def initialize(self, n_rows, n_cols, dtype=np.float64):
         return np.random.uniform(
             low=-self.scale,
             high=self.scale,
             size=(n_rows, n_cols),
-        )
+        ).astype(dtype, copy=False)
 
 
 class Skinny(object):
@@ -29,7 +29,7 @@ class Skinny(object):
         return "Skinny"
 
     @staticmethod
-    def initialize(n_rows, n_cols):
+    def initialize(n_rows, n_cols, dtype=np.float64):
         limit = 6 / n_rows
         weights = np.random.uniform(
             low=-limit,
@@ -37,7 +37,7 @@ class Skinny(object):
             size=(n_rows, n_cols),
         )
         weights = np.sign(weights) * np.sqrt(np.abs(weights))
-        return weights
+        return weights.astype(dtype, copy=False)
 
 
 class Trimodal(object):
@@ -50,7 +50,7 @@ class Trimodal(object):
         return "Trimodal"
 
     @staticmethod
-    def initialize(n_rows, n_cols):
+    def initialize(n_rows, n_cols, dtype=np.float64):
         # What fraction of weights are close to a magnitude of 1
         p_large = np.minimum(4 / n_rows, 1)
         sigma = np.sqrt(2 / (n_rows + n_cols))
@@ -61,6 +61,6 @@ class Trimodal(object):
         mu_sign = np.random.choice([1, -1], size=n_large)
         weights[i_large] += mu_sign
 
-        return weights
+        return weights.astype(dtype, copy=False)
 
 
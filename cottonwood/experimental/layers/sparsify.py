@@ -1,17 +1,28 @@
 import numpy as np
+from cottonwood.core.inference import Passthrough
 from cottonwood.core.layers.generic_layer import GenericLayer
 
 
 class Sparsify(GenericLayer):
     """
     Ensure that only a few nodes have a nonzero output.
+    For each example, the n_active nodes with the largest magnitude
+    pass their values through, and the rest are set to zero.
     """
     def __init__(
         self,
         n_nodes,
         n_active_nodes=None,
         previous_layer=None,
+        display_weights=False,
     ):
+        """
+        display_weights: boolean
+            The weights array is just for show here, but it's
+            really helpful when it comes time to visualize the whole
+            network. If True, keep a diagonal weights array that shows
+            which nodes were active for the last example in each batch.
+        """
         self.previous_layer = previous_layer
         self.m_inputs = n_nodes
         self.n_outputs = n_nodes
@@ -20,9 +31,9 @@ class Sparsify(GenericLayer):
         else:
             self.n_active = int(n_active_nodes)
 
-        # The weights array is just for show here, but it's
-        # really helpful when it comes time to visualize the while network.
-        self.weights = np.zeros((self.m_inputs, self.n_outputs))
+        self.display_weights = display_weights
+        if self.display_weights:
+            self.weights = np.zeros((self.m_inputs, self.n_outputs))
 
         # Sensitivity helps rarely active nodes to be more malleable.
         # It helps transform them into something more useful.
@@ -41,13 +52,28 @@ class Sparsify(GenericLayer):
         ]
         return "\n".join(str_parts)
 
-    def reset(self):
-        self.x = np.zeros((1, self.m_inputs))
-        self.y = np.zeros((1, self.n_outputs))
-        self.de_dx = np.zeros((1, self.m_inputs))
-        self.de_dy = np.zeros((1, self.n_outputs))
-        # Reset the active connections
-        self.weights[np.diag_indices(self.m_inputs)] = 0
+    def reset(self, n_examples=1, reuse_buffers=False):
+        if reuse_buffers and self.x.shape[0] == n_examples:
+            self.x.fill(0)
+            self.y.fill(0)
+            self.de_dy.fill(0)
+            return
+
+        self.x = np.zeros((n_examples, self.m_inputs), dtype=self.dtype)
+        self.y = np.zeros((n_examples, self.n_outputs), dtype=self.dtype)
+        self.de_dx = np.zeros((n_examples, self.m_inputs), dtype=self.dtype)
+        self.de_dy = np.zeros((n_examples, self.n_outputs), dtype=self.dtype)
+        # True for each node that's active for each example
+        self.active = np.zeros((n_examples, self.m_inputs), dtype=bool)
+
+    def get_state(self):
+        return {"sensitivity": self.sensitivity}
+
+    def set_state(self, state):
+        self.sensitivity = state["sensitivity"]
+
+    def freeze(self):
+        return FrozenSparsify(self.n_active)
 
     def forward_pass(self, evaluating=False, **kwargs):
         if self.previous_layer is not None:
@@ -55,27 +81,68 @@ class Sparsify(GenericLayer):
 
         # Find which nodes are active on this pass.
         # They will be the ones with the highest activation.
-        i_sort = np.argsort(np.abs(self.x.ravel()))
-        i_active = i_sort[-self.n_active:]
+        # argpartition finds them without sorting the whole row.
+        self.i_active = np.argpartition(
+            np.abs(self.x), -self.n_active, axis=1)[:, -self.n_active:]
+        self.active.fill(False)
+        np.put_along_axis(self.active, self.i_active, True, axis=1)
 
         # Only propogate the active nodes' activities forward.
-        self.weights[self.i_active, self.i_active] = 1
-        self.y = np.zeros((1, self.n_outputs))
-        self.y[:, self.i_active] = self.x[:, self.i_active]
+        np.multiply(self.x, self.active, out=self.y)
+
+        if self.display_weights:
+            np.fill_diagonal(self.weights, self.active[-1])
+
+        if not evaluating:
+            self.update_sensitivity()
+
+    def update_sensitivity(self):
+        """
+        Sensitivity gradually approaches s_max, until a node is active.
+        Then it resets to s_min.
 
-        # Update the sensitivity for each node.
-        # Sensitivity gradually approaches s_max, until a node is active.
-        # Then it resets to s_min.
-        self.sensitivity += (self.s_max - self.sensitivity) / self.s_time_const
-        self.sensitivity[self.i_active] = self.s_min
+        Each example in the batch counts as one step. After n steps,
+        the distance left to s_max has shrunk by a factor of
+        (1 - 1 / s_time_const) ** n.
+        """
+        n_examples = self.active.shape[0]
+        decay = 1 - 1 / self.s_time_const
+        was_active = np.any(self.active, axis=0)
+        # How many steps since each node was last active?
+        # For nodes that weren't active at all, this is meaningless,
+        # and gets replaced below.
+        n_since_active = np.argmax(self.active[::-1], axis=0)
 
-    def backward_pass(self):
+        from_active = self.s_max - (self.s_max - self.s_min) * (
+            decay ** n_since_active)
+        from_previous = self.s_max - (self.s_max - self.sensitivity) * (
+            decay ** n_examples)
+        self.sensitivity = np.where(was_active, from_active, from_previous)
+
+    def backward_pass(self, **kwargs):
         # Only propogate the active nodes' gradients backward.
-        self.de_dx = np.zeros((1, self.m_inputs))
-        self.de_dx[:, self.i_active] = self.de_dy[:, self.i_active]
+        np.multiply(self.de_dy, self.active, out=self.de_dx)
 
         # Ensure that adjustments to nodes that are rarely active
-        # will be amplified. 
+        # will be amplified.
         self.de_dx *= self.sensitivity
         if self.previous_layer is not None:
             self.previous_layer.de_dy += self.de_dx
+
+
+class FrozenSparsify(object):
+    def __init__(self, n_active):
+        self.n_active = n_active
+
+    def __str__(self):
+        return f"sparsify, {self.n_active} active nodes"
+
+    def calc(self, *inputs):
+        # Keep the n_active inputs with the largest magnitude in each row,
+        # and zero out the rest.
+        x = Passthrough.calc(*inputs)
+        i_inactive = np.argpartition(
+            np.abs(x), -self.n_active, axis=1)[:, :-self.n_active]
+        y = x.copy()
+        np.put_along_axis(y, i_inactive, 0, axis=1)
+        return y
@@ -1,5 +1,5 @@
 import numpy as np
-from core.optimizers import GenericOptimizer
+from cottonwood.core.optimizers import GenericOptimizer
 
 
 class NoisyMomentum(GenericOptimizer):
@@ -21,6 +21,15 @@ class NoisyMomentum(GenericOptimizer):
         ]
         return "\n".join(str_parts)
 
+    def get_state(self):
+        state = super().get_state()
+        state["previous_adjustment"] = self.previous_adjustment
+        return state
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.previous_adjustment = state["previous_adjustment"]
+
     def update(self, layer):
         de_dw_batch = self.update_minibatch(layer)
         if de_dw_batch is None: